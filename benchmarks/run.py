@@ -0,0 +1,460 @@
+"""Time the simulation on synthetic crowds without Blender.
+
+    python benchmarks/run.py --agents 1000 10000 --frames 5 --output out.json
+
+Blender's bpy, mathutils and bmesh modules are replaced by the small stand ins
+in benchmarks/stubs so the add-on's simulation code runs unchanged in a normal
+Python interpreter. Each brain is run on a crowd of each size and the results
+are written as JSON: frames per second, the time spent in each channel and the
+peak memory allocated by Python (measured in a separate run with tracemalloc
+since tracing slows everything down).
+"""
+
+import argparse
+import ast
+import json
+import math
+import os
+import platform
+import random
+import signal
+import sys
+import time
+import tracemalloc
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(HERE, "stubs"))
+
+import bpy  # noqa: E402 - the stub from benchmarks/stubs
+import numpy  # noqa: E402
+
+# Import the add-on as a package without running its register code
+_package = types.ModuleType("crowdmaster")
+_package.__path__ = [ROOT]
+sys.modules["crowdmaster"] = _package
+
+from crowdmaster import cm_nodeFunctions  # noqa: E402
+from crowdmaster.cm_simulate import Simulation  # noqa: E402
+from crowdmaster.libs.ins_assignment import assign, costOf  # noqa: E402
+from crowdmaster.libs.ins_clustering import matchGroups  # noqa: E402
+
+SPACING = 2.0
+"""Distance between neighbouring agents when they are placed"""
+
+
+# ==== Brains ====
+
+class Socket:
+    def __init__(self):
+        self.links = []
+        self.is_linked = False
+
+
+class Link:
+    def __init__(self, fromNode, toNode):
+        self.from_node = fromNode
+        self.to_node = toNode
+
+
+class Node:
+    """The parts of a CrowdMaster node that compileBrain looks at"""
+    def __init__(self, name, idname, settings):
+        self.name = name
+        self.bl_idname = idname
+        self.settings = settings
+        self.inputs = {"Input": Socket(), "Value": Socket()}
+        self.outputs = {"Output": Socket(), "Dependant": Socket(),
+                        "To": Socket()}
+
+    def getSettings(self, item):
+        item.settings.update(self.settings)
+
+
+class NodeTree:
+    bl_idname = "CrowdMasterTreeType"
+
+    def __init__(self, name):
+        self.name = name
+        self.nodes = []
+
+    def node(self, name, idname, inputs=(), **settings):
+        node = Node(name, idname, settings)
+        for inp in inputs:
+            link = Link(inp, node)
+            node.inputs["Input"].links.append(link)
+            inp.outputs["Output"].links.append(link)
+            inp.outputs["Output"].is_linked = True
+        self.nodes.append(node)
+        return node
+
+    def input(self, name, inputs=(), **settings):
+        return self.node(name, "NewInputNode", inputs, **settings)
+
+    def output(self, name, output, inputs):
+        return self.node(name, "OutputNode", inputs, Output=output,
+                         MultiInputType="AVERAGE")
+
+
+def flockingBrain(tree):
+    """Separation, cohesion and alignment with the agents that can be heard"""
+    hear = tree.input("Hear", InputSource="SOUND", SoundFrequency="A",
+                      SoundMode="BASIC", SoundOptions="DIST",
+                      SoundAggregate=False, SoundAccuracy=0.5)
+    separate = tree.input("Separate", [hear], InputSource="CROWD",
+                          Flocking="SEPARATE", TranslationAxis="TX")
+    cohere = tree.input("Cohere", [hear], InputSource="CROWD",
+                        Flocking="COHERE", TranslationAxis="TY")
+    align = tree.input("Align", [hear], InputSource="CROWD",
+                       Flocking="ALIGN", RotationAxis="RZ")
+    forward = tree.input("Forward", InputSource="CONSTANT", Constant=0.1)
+    tree.output("Px", "px", [separate])
+    tree.output("Py", "py", [cohere, forward])
+    tree.output("Rz", "rz", [align])
+
+
+def soundBrain(tree):
+    """Steer away from the agents that are on a collision course"""
+    steer = tree.input("Steer", InputSource="SOUND", SoundFrequency="A",
+                       SoundMode="STEERING", SoundOptions="RZ")
+    forward = tree.input("Forward", InputSource="CONSTANT", Constant=0.1)
+    tree.output("Rz", "rz", [steer])
+    tree.output("Py", "py", [forward])
+
+
+def pathBrain(tree):
+    """Follow a network of roads"""
+    path = tree.input("Path", InputSource="PATH", PathName="Roads",
+                      PathOptions="RZ")
+    forward = tree.input("Forward", InputSource="CONSTANT", Constant=0.1)
+    tree.output("Rz", "rz", [path])
+    tree.output("Py", "py", [forward])
+
+
+def formationBrain(tree):
+    """Walk to a place in a formation"""
+    turn = tree.input("Turn", InputSource="FORMATION",
+                      FormationGroup="Formation", FormationOptions="RZ")
+    dist = tree.input("Dist", InputSource="FORMATION",
+                      FormationGroup="Formation", FormationOptions="DIST")
+    tree.output("Rz", "rz", [turn])
+    tree.output("Py", "py", [dist])
+
+
+# ==== Scenes ====
+
+def crowdSize(agents):
+    """The length of the side of the square the crowd is placed in"""
+    return math.ceil(math.sqrt(agents)) * SPACING
+
+
+def addCrowd(agents, rng):
+    """Place the agents on a jittered grid facing random directions"""
+    side = int(math.ceil(math.sqrt(agents)))
+    names = []
+    for i in range(agents):
+        x = (i % side + rng.uniform(-0.25, 0.25)) * SPACING
+        y = (i // side + rng.uniform(-0.25, 0.25)) * SPACING
+        name = "Agent.%06d" % i
+        bpy.context.scene.objects.append(
+            bpy.Object(name, location=(x, y, 0),
+                       rotation=(0, 0, rng.uniform(0, 2 * math.pi)),
+                       dimensions=(0.5, 0.5, 1.8)))
+        names.append(name)
+    return names
+
+
+def roadScene(agents, rng):
+    """A grid of roads across the crowd"""
+    steps = int(crowdSize(agents) // SPACING) + 1
+    index = {}
+    edges = []
+
+    def vertex(i, j):
+        return index.setdefault((i * SPACING, j * SPACING, 0), len(index))
+
+    for line in range(0, steps, 10):
+        for s in range(steps - 1):
+            edges.append((vertex(s, line), vertex(s + 1, line)))
+            edges.append((vertex(line, s), vertex(line, s + 1)))
+    vertices = sorted(index, key=index.get)
+    mesh = bpy.Mesh("Roads", vertices, edges)
+    bpy.context.scene.objects.append(bpy.Object("Roads", data=mesh))
+    bpy.context.scene.cm_paths.coll.append(
+        types.SimpleNamespace(name="Roads", objectName="Roads", radius=2.0))
+
+
+def formationScene(agents, rng):
+    """A grid of formation targets next to the crowd"""
+    side = int(math.ceil(math.sqrt(agents)))
+    vertices = [(i % side * SPACING, i // side * SPACING, 0)
+                for i in range(agents)]
+    mesh = bpy.Mesh("Formation", vertices)
+    target = bpy.Object("Formation", data=mesh,
+                        location=(crowdSize(agents) * 1.5, 0, 0))
+    bpy.context.scene.objects.append(target)
+    bpy.data.groups.append(bpy.Group("Formation", [target]))
+
+
+BRAINS = {
+    "flocking": (flockingBrain, None, True),
+    "sound": (soundBrain, None, True),
+    "path": (pathBrain, roadScene, False),
+    "formation": (formationBrain, formationScene, False),
+}
+"""{name: (builds the brain, builds the rest of the scene or None,
+           whether agents emit sound on frequency A)}"""
+
+
+# ==== Timing ====
+
+channelTimes = {}
+"""{channel name: seconds} for the current run"""
+
+
+def _timed(key, function):
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            channelTimes[key] = (channelTimes.get(key, 0) +
+                                 time.perf_counter() - start)
+    return timed
+
+
+_inputCore = cm_nodeFunctions.LogicNEWINPUT.core
+
+
+def _timedInputCore(self, inps, settings):
+    """Input nodes are charged to the channel they read from"""
+    key = settings["InputSource"].title()
+    if key not in self.brain.lvars:
+        return _inputCore(self, inps, settings)
+    start = time.perf_counter()
+    try:
+        return _inputCore(self, inps, settings)
+    finally:
+        channelTimes[key] = (channelTimes.get(key, 0) +
+                             time.perf_counter() - start)
+
+
+cm_nodeFunctions.LogicNEWINPUT.core = _timedInputCore
+
+
+def timeChannels(sim):
+    """Add the per agent and per frame work of each channel to channelTimes"""
+    for name, channel in sim.lvars.items():
+        for method in ("setuser", "register", "newframe"):
+            setattr(channel, method, _timed(name, getattr(channel, method)))
+
+
+def setup(brain, agents, seed):
+    """Build the scene and the simulation"""
+    buildBrain, buildScene, emits = BRAINS[brain]
+    bpy.reset()
+    rng = random.Random(seed)
+    tree = NodeTree(brain)
+    buildBrain(tree)
+    bpy.data.node_groups.append(tree)
+    names = addCrowd(agents, rng)
+    if buildScene is not None:
+        buildScene(agents, rng)
+
+    sim = Simulation()
+    for name in names:
+        sim.newagent(name, brain)
+    if emits:
+        for agent in sim.agents.values():
+            agent.external["tags"]["SoundA"] = 3 * SPACING
+            agent.access["tags"]["SoundA"] = 3 * SPACING
+    return sim
+
+
+def simulate(sim, frames):
+    """Move the scene on by frames, running the simulation for each"""
+    scene = bpy.context.scene
+    for f in range(frames):
+        scene.frame_current += 1
+        sim.frameChangeHandler(scene)
+
+
+class OverBudget(Exception):
+    pass
+
+
+def _overBudget(signum, frame):
+    raise OverBudget()
+
+
+def withBudget(seconds, function, *args):
+    """Call function and return (result, False) or (None, True) if it took
+    longer than seconds. Only enforced where SIGALRM exists."""
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        return function(*args), False
+    previous = signal.signal(signal.SIGALRM, _overBudget)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return function(*args), False
+    except OverBudget:
+        return None, True
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def benchmark(brain, agents, frames, seed, memory=True, budget=None):
+    """Run one brain on one crowd size and return the results. Frames that
+    are not finished within budget seconds are left out."""
+    result = {"brain": brain, "agents": agents, "frames": 0}
+    start = time.perf_counter()
+    sim, overBudget = withBudget(budget, setup, brain, agents, seed)
+    setupTime = time.perf_counter() - start
+    result["setupSeconds"] = round(setupTime, 6)
+    if overBudget:
+        result["overBudget"] = True
+        return result
+
+    timeChannels(sim)
+    total = 0
+    channels = {}
+    for f in range(frames):
+        channelTimes.clear()
+        remaining = budget - setupTime - total if budget else None
+        if remaining is not None and remaining <= 0:
+            break
+        start = time.perf_counter()
+        overBudget = withBudget(remaining, simulate, sim, 1)[1]
+        if overBudget:
+            break
+        total += time.perf_counter() - start
+        result["frames"] += 1
+        for k, v in channelTimes.items():
+            channels[k] = channels.get(k, 0) + v
+    del sim
+
+    if overBudget or result["frames"] < frames:
+        result["overBudget"] = True
+    if result["frames"]:
+        result.update({
+            "secondsPerFrame": round(total / result["frames"], 6),
+            "fps": round(result["frames"] / total, 6),
+            "channelSeconds": {k: round(v, 6)
+                               for k, v in sorted(channels.items())},
+            "otherSeconds": round(total - sum(channels.values()), 6)
+        })
+
+    if memory and result["frames"]:
+        tracemalloc.start()
+        simulate(setup(brain, agents, seed), 1)
+        result["peakMemoryMB"] = round(
+            tracemalloc.get_traced_memory()[1] / 2**20, 3)
+        tracemalloc.stop()
+    return result
+
+
+def formationPoints(agents, seed):
+    """The agents and formation targets of the formation scene as arrays"""
+    rng = random.Random(seed)
+    side = int(math.ceil(math.sqrt(agents)))
+    sources = numpy.array(
+        [((i % side + rng.uniform(-0.25, 0.25)) * SPACING,
+          (i // side + rng.uniform(-0.25, 0.25)) * SPACING, 0)
+         for i in range(agents)]).reshape(-1, 3)
+    targets = numpy.array(
+        [(i % side * SPACING + crowdSize(agents) * 1.5, i // side * SPACING, 0)
+         for i in range(agents)]).reshape(-1, 3)
+    return sources, targets
+
+
+def benchmarkAssignment(agents, seed, budget=None):
+    """Time assigning a crowd to a formation from a cold start with assign
+    and with the clustering it replaced"""
+    result = {"agents": agents}
+    sources, targets = formationPoints(agents, seed)
+    key = ("Formation", seed)
+
+    def clustering():
+        assignment = numpy.empty(agents, dtype=int)
+        for s, t in matchGroups(sources, targets, key)[1]:
+            assignment[s] = t
+        return assignment
+
+    def assignment():
+        return assign(sources, targets, key=key)
+
+    for name, function in (("clustering", clustering), ("assign", assignment)):
+        start = time.perf_counter()
+        matched, overBudget = withBudget(budget, function)
+        if overBudget:
+            result[name] = {"overBudget": True}
+            continue
+        result[name] = {
+            "seconds": round(time.perf_counter() - start, 6),
+            "totalCost": round(float(costOf(sources, targets, matched)), 3)
+        }
+    return result
+
+
+def version():
+    """The add-on version from bl_info"""
+    with open(os.path.join(ROOT, "__init__.py")) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and \
+                getattr(node.targets[0], "id", None) == "bl_info":
+            return ".".join(map(str, ast.literal_eval(node.value)["version"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--agents", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--brains", nargs="+", choices=sorted(BRAINS),
+                        default=["flocking", "sound", "path", "formation"])
+    parser.add_argument("--frames", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget", type=float, default=600,
+                        help="seconds allowed for each brain and crowd size "
+                             "before the remaining frames are skipped, "
+                             "0 for no limit")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the tracemalloc run")
+    parser.add_argument("--output", help="write the JSON here as well")
+    args = parser.parse_args(argv)
+
+    results = []
+    assignments = []
+    for agents in args.agents:
+        for brain in args.brains:
+            result = benchmark(brain, agents, args.frames, args.seed,
+                               not args.no_memory, args.budget)
+            print(brain, agents, "agents", result.get("fps"), "fps",
+                  file=sys.stderr)
+            results.append(result)
+        if "formation" in args.brains:
+            result = benchmarkAssignment(agents, args.seed, args.budget)
+            print("assignment", agents, "agents",
+                  result["assign"].get("seconds"), "seconds, clustering",
+                  result["clustering"].get("seconds"), "seconds",
+                  file=sys.stderr)
+            assignments.append(result)
+
+    report = {
+        "version": version(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "results": results,
+        "assignment": assignments
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
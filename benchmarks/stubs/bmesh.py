@@ -0,0 +1,39 @@
+"""Stand in for the parts of Blender's bmesh module used by the path
+channel."""
+
+
+class BMVert:
+    def __init__(self, co, index):
+        self.co = co
+        self.index = index
+        self.link_edges = []
+
+
+class BMEdge:
+    def __init__(self, a, b):
+        self.verts = (a, b)
+
+
+class _Verts(list):
+    def ensure_lookup_table(self):
+        pass
+
+
+class BMesh:
+    def __init__(self):
+        self.verts = _Verts()
+        self.edges = []
+
+    def from_mesh(self, mesh):
+        for v in mesh.vertices:
+            self.verts.append(BMVert(v.co.copy(), v.index))
+        for e in mesh.edges:
+            a, b = (self.verts[i] for i in e.vertices)
+            ed = BMEdge(a, b)
+            a.link_edges.append(ed)
+            b.link_edges.append(ed)
+            self.edges.append(ed)
+
+
+def new():
+    return BMesh()
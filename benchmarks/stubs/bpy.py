@@ -0,0 +1,210 @@
+"""Stand in for the parts of Blender's bpy module that the simulation uses so
+that it can be run and timed from a normal Python interpreter. Only holds
+data, none of the operators or the interface exist."""
+
+import sys
+import types as _types
+
+from mathutils import Vector, Euler, Matrix
+
+
+class _Prefs:
+    show_debug_options = False
+    use_node_color = False
+
+
+class _Addons(dict):
+    def __missing__(self, key):
+        addon = _types.SimpleNamespace(preferences=_Prefs())
+        self[key] = addon
+        return addon
+
+
+class Collection(list):
+    """List that can also be indexed by name like bpy_prop_collection"""
+    def __init__(self, items=()):
+        list.__init__(self, items)
+        self._names = None
+
+    def _index(self):
+        if self._names is None:
+            self._names = {}
+            for item in self:
+                self._names.setdefault(item.name, item)
+        return self._names
+
+    def _changed(self):
+        self._names = None
+
+    def append(self, item):
+        list.append(self, item)
+        self._changed()
+
+    def extend(self, items):
+        list.extend(self, items)
+        self._changed()
+
+    def remove(self, item):
+        list.remove(self, item)
+        self._changed()
+
+    def clear(self):
+        del self[:]
+        self._changed()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._index()[key]
+        return list.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return key in self._index()
+        return list.__contains__(self, key)
+
+    def get(self, key, default=None):
+        return self._index().get(key, default)
+
+    def find(self, key):
+        for i, item in enumerate(self):
+            if item.name == key:
+                return i
+        return -1
+
+
+class MeshVertex:
+    def __init__(self, co, index):
+        self.co = Vector(co)
+        self.index = index
+
+
+class MeshEdge:
+    def __init__(self, vertices, index):
+        self.vertices = tuple(vertices)
+        self.index = index
+
+
+class MeshPolygon:
+    def __init__(self, vertices, index):
+        self.vertices = tuple(vertices)
+        self.index = index
+
+
+class _Sequence(list):
+    def foreach_get(self, attr, array):
+        i = 0
+        for item in self:
+            value = getattr(item, attr)
+            try:
+                for x in value:
+                    array[i] = x
+                    i += 1
+            except TypeError:
+                array[i] = value
+                i += 1
+
+
+class Mesh:
+    def __init__(self, name, vertices=(), edges=(), polygons=()):
+        self.name = name
+        self.vertices = _Sequence(MeshVertex(v, i)
+                                  for i, v in enumerate(vertices))
+        self.edges = _Sequence(MeshEdge(e, i) for i, e in enumerate(edges))
+        self.polygons = _Sequence(MeshPolygon(p, i)
+                                  for i, p in enumerate(polygons))
+        self.is_updated = False
+
+
+class Object:
+    def __init__(self, name, data=None, location=(0, 0, 0),
+                 rotation=(0, 0, 0), dimensions=(1, 1, 1)):
+        self.name = name
+        self.data = data
+        self.type = 'MESH' if data is not None else 'EMPTY'
+        self.location = Vector(location)
+        self.rotation_euler = Euler(rotation)
+        self.scale = Vector((1, 1, 1))
+        self.dimensions = Vector(dimensions)
+        self.select = False
+        self.animation_data = None
+        self.modifiers = []
+        self.keyframes = 0
+
+    @property
+    def matrix_world(self):
+        r = self.rotation_euler.to_matrix()
+        return Matrix([[r[i][j] * self.scale[j] for j in range(3)] +
+                       [self.location[i]] for i in range(3)] +
+                      [[0, 0, 0, 1]])
+
+    @property
+    def bound_box(self):
+        h = [d / 2 for d in self.dimensions]
+        return [(sx * h[0], sy * h[1], sz * h[2])
+                for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)]
+
+    def animation_data_clear(self):
+        self.animation_data = None
+
+    def keyframe_insert(self, data_path="", index=-1, frame=0):
+        self.keyframes += 1
+
+
+class Group:
+    def __init__(self, name, objects=()):
+        self.name = name
+        self.objects = Collection(objects)
+
+
+scene = _types.SimpleNamespace(
+    objects=Collection(), frame_current=1, frame_start=1, frame_end=250,
+    cm_events=_types.SimpleNamespace(coll=Collection(), index=0),
+    cm_paths=_types.SimpleNamespace(coll=Collection(), index=0),
+    cm_groups=Collection())
+
+context = _types.SimpleNamespace(
+    scene=scene, active_object=None, selected_objects=[],
+    user_preferences=_types.SimpleNamespace(addons=_Addons()))
+
+data = _types.SimpleNamespace(objects=scene.objects, groups=Collection(),
+                              node_groups=Collection(), is_dirty=False,
+                              filepath="")
+
+app = _types.SimpleNamespace(
+    handlers=_types.SimpleNamespace(frame_change_pre=[],
+                                    frame_change_post=[]),
+    tempdir="/tmp/")
+
+
+def reset():
+    """Empty the scene"""
+    scene.objects.clear()
+    scene.cm_events.coll.clear()
+    scene.cm_paths.coll.clear()
+    scene.frame_current = scene.frame_start
+    data.groups.clear()
+    data.node_groups.clear()
+    context.active_object = None
+
+
+def _property(*args, **kwargs):
+    return None
+
+
+props = _types.ModuleType("bpy.props")
+for _name in ("BoolProperty", "IntProperty", "FloatProperty",
+              "StringProperty", "EnumProperty", "PointerProperty",
+              "CollectionProperty", "FloatVectorProperty"):
+    setattr(props, _name, _property)
+
+types = _types.ModuleType("bpy.types")
+for _name in ("PropertyGroup", "UIList", "Panel", "Operator", "NodeTree",
+              "Node", "NodeSocket", "AddonPreferences", "Scene", "Menu"):
+    setattr(types, _name, type(_name, (), {}))
+
+utils = _types.SimpleNamespace(register_class=lambda c: None,
+                               unregister_class=lambda c: None)
+path = _types.SimpleNamespace(abspath=lambda p: p)
+
+sys.modules["bpy.props"] = props
+sys.modules["bpy.types"] = types
@@ -0,0 +1,209 @@
+"""Pure python stand in for the parts of Blender's mathutils module that the
+simulation uses. Follows the Blender 2.7x conventions (* for matrix
+multiplication and vector * matrix for the transposed product)."""
+
+import math
+
+
+class Vector:
+    def __init__(self, seq=(0.0, 0.0, 0.0)):
+        self._v = [float(x) for x in seq]
+
+    def __len__(self):
+        return len(self._v)
+
+    def __iter__(self):
+        return iter(self._v)
+
+    def __getitem__(self, i):
+        return self._v[i]
+
+    def __setitem__(self, i, v):
+        self._v[i] = float(v)
+
+    def _component(i):
+        return property(lambda s: s._v[i], lambda s, v: s.__setitem__(i, v))
+    x = _component(0)
+    y = _component(1)
+    z = _component(2)
+
+    def copy(self):
+        return Vector(self._v)
+
+    def __add__(self, o):
+        return Vector([a + b for a, b in zip(self, o)])
+    __radd__ = __add__
+
+    def __sub__(self, o):
+        return Vector([a - b for a, b in zip(self, o)])
+
+    def __rsub__(self, o):
+        return Vector([b - a for a, b in zip(self, o)])
+
+    def __neg__(self):
+        return Vector([-a for a in self])
+
+    def __mul__(self, o):
+        if isinstance(o, (int, float)):
+            return Vector([a * o for a in self])
+        if isinstance(o, Matrix):
+            n = len(self)
+            return Vector([sum(self[r] * o.rows[r][c] for r in range(n))
+                           for c in range(n)])
+        return sum(a * b for a, b in zip(self, o))
+
+    def __rmul__(self, o):
+        if isinstance(o, (int, float)):
+            return self * o
+        return NotImplemented
+
+    def __truediv__(self, o):
+        return Vector([a / o for a in self])
+
+    def __itruediv__(self, o):
+        self._v = [a / o for a in self._v]
+        return self
+
+    def __eq__(self, o):
+        try:
+            return list(self) == list(o)
+        except TypeError:
+            return False
+
+    def __hash__(self):
+        return hash(tuple(self._v))
+
+    def dot(self, o):
+        return sum(a * b for a, b in zip(self, o))
+
+    def cross(self, o):
+        return Vector((self[1]*o[2] - self[2]*o[1],
+                       self[2]*o[0] - self[0]*o[2],
+                       self[0]*o[1] - self[1]*o[0]))
+
+    @property
+    def length(self):
+        return math.sqrt(sum(a * a for a in self))
+
+    @property
+    def length_squared(self):
+        return sum(a * a for a in self)
+
+    def normalized(self):
+        length = self.length
+        return Vector(self) if length == 0 else self / length
+
+    def normalize(self):
+        length = self.length
+        if length:
+            self._v = [a / length for a in self._v]
+
+    def to_tuple(self, precision=None):
+        return tuple(self._v)
+
+    def rotate(self, euler):
+        self._v = list(euler.to_matrix() * self)
+
+    def to_3d(self):
+        return Vector(self._v[:3])
+
+    def to_4d(self):
+        return Vector(self._v[:3] + [1.0])
+
+    def __repr__(self):
+        return "Vector(%r)" % (tuple(self._v),)
+
+
+class Matrix:
+    def __init__(self, rows=None):
+        if rows is None:
+            rows = [[1.0 if r == c else 0.0 for c in range(4)]
+                    for r in range(4)]
+        self.rows = [[float(x) for x in r] for r in rows]
+
+    def __getitem__(self, i):
+        return self.rows[i]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    @staticmethod
+    def Rotation(angle, size, axis):
+        c, s = math.cos(angle), math.sin(angle)
+        if axis == 'X':
+            r = [[1, 0, 0], [0, c, -s], [0, s, c]]
+        elif axis == 'Y':
+            r = [[c, 0, s], [0, 1, 0], [-s, 0, c]]
+        else:
+            r = [[c, -s, 0], [s, c, 0], [0, 0, 1]]
+        if size == 4:
+            r = [row + [0] for row in r] + [[0, 0, 0, 1]]
+        return Matrix(r)
+
+    @staticmethod
+    def Translation(v):
+        m = Matrix()
+        for i in range(3):
+            m.rows[i][3] = v[i]
+        return m
+
+    def __mul__(self, o):
+        n = len(self.rows)
+        if isinstance(o, Matrix):
+            return Matrix([[sum(self.rows[r][k] * o.rows[k][c]
+                                for k in range(n)) for c in range(n)]
+                           for r in range(n)])
+        v = list(o)
+        if len(v) == 3 and n == 4:
+            v = v + [1.0]
+            return Vector([sum(self.rows[r][k] * v[k] for k in range(4))
+                           for r in range(3)])
+        return Vector([sum(self.rows[r][k] * v[k] for k in range(n))
+                       for r in range(n)])
+
+    def to_3x3(self):
+        return Matrix([r[:3] for r in self.rows[:3]])
+
+    def inverted(self):
+        import numpy
+        return Matrix(numpy.linalg.inv(numpy.array(self.rows)).tolist())
+
+    def transposed(self):
+        return Matrix([list(c) for c in zip(*self.rows)])
+
+    def copy(self):
+        return Matrix(self.rows)
+
+    def __eq__(self, o):
+        return isinstance(o, Matrix) and self.rows == o.rows
+
+    @property
+    def translation(self):
+        return Vector([self.rows[i][3] for i in range(3)])
+
+
+class Euler(Vector):
+    def __init__(self, seq=(0.0, 0.0, 0.0), order='XYZ'):
+        Vector.__init__(self, seq)
+        self.order = order
+
+    def to_matrix(self):
+        axes = {axis: Matrix.Rotation(self["XYZ".index(axis)], 3, axis)
+                for axis in "XYZ"}
+        m = Matrix([[1, 0, 0], [0, 1, 0], [0, 0, 1]])
+        for axis in self.order:
+            m = axes[axis] * m
+        return m
+
+    def rotate_axis(self, axis, angle):
+        self["XYZ".index(axis)] += angle
+
+
+class Color:
+    hsv = (0, 0, 0)
+
+
+from . import kdtree, bvhtree  # noqa
@@ -0,0 +1,107 @@
+"""Brute force ray casts against the triangles of a mesh. Only used by the
+ground and obstacle channels."""
+
+from . import Vector
+
+
+class BVHTree:
+    def __init__(self, tris):
+        self.tris = tris  # list of (a, b, c) Vectors
+
+    @classmethod
+    def FromObject(cls, obj, scene, deform=True, render=False, cage=False,
+                   epsilon=0.0):
+        me = obj.data
+        verts = [Vector(v.co) for v in me.vertices]
+        tris = []
+        for p in me.polygons:
+            vs = list(p.vertices)
+            for k in range(1, len(vs) - 1):
+                tris.append((verts[vs[0]], verts[vs[k]], verts[vs[k + 1]]))
+        return cls(tris)
+
+    @classmethod
+    def FromPolygons(cls, vertices, polygons, all_triangles=False,
+                     epsilon=0.0):
+        verts = [Vector(v) for v in vertices]
+        tris = []
+        for p in polygons:
+            vs = list(p)
+            for k in range(1, len(vs) - 1):
+                tris.append((verts[vs[0]], verts[vs[k]], verts[vs[k + 1]]))
+        return cls(tris)
+
+    def ray_cast(self, origin, direction, distance=1e30):
+        o = Vector(origin)
+        d = Vector(direction).normalized()
+        best = (None, None, None, None)
+        for ti, (a, b, c) in enumerate(self.tris):
+            e1 = b - a
+            e2 = c - a
+            p = _cross(d, e2)
+            det = e1.dot(p)
+            if abs(det) < 1e-12:
+                continue
+            inv = 1.0 / det
+            t = o - a
+            u = t.dot(p) * inv
+            if u < 0 or u > 1:
+                continue
+            q = _cross(t, e1)
+            v = d.dot(q) * inv
+            if v < 0 or u + v > 1:
+                continue
+            dist = e2.dot(q) * inv
+            if 0 <= dist <= distance and (best[3] is None or dist < best[3]):
+                n = _cross(e1, e2).normalized()
+                best = (o + d * dist, n, ti, dist)
+        return best
+
+    def find_nearest(self, origin, distance=1e30):
+        o = Vector(origin)
+        best = (None, None, None, None)
+        for ti, (a, b, c) in enumerate(self.tris):
+            p = _closestOnTri(o, a, b, c)
+            dist = (p - o).length
+            if dist <= distance and (best[3] is None or dist < best[3]):
+                n = _cross(b - a, c - a).normalized()
+                best = (p, n, ti, dist)
+        return best
+
+
+def _cross(a, b):
+    return Vector((a[1]*b[2] - a[2]*b[1], a[2]*b[0] - a[0]*b[2],
+                   a[0]*b[1] - a[1]*b[0]))
+
+
+def _closestOnTri(p, a, b, c):
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    d1 = ab.dot(ap)
+    d2 = ac.dot(ap)
+    if d1 <= 0 and d2 <= 0:
+        return a
+    bp = p - b
+    d3 = ab.dot(bp)
+    d4 = ac.dot(bp)
+    if d3 >= 0 and d4 <= d3:
+        return b
+    vc = d1*d4 - d3*d2
+    if vc <= 0 and d1 >= 0 and d3 <= 0:
+        return a + ab * (d1 / (d1 - d3))
+    cp = p - c
+    d5 = ab.dot(cp)
+    d6 = ac.dot(cp)
+    if d6 >= 0 and d5 <= d6:
+        return c
+    vb = d5*d2 - d1*d6
+    if vb <= 0 and d2 >= 0 and d6 <= 0:
+        return a + ac * (d2 / (d2 - d6))
+    va = d3*d6 - d5*d4
+    if va <= 0 and (d4 - d3) >= 0 and (d5 - d6) >= 0:
+        return b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))
+    denom = 1.0 / (va + vb + vc)
+    v = vb * denom
+    w = vc * denom
+    return a + ab * v + ac * w
@@ -0,0 +1,43 @@
+import numpy
+
+
+class KDTree:
+    """Points sorted along x. Range queries only look at the slab of points
+    within the radius along x, which is fast enough for crowds spread over
+    the ground."""
+    def __init__(self, size):
+        self.points = []
+        self.indices = []
+        self.co = numpy.zeros((0, 3))
+        self.index = numpy.zeros(0, dtype=int)
+
+    def insert(self, co, index):
+        self.points.append(tuple(co))
+        self.indices.append(index)
+
+    def balance(self):
+        co = numpy.array(self.points, dtype=float).reshape(-1, 3)
+        order = numpy.argsort(co[:, 0], kind="mergesort")
+        self.co = co[order]
+        self.index = numpy.array(self.indices, dtype=int)[order]
+
+    def _result(self, rows, dist):
+        from . import Vector
+        return [(Vector(self.co[r]), int(self.index[r]), float(d))
+                for r, d in zip(rows.tolist(), dist.tolist())]
+
+    def find(self, co):
+        if len(self.co) == 0:
+            return None, None, None
+        dist = numpy.linalg.norm(self.co - tuple(co), axis=1)
+        row = numpy.array([dist.argmin()])
+        return self._result(row, dist[row])[0]
+
+    def find_range(self, co, radius):
+        co = numpy.array(tuple(co), dtype=float)
+        low, high = numpy.searchsorted(self.co[:, 0],
+                                       (co[0] - radius, co[0] + radius))
+        dist = numpy.linalg.norm(self.co[low:high] - co, axis=1)
+        rows = numpy.flatnonzero(dist <= radius)
+        order = numpy.argsort(dist[rows], kind="mergesort")
+        return self._result(rows[order] + low, dist[rows][order])
@@ -7,12 +7,15 @@ from .cm_compileBrain import compileBrain
 
 class Agent:
     """Represents each of the agents in the scene"""
-    def __init__(self, blenderid, nodeGroup, sim):
+    def __init__(self, blenderid, nodeGroup, sim, handle):
         preferences = bpy.context.user_preferences.addons[__package__].preferences
         if preferences.show_debug_options:
             print("Blender id", blenderid)
         self.id = blenderid
-        self.brain = compileBrain(nodeGroup, sim, blenderid)
+        self.handle = handle
+        """Index of this agent in sim.agentList"""
+        self.obj = bpy.data.objects[blenderid]
+        self.brain = compileBrain(nodeGroup, sim, blenderid, handle)
         self.sim = sim
         self.external = {"id": self.id, "tags": {}}
         """self.external modified by the agent and then coppied to self.access
@@ -22,65 +25,63 @@ class Agent:
         self.agvars = {"None": None}
         "agent variables. Don't access from other agents"
 
-        objs = bpy.data.objects
-
         """Set the dimensions of this object"""
-        self.dimensions = objs[blenderid].dimensions
+        self.dimensions = self.obj.dimensions
         self.radius = max(self.dimensions) / 2
         # TODO allow the user to specify a bounding geometry
 
         """ar - absolute rot, r - change rot by, rs - rot speed"""
-        self.arx = objs[blenderid].rotation_euler[0]
+        self.arx = self.obj.rotation_euler[0]
         self.rx = 0
         self.rsx = 0
         self.arxKey = True  # True if a keyframe was set last frame
 
-        self.ary = objs[blenderid].rotation_euler[1]
+        self.ary = self.obj.rotation_euler[1]
         self.ry = 0
         self.rsy = 0
         self.aryKey = True  # True if a keyframe was set last frame
 
-        self.arz = objs[blenderid].rotation_euler[2]
+        self.arz = self.obj.rotation_euler[2]
         self.rz = 0
         self.rsz = 0
         self.arzKey = True  # True if a keyframe was set last frame
 
         """ap - absolute pos, p - change pos by, s - speed"""
-        self.apx = objs[blenderid].location[0]
+        self.apx = self.obj.location[0]
         self.px = 0
         self.sx = 0
         self.apxKey = True  # True if a keyframe was set last frame
 
-        self.apy = objs[blenderid].location[1]
+        self.apy = self.obj.location[1]
         self.py = 0
         self.sy = 0
         self.apyKey = True  # True if a keyframe was set last frame
 
-        self.apz = objs[blenderid].location[2]
+        self.apz = self.obj.location[2]
         self.pz = 0
         self.sz = 0
         self.apzKey = True  # True if a keyframe was set last frame
 
         self.globalVelocity = mathutils.Vector([0, 0, 0])
+        # globalVelocity as it was at the start of the frame. It only changes
+        #  in apply so other agents see the same value all through step.
+        self.startVelocity = self.globalVelocity
 
         """Clear out the nla"""
-        objs = bpy.data.objects
-
-        objs[blenderid].animation_data_clear()
-        objs[blenderid].keyframe_insert(data_path="location", frame=1)
-        objs[blenderid].keyframe_insert(data_path="rotation_euler", frame=1)
+        self.obj.animation_data_clear()
+        self.obj.keyframe_insert(data_path="location", frame=1)
+        self.obj.keyframe_insert(data_path="rotation_euler", frame=1)
 
     def step(self):
-        objs = bpy.data.objects
         preferences = bpy.context.user_preferences.addons[__package__].preferences
 
         self.brain.execute()
-        if objs[self.id].select:
+        if self.obj.select:
             if preferences.show_debug_options:
                 print("ID: ", self.id, "Tags: ", self.brain.tags,
                       "outvars: ", self.brain.outvars)
             # TODO show this in the UI
-        if objs[self.id] == bpy.context.active_object:
+        if self.obj == bpy.context.active_object:
             self.brain.hightLight(bpy.context.scene.frame_current)
 
         self.rx = self.brain.outvars["rx"] if self.brain.outvars["rx"] else 0
@@ -124,7 +125,7 @@ class Agent:
 
     def apply(self):
         """Called in single thread after all agent.step() calls are done"""
-        obj = bpy.data.objects[self.id]
+        obj = self.obj
 
         if obj.animation_data:
             obj.animation_data.action_extrapolation = 'HOLD_FORWARD'
@@ -212,6 +213,7 @@ class Agent:
         else:
             self.apzKey = False
 
+        self.startVelocity = self.globalVelocity
         self.access = copy.deepcopy(self.external)
 
     def highLight(self):
@@ -134,7 +134,10 @@ class NewInputNode(LogicNode):
                                       ("PATH", "Path", "", 6),
                                       ("SOUND", "Sound", "", 7),
                                       ("STATE", "State", "", 8),
-                                      ("WORLD", "World", "", 9)])
+                                      ("WORLD", "World", "", 9),
+                                      ("FLOW", "Flow", "", 10),
+                                      ("DENSITY", "Density", "", 11),
+                                      ("OBSTACLE", "Obstacle", "", 12)])
 
     Constant = FloatProperty(name="Constant")
 
@@ -157,6 +160,11 @@ class NewInputNode(LogicNode):
                                            ("DIST", "dist", "", 3)])
 
     GroundGroup = StringProperty(name="Ground Group")
+    GroundHeightfield = BoolProperty(name="Heightfield",
+                                     description="Sample the ground from a precomputed height grid",
+                                     default=False)
+    GroundResolution = FloatProperty(name="Resolution", default=0.5, min=0.01,
+                                     description="Size of the cells in the height grid")
 
     NoiseOptions = EnumProperty(name="Noise Options",
                                 items=[("RANDOM", "Random", "", 1),
@@ -172,6 +180,11 @@ class NewInputNode(LogicNode):
                              items=[("BASIC", "Basic", "", 1),
                                     ("PREDICTION", "Prediction", "", 2),
                                     ("STEERING", "Steering", "", 3)])
+    SoundAggregate = BoolProperty(name="Aggregate",
+                                  description="Hear far away groups of emitters as a single emitter",
+                                  default=False)
+    SoundAccuracy = FloatProperty(name="Accuracy", default=0.5, min=0.0,
+                                  description="Groups are summarised when their size divided by their distance is less than this")
     SoundOptions = EnumProperty(name="Sound Options",
                                 items=[("RZ", "rz", "", 1),
                                        ("RX", "rx", "", 2),
@@ -189,6 +202,36 @@ class NewInputNode(LogicNode):
                                        ("GLOBALVELY", "Global Vel Y", "", 4),
                                        ("GLOBALVELZ", "Global Vel Z", "", 5)])
 
+    FlowGoal = StringProperty(name="Goal")
+    FlowGround = StringProperty(name="Ground Group")
+    FlowObstacles = StringProperty(name="Obstacle Group")
+    FlowResolution = FloatProperty(name="Resolution", default=1.0, min=0.01,
+                                   description="Size of the cells in the flow field")
+    FlowOptions = EnumProperty(name="Flow Options",
+                               items=[("RZ", "rz", "", 1),
+                                      ("DIST", "dist", "", 2)])
+
+    DensityResolution = FloatProperty(name="Resolution", default=2.0,
+                                      min=0.01,
+                                      description="Size of the cells agents are counted in")
+    DensityOptions = EnumProperty(name="Density Options",
+                                  items=[("DENSITY", "Density", "", 1),
+                                         ("GRADIENT", "Gradient", "", 2),
+                                         ("GRADIENTRZ", "Gradient rz", "", 3),
+                                         ("FLOWSPEED", "Flow speed", "", 4),
+                                         ("FLOWRZ", "Flow rz", "", 5)])
+
+    ObstacleGroup = StringProperty(name="Obstacle Group")
+    ObstacleResolution = FloatProperty(name="Resolution", default=0.5,
+                                       min=0.01,
+                                       description="Size of the voxels the distance is sampled at")
+    ObstacleRange = FloatProperty(name="Range", default=2.0, min=0.0,
+                                  description="How far from the obstacles the distance is sampled")
+    ObstacleOptions = EnumProperty(name="Obstacle Options",
+                                   items=[("DIST", "dist", "", 1),
+                                          ("RZ", "rz", "", 2),
+                                          ("RX", "rx", "", 3)])
+
     WorldOptions = EnumProperty(name="World Options",
                                 items=[("TIME", "Time", "", 1),
                                        ("TARGET", "Target", "", 2)])
@@ -215,6 +258,10 @@ class NewInputNode(LogicNode):
                 layout.prop(self, "FormationOptions")
         elif self.InputSource == "GROUND":
             layout.prop_search(self, "GroundGroup", bpy.data, "groups")
+            row = layout.row()
+            row.prop(self, "GroundHeightfield")
+            if self.GroundHeightfield:
+                row.prop(self, "GroundResolution")
         elif self.InputSource == "NOISE":
             layout.prop(self, "NoiseOptions")
         elif self.InputSource == "PATH":
@@ -224,9 +271,29 @@ class NewInputNode(LogicNode):
         elif self.InputSource == "SOUND":
             layout.prop(self, "SoundFrequency", text="Frequency")
             layout.prop(self, "SoundMode", expand=True)
+            if self.SoundMode == "BASIC":
+                row = layout.row()
+                row.prop(self, "SoundAggregate")
+                if self.SoundAggregate:
+                    row.prop(self, "SoundAccuracy")
             layout.prop(self, "SoundOptions", text="Options")
         elif self.InputSource == "STATE":
             layout.prop(self, "StateOptions")
+        elif self.InputSource == "FLOW":
+            layout.prop_search(self, "FlowGoal", context.scene, "objects")
+            layout.prop_search(self, "FlowGround", bpy.data, "groups")
+            layout.prop_search(self, "FlowObstacles", bpy.data, "groups")
+            layout.prop(self, "FlowResolution")
+            layout.prop(self, "FlowOptions")
+        elif self.InputSource == "DENSITY":
+            layout.prop(self, "DensityResolution")
+            layout.prop(self, "DensityOptions")
+        elif self.InputSource == "OBSTACLE":
+            layout.prop_search(self, "ObstacleGroup", bpy.data, "groups")
+            row = layout.row()
+            row.prop(self, "ObstacleResolution")
+            row.prop(self, "ObstacleRange")
+            layout.prop(self, "ObstacleOptions")
         elif self.InputSource == "WORLD":
             layout.prop(self, "WorldOptions"),
             if self.WorldOptions == "TARGET":
@@ -251,6 +318,8 @@ class NewInputNode(LogicNode):
                 node.settings["FormationOptions"] = self.FormationOptions
         elif self.InputSource == "GROUND":
             node.settings["GroundGroup"] = self.GroundGroup
+            node.settings["GroundHeightfield"] = self.GroundHeightfield
+            node.settings["GroundResolution"] = self.GroundResolution
         elif self.InputSource == "NOISE":
             node.settings["NoiseOptions"] = self.NoiseOptions
         elif self.InputSource == "PATH":
@@ -259,9 +328,25 @@ class NewInputNode(LogicNode):
         elif self.InputSource == "SOUND":
             node.settings["SoundFrequency"] = self.SoundFrequency
             node.settings["SoundMode"] = self.SoundMode
+            node.settings["SoundAggregate"] = self.SoundAggregate
+            node.settings["SoundAccuracy"] = self.SoundAccuracy
             node.settings["SoundOptions"] = self.SoundOptions
         elif self.InputSource == "STATE":
             node.settings["StateOptions"] = self.StateOptions
+        elif self.InputSource == "FLOW":
+            node.settings["FlowGoal"] = self.FlowGoal
+            node.settings["FlowGround"] = self.FlowGround
+            node.settings["FlowObstacles"] = self.FlowObstacles
+            node.settings["FlowResolution"] = self.FlowResolution
+            node.settings["FlowOptions"] = self.FlowOptions
+        elif self.InputSource == "DENSITY":
+            node.settings["DensityResolution"] = self.DensityResolution
+            node.settings["DensityOptions"] = self.DensityOptions
+        elif self.InputSource == "OBSTACLE":
+            node.settings["ObstacleGroup"] = self.ObstacleGroup
+            node.settings["ObstacleResolution"] = self.ObstacleResolution
+            node.settings["ObstacleRange"] = self.ObstacleRange
+            node.settings["ObstacleOptions"] = self.ObstacleOptions
         elif self.InputSource == "WORLD":
             node.settings["WorldOptions"] = self.WorldOptions
             if self.WorldOptions == "TARGET":
@@ -1,15 +1,16 @@
-import random
-
 import bpy
 
 import mathutils
 
+from .libs import ins_random
+
 
 class Impulse():
     def __init__(self, tup):
         preferences = bpy.context.user_preferences.addons[__package__].preferences
         if preferences.show_debug_options:
-            assert isinstance(tup[0], str), "Impulse key should be type str"
+            assert isinstance(tup[0], (str, int)), \
+                "Impulse key should be type str or int (an agent handle)"
             assert isinstance(tup[1], int) or isinstance(tup[1], float), \
                 "Impulse value should be type int or float"
         self.key = tup[0]
@@ -182,7 +183,7 @@ class State:
         if len(self.valueInputs) == 0:
             self.finalValue = self.settings["ValueDefault"]
             if self.settings["RandomInput"]:
-                self.finalValue += random.random()
+                self.finalValue += self.brain.random(self.name)
             return
         values = []
         for inp in self.valueInputs:
@@ -211,7 +212,7 @@ class State:
             result = min(vals)
         self.finalValue = result
         if self.settings["RandomInput"]:
-            self.finalValue += random.random()
+            self.finalValue += self.brain.random(self.name)
 
     def evaluateState(self):
         """Return the state to move to (allowed to return itself)
@@ -279,8 +280,9 @@ class State:
 
 class Brain():
     """An executable brain object. One created per agent"""
-    def __init__(self, sim, userid):
+    def __init__(self, sim, userid, handle):
         self.userid = userid
+        self.handle = handle
         self.sim = sim
         self.agvars = {}
         self.lvars = self.sim.lvars
@@ -301,21 +303,29 @@ class Brain():
         self.currentState = stateNode
         self.startState = stateNode
 
+    def random(self, *key):
+        """A random number in range 0-1 for this agent on this frame"""
+        return ins_random.random(self.userid, self.sim.framelast, *key)
+
+    def choice(self, sequence, *key):
+        """A random item of sequence for this agent on this frame"""
+        return ins_random.choice(sequence, self.userid, self.sim.framelast,
+                                 *key)
+
     def reset(self):
         self.outvars = {"rx": 0, "ry": 0, "rz": 0,
                         "px": 0, "py": 0, "pz": 0}
-        self.tags = self.sim.agents[self.userid].access["tags"]
-        self.agvars = self.sim.agents[self.userid].agvars
+        agent = self.sim.agentList[self.handle]
+        self.tags = agent.access["tags"]
+        self.agvars = agent.agvars
 
     def execute(self):
         """Called for each time the agents needs to evaluate"""
         actv = bpy.context.active_object
         self.isActiveSelection = actv is not None and actv.name == self.userid
         self.reset()
-        randstate = hash(self.userid) + self.sim.framelast
-        random.seed(randstate)
         for name, var in self.lvars.items():
-            var.setuser(self.userid)
+            var.setuser(self.handle)
         for neur in self.neurons.values():
             neur.newFrame()
         for out in self.outputs:
@@ -6,6 +6,10 @@ from .cm_crowdChannels import Crowd
 from .cm_groundChannels import Ground
 from .cm_formationChannels import Formation
 from .cm_pathChannels import Path
+from .cm_flowChannels import Flow
+from .cm_densityChannels import Density
+from .cm_obstacleChannels import Obstacle
+from .cm_eventChannels import Event
 from . import cm_pathChannels
 Path = cm_pathChannels.Path
 
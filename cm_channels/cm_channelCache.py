@@ -0,0 +1,166 @@
+import hashlib
+import os
+import tempfile
+import zlib
+
+import numpy
+
+
+def _flatten(value):
+    """Turn an array property (possibly nested like a matrix) into a tuple"""
+    if isinstance(value, str):
+        return value
+    try:
+        return tuple(_flatten(v) for v in value)
+    except TypeError:
+        return round(value, 6) if isinstance(value, float) else value
+
+
+def _referenceKey(value):
+    """Key for an ID that a modifier points at. Objects include their
+    transform and armatures their pose as both change the deformed mesh."""
+    if value is None:
+        return None
+    key = (getattr(value, "name", None),)
+    if hasattr(value, "matrix_world"):
+        key += (_flatten(value.matrix_world),)
+    pose = getattr(value, "pose", None)
+    if pose is not None:
+        key += tuple((b.name, _flatten(b.matrix)) for b in pose.bones)
+    return key
+
+
+def settingsKey(struct):
+    """All the editable settings of struct (eg. a modifier) as a tuple
+
+    :type struct: bpy.types.bpy_struct
+    """
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier == "rna_type" or prop.type == 'COLLECTION':
+            continue
+        value = getattr(struct, prop.identifier)
+        if prop.type == 'POINTER':
+            value = _referenceKey(value)
+        elif getattr(prop, "array_length", 0):
+            value = _flatten(value)
+        elif isinstance(value, float):
+            value = round(value, 6)
+        elif isinstance(value, set):
+            value = frozenset(value)
+        values.append((prop.identifier, value))
+    return tuple(values)
+
+
+def shapeKeysKey(mesh):
+    """The shape key values and shapes of mesh"""
+    shapeKeys = getattr(mesh, "shape_keys", None)
+    if shapeKeys is None:
+        return ()
+    result = []
+    for block in shapeKeys.key_blocks:
+        co = numpy.empty(len(block.data) * 3, dtype=numpy.float32)
+        block.data.foreach_get("co", co)
+        result.append((block.name, round(block.value, 6), block.mute,
+                       zlib.crc32(co.tobytes())))
+    return tuple(result)
+
+
+def meshFingerprint(obj):
+    """A cheap key that changes when the mesh data of obj is edited, a shape
+    key is changed or any setting of its modifier stack (including the
+    objects and armature poses that modifiers use) is changed. This matches
+    the deformed mesh that BVHTree.FromObject builds from. Object transforms
+    are not included.
+
+    :type obj: bpy.types.Object
+    :returns: hashable tuple
+    """
+    mesh = obj.data
+    co = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", co)
+    modifiers = tuple(settingsKey(m) for m in obj.modifiers)
+    return (mesh.name, len(mesh.vertices), len(mesh.polygons),
+            zlib.crc32(co.tobytes()), shapeKeysKey(mesh), modifiers)
+
+
+def _hasDrivers(idBlock):
+    animation = getattr(idBlock, "animation_data", None)
+    return animation is not None and len(animation.drivers) > 0
+
+
+def isLiveDeformed(obj):
+    """True if the deformed mesh of obj can change without anything in its
+    fingerprint being edited by the user (armature modifiers and drivers).
+    Results for these objects shouldn't be saved to the disk cache.
+
+    :type obj: bpy.types.Object
+    """
+    if any(m.type == 'ARMATURE' for m in obj.modifiers):
+        return True
+    shapeKeys = getattr(obj.data, "shape_keys", None)
+    return (_hasDrivers(obj) or _hasDrivers(obj.data) or
+            (shapeKeys is not None and _hasDrivers(shapeKeys)))
+
+
+def objectFingerprint(obj):
+    """The same as meshFingerprint but also changes when obj is moved.
+
+    :type obj: bpy.types.Object
+    :returns: hashable tuple
+    """
+    matrix = tuple(round(v, 6) for row in obj.matrix_world for v in row)
+    return meshFingerprint(obj) + (matrix,)
+
+
+def cacheFile(prefix, key, extension=".npy"):
+    """Path of the file in the CrowdMaster cache directory named after key.
+    The directory is next to the .blend file, or in the temp directory if the
+    .blend file hasn't been saved.
+
+    :param key: anything with a repr that is stable between sessions
+    """
+    import bpy
+    if bpy.data.filepath:
+        directory = bpy.path.abspath("//crowdmaster_cache")
+    else:
+        directory = os.path.join(tempfile.gettempdir(), "crowdmaster_cache")
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return os.path.join(directory, prefix + "_" + digest + extension)
+
+
+class FingerprintCache:
+    """Keeps one expensive value per object alive across frames and
+    simulation runs, rebuilding it only when the object's fingerprint
+    changes. Fingerprints are only checked once per frame. Any extra
+    arguments to get are passed on to build and are part of the key."""
+    def __init__(self, build, fingerprint=meshFingerprint):
+        self.build = build
+        self.fingerprint = fingerprint
+        self.items = {}
+        """{(objectName, *args): (fingerprint, value)}"""
+        self.checked = set()
+
+    def get(self, obj, *args):
+        name = (obj.name,) + args
+        if name in self.checked:
+            return self.items[name][1]
+        key = self.fingerprint(obj)
+        if name not in self.items or self.items[name][0] != key:
+            self.items[name] = (key, self.build(obj, *args))
+        self.checked.add(name)
+        return self.items[name][1]
+
+    def fingerprintOf(self, obj):
+        """The fingerprint of obj as of this frame"""
+        self.get(obj)
+        return self.items[(obj.name,)][0]
+
+    def newframe(self):
+        """Fingerprints will be checked again the next time they are used"""
+        self.checked = set()
+
+    def clear(self):
+        self.items = {}
+        self.checked = set()
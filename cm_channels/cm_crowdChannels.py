@@ -34,15 +34,15 @@ class Crowd(Mc):
         sepVec = Vector([0, 0, 0])
         if len(localArea) == 0:
             return sepVec
-        agents = self.sim.agents
+        agents = self.sim.agentList
         for neighbour in localArea:
-            sepVec.x += agents[self.userid].apx - agents[neighbour].apx
-            sepVec.y += agents[self.userid].apy - agents[neighbour].apy
-            sepVec.z += agents[self.userid].apz - agents[neighbour].apz
+            sepVec.x += agents[self.user].apx - agents[neighbour].apx
+            sepVec.y += agents[self.user].apy - agents[neighbour].apy
+            sepVec.z += agents[self.user].apz - agents[neighbour].apz
 
-        z = mathutils.Matrix.Rotation(agents[self.userid].arz, 4, 'Z')
-        y = mathutils.Matrix.Rotation(agents[self.userid].ary, 4, 'Y')
-        x = mathutils.Matrix.Rotation(agents[self.userid].arx, 4, 'X')
+        z = mathutils.Matrix.Rotation(agents[self.user].arz, 4, 'Z')
+        y = mathutils.Matrix.Rotation(agents[self.user].ary, 4, 'Y')
+        x = mathutils.Matrix.Rotation(agents[self.user].arx, 4, 'X')
 
         rotation = x * y * z
         relative = sepVec * rotation
@@ -52,16 +52,16 @@ class Crowd(Mc):
         alnVec = Vector([0, 0, 0])
         if len(localArea) == 0:
             return alnVec
-        agents = self.sim.agents
+        agents = self.sim.agentList
         for neighbour in localArea:
             alnVec.x += agents[neighbour].arx
             alnVec.y += agents[neighbour].ary
             alnVec.z += agents[neighbour].arz
         alnVec /= len(localArea)
 
-        alnVec.x -= agents[self.userid].arx
-        alnVec.y -= agents[self.userid].ary
-        alnVec.z -= agents[self.userid].arz
+        alnVec.x -= agents[self.user].arx
+        alnVec.y -= agents[self.user].ary
+        alnVec.z -= agents[self.user].arz
 
         alnVec.x %= 2*math.pi
         alnVec.y %= 2*math.pi
@@ -85,19 +85,19 @@ class Crowd(Mc):
         cohVec = Vector([0, 0, 0])
         if len(localArea) == 0:
             return cohVec
-        agents = self.sim.agents
+        agents = self.sim.agentList
         for neighbour in localArea:
             cohVec.x += agents[neighbour].apx
             cohVec.y += agents[neighbour].apy
             cohVec.z += agents[neighbour].apz
         cohVec /= len(localArea)
-        cohVec.x -= agents[self.userid].apx
-        cohVec.y -= agents[self.userid].apy
-        cohVec.z -= agents[self.userid].apz
+        cohVec.x -= agents[self.user].apx
+        cohVec.y -= agents[self.user].apy
+        cohVec.z -= agents[self.user].apz
 
-        z = mathutils.Matrix.Rotation(agents[self.userid].arz, 4, 'Z')
-        y = mathutils.Matrix.Rotation(agents[self.userid].ary, 4, 'Y')
-        x = mathutils.Matrix.Rotation(agents[self.userid].arx, 4, 'X')
+        z = mathutils.Matrix.Rotation(agents[self.user].arz, 4, 'Z')
+        y = mathutils.Matrix.Rotation(agents[self.user].ary, 4, 'Y')
+        x = mathutils.Matrix.Rotation(agents[self.user].arx, 4, 'X')
 
         rotation = x * y * z
         relative = cohVec * rotation
@@ -0,0 +1,161 @@
+import math
+
+import numpy
+
+from .cm_masterChannels import MasterChannel as Mc
+from ..libs.ins_vector import relativeVectors
+
+CORNERS = ((0, 0), (1, 0), (0, 1), (1, 1))
+
+
+def cornerWeights(fx, fy):
+    """Bilinear weights of the four corners of a cell, in CORNERS order"""
+    return ((1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy)
+
+
+class DensityGrid:
+    """Agent positions and velocities splatted onto a sparse 2D grid. Only
+    cells that have agents near them are stored."""
+    def __init__(self, resolution, positions, velocities):
+        """
+        :param positions: array of shape (n, 3)
+        :param velocities: array of shape (n, 3)
+        """
+        self.resolution = resolution
+        self.cells = {}
+        """{(i, j): row in self.count and self.velocity}"""
+        self.count = numpy.zeros(0)
+        self.velocity = numpy.zeros((0, 3))
+        """Sum of the weighted velocities in each cell"""
+        if len(positions) == 0:
+            return
+
+        g = positions[:, :2] / resolution
+        base = numpy.floor(g).astype(numpy.int64)
+        fx, fy = (g - base).T
+        weights = numpy.concatenate(cornerWeights(fx, fy))
+        ci = numpy.concatenate([base[:, 0] + di for di, dj in CORNERS])
+        cj = numpy.concatenate([base[:, 1] + dj for di, dj in CORNERS])
+        agent = numpy.tile(numpy.arange(len(positions)), 4)
+
+        iMin = ci.min()
+        jMin = cj.min()
+        span = cj.max() - jMin + 1
+        codes, inverse = numpy.unique((ci - iMin) * span + (cj - jMin),
+                                      return_inverse=True)
+        self.count = numpy.bincount(inverse, weights=weights)
+        self.velocity = numpy.column_stack(
+            [numpy.bincount(inverse, weights=weights * velocities[agent, k])
+             for k in range(3)])
+        keys = zip((codes // span + iMin).tolist(),
+                   (codes % span + jMin).tolist())
+        self.cells = dict(zip(keys, range(len(codes))))
+
+    def sample(self, x, y, exclude=True):
+        """The density, density gradient and mean velocity at (x, y)
+
+        :param exclude: take out the contribution of an agent standing at
+                        (x, y) so agents don't count themselves
+        :returns: (density, (gx, gy), (vx, vy, vz) or None). The mean
+                  velocity includes the agent at (x, y)
+        """
+        res = self.resolution
+        gx = x / res
+        gy = y / res
+        i = int(math.floor(gx))
+        j = int(math.floor(gy))
+        fx = gx - i
+        fy = gy - j
+        weights = cornerWeights(fx, fy)
+
+        count = [0.0] * 4
+        velocity = numpy.zeros(3)
+        for k, (di, dj) in enumerate(CORNERS):
+            row = self.cells.get((i + di, j + dj))
+            if row is not None:
+                count[k] = self.count[row]
+                velocity += weights[k] * self.velocity[row]
+        mass = sum(w * c for w, c in zip(weights, count))
+        meanVelocity = tuple((velocity / mass).tolist()) if mass > 0 else None
+        if exclude:
+            count = [c - w for c, w in zip(count, weights)]
+
+        area = res * res
+        c00, c10, c01, c11 = count
+        density = sum(w * c for w, c in zip(weights, count)) / area
+        gradX = ((c10 - c00) * (1 - fy) + (c11 - c01) * fy) / (area * res)
+        gradY = ((c01 - c00) * (1 - fx) + (c11 - c10) * fx) / (area * res)
+        return max(density, 0.0), (gradX, gradY), meanVelocity
+
+
+class Density(Mc):
+    """How crowded it is around each agent"""
+    def __init__(self, sim):
+        Mc.__init__(self, sim)
+        self.grids = {}
+        """{resolution: DensityGrid} for the current frame"""
+        self.queried = set()
+        self.store = {}
+
+    def splat(self, resolution):
+        positions = numpy.array([tuple(o.location) for o in self.sim.objects],
+                                dtype=float).reshape(-1, 3)
+        velocities = numpy.array([tuple(a.globalVelocity)
+                                  for a in self.sim.agentList],
+                                 dtype=float).reshape(-1, 3)
+        return DensityGrid(resolution, positions, velocities)
+
+    def newframe(self):
+        """All the agents have moved so the grids used this frame are
+        rebuilt, while every agent's position and velocity are in step."""
+        self.grids = {r: self.splat(r) for r in self.queried}
+        self.queried = set()
+
+    def setuser(self, user):
+        self.store = {}
+        Mc.setuser(self, user)
+
+    def calculate(self, resolution):
+        if resolution not in self.store:
+            if resolution not in self.grids:
+                self.grids[resolution] = self.splat(resolution)
+            self.queried.add(resolution)
+            ag = self.agentObject
+            grid = self.grids[resolution]
+            self.store[resolution] = grid.sample(ag.location.x, ag.location.y)
+        return self.store[resolution]
+
+    def relativeRz(self, vector):
+        ag = self.agentObject
+        relative = relativeVectors([vector], [tuple(ag.rotation_euler)])[0]
+        return math.atan2(relative[0], relative[1])/math.pi
+
+    def density(self, resolution):
+        """Agents per unit area"""
+        return self.calculate(resolution)[0]
+
+    def gradient(self, resolution):
+        """How fast the density increases in the direction it increases"""
+        gx, gy = self.calculate(resolution)[1]
+        return math.sqrt(gx**2 + gy**2)
+
+    def gradientRz(self, resolution):
+        """The direction the density increases in"""
+        gx, gy = self.calculate(resolution)[1]
+        if gx == 0 and gy == 0:
+            return None
+        return self.relativeRz((gx, gy, 0))
+
+    def flowSpeed(self, resolution):
+        """The speed of the average agent nearby"""
+        velocity = self.calculate(resolution)[2]
+        if velocity is None:
+            return None
+        return math.sqrt(sum(v**2 for v in velocity))
+
+    def flowRz(self, resolution):
+        """The direction the agents nearby are moving in"""
+        velocity = self.calculate(resolution)[2]
+        if velocity is None or (velocity[0] == 0 and velocity[1] == 0):
+            return None
+        return self.relativeRz(velocity)
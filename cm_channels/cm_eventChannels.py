@@ -0,0 +1,76 @@
+import bpy
+
+import numpy
+
+from .cm_masterChannels import MasterChannel as Mc
+
+
+class Event(Mc):
+    """Which of the events in the scene's event list are happening. The list
+    is compiled when the simulation starts."""
+    def __init__(self, sim):
+        Mc.__init__(self, sim)
+        self.timed = {}
+        """{eventname: {frame: [volume or None]}}"""
+        self.always = {}
+        """{eventname: [volume]} for events that only have a volume"""
+        for e in bpy.context.scene.cm_events.coll:
+            volume = e.volume if e.category != "Time" else None
+            if e.category == "Volume":
+                self.always.setdefault(e.eventname, []).append(volume)
+            else:
+                frames = self.timed.setdefault(e.eventname, {})
+                frames.setdefault(e.time, []).append(volume)
+
+        self.positions = None
+        """Array of shape (n, 3) indexed by agent handle for this frame"""
+        self.inside = {}
+        """{volume: set of handles of the agents inside it} for this frame"""
+        self.happening = {}
+        """{eventname: True or set of handles it is happening for}"""
+
+    def newframe(self):
+        self.positions = None
+        self.inside = {}
+        self.happening = {}
+
+    def agentPositions(self):
+        if self.positions is None:
+            locations = [tuple(o.location) for o in self.sim.objects]
+            self.positions = numpy.array(locations,
+                                         dtype=float).reshape(-1, 3)
+        return self.positions
+
+    def agentsInside(self, volume):
+        """The agents that are inside the bounding box of the volume object
+        (checked for all the agents at once)"""
+        if volume not in self.inside:
+            obj = bpy.data.objects.get(volume)
+            if obj is None:
+                self.inside[volume] = set()
+            else:
+                locations = self.agentPositions()
+                half = numpy.array(tuple(obj.dimensions)) / 2
+                centre = numpy.array(tuple(obj.location))
+                within = numpy.all(numpy.abs(locations - centre) <= half,
+                                   axis=1)
+                self.inside[volume] = set(numpy.flatnonzero(within).tolist())
+        return self.inside[volume]
+
+    def compute(self, eventname):
+        frame = bpy.context.scene.frame_current
+        volumes = (self.timed.get(eventname, {}).get(frame, []) +
+                   self.always.get(eventname, []))
+        if None in volumes:
+            return True
+        result = set()
+        for volume in volumes:
+            result |= self.agentsInside(volume)
+        return result
+
+    def isHappening(self, eventname):
+        """Whether the event is happening this frame for the current agent"""
+        if eventname not in self.happening:
+            self.happening[eventname] = self.compute(eventname)
+        agents = self.happening[eventname]
+        return agents is True or self.user in agents
@@ -0,0 +1,260 @@
+import bpy
+import mathutils
+import math
+import heapq
+
+import numpy
+
+from .cm_masterChannels import MasterChannel as Mc
+from .cm_groundChannels import groundTrees, groupFingerprint, castRays
+
+
+class FlowField:
+    """The distance to a goal and the direction to travel from each cell of
+    a regular grid"""
+    def __init__(self, origin, resolution, distance, direction, goal):
+        self.x0, self.y0 = origin
+        self.resolution = resolution
+        self.distance = distance
+        """array of shape (ny, nx), inf for cells that can't reach the goal"""
+        self.direction = direction
+        """array of shape (ny, nx, 2) of normalised (x, y) directions"""
+        self.goal = goal
+
+    def lookup(self, x, y):
+        """The distance to the goal and direction to move in from (x, y)
+
+        :returns: (distance, (dx, dy)) or None if (x, y) is off the grid or
+                  can't reach the goal
+        """
+        i = int(round((x - self.x0) / self.resolution))
+        j = int(round((y - self.y0) / self.resolution))
+        ny, nx = self.distance.shape
+        if i < 0 or j < 0 or i >= nx or j >= ny:
+            return None
+        dist = self.distance[j, i]
+        if dist == numpy.inf:
+            return None
+        if dist == 0:
+            dx = self.goal[0] - x
+            dy = self.goal[1] - y
+            length = math.sqrt(dx**2 + dy**2)
+            if length == 0:
+                return 0.0, (0.0, 0.0)
+            return length, (dx / length, dy / length)
+        return float(dist), tuple(self.direction[j, i].tolist())
+
+
+STEPS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def gridDistances(walkable, goal, resolution):
+    """Dijkstra from goal over the 8 connected grid of walkable cells. Moving
+    diagonally past the corner of a blocked cell isn't allowed.
+
+    :param walkable: bool array of shape (ny, nx)
+    :param goal: (j, i) cell
+    """
+    ny, nx = walkable.shape
+    walk = walkable.ravel().tolist()
+    dist = [math.inf] * (nx * ny)
+    start = goal[0] * nx + goal[1]
+    dist[start] = 0.0
+    heap = [(0.0, start)]
+    diagonal = math.sqrt(2) * resolution
+    while heap:
+        d, k = heapq.heappop(heap)
+        if d > dist[k]:
+            continue
+        j, i = divmod(k, nx)
+        for dj, di in STEPS:
+            nj = j + dj
+            ni = i + di
+            if nj < 0 or ni < 0 or nj >= ny or ni >= nx:
+                continue
+            n = nj * nx + ni
+            if not walk[n]:
+                continue
+            if dj and di:
+                if not (walk[j * nx + ni] and walk[nj * nx + i]):
+                    continue
+                nd = d + diagonal
+            else:
+                nd = d + resolution
+            if nd < dist[n]:
+                dist[n] = nd
+                heapq.heappush(heap, (nd, n))
+    return numpy.array(dist).reshape(ny, nx)
+
+
+def downhill(distance, walkable):
+    """The direction to the neighbour the distance falls fastest towards for
+    each cell. The same as in gridDistances, diagonal steps past the corner
+    of a blocked cell are skipped. Ties (common with grid distances) go to
+    the neighbour with the biggest drop, which is the diagonal."""
+    ny, nx = distance.shape
+    padded = numpy.full((ny + 2, nx + 2), numpy.inf)
+    padded[1:-1, 1:-1] = distance
+    walk = numpy.zeros((ny + 2, nx + 2), dtype=bool)
+    walk[1:-1, 1:-1] = walkable
+    best = numpy.zeros((ny, nx))
+    bestDrop = numpy.zeros((ny, nx))
+    direction = numpy.zeros((ny, nx, 2))
+    with numpy.errstate(invalid="ignore"):
+        for dj, di in STEPS:
+            neighbour = padded[1 + dj:1 + dj + ny, 1 + di:1 + di + nx]
+            length = math.sqrt(dj**2 + di**2)
+            drop = distance - neighbour
+            slope = drop / length
+            lower = (slope > best + 1e-9) | ((slope > best - 1e-9) &
+                                             (drop > bestDrop))
+            if dj and di:
+                lower &= walk[1 + dj:1 + dj + ny, 1:1 + nx]
+                lower &= walk[1:1 + ny, 1 + di:1 + di + nx]
+            best[lower] = slope[lower]
+            bestDrop[lower] = drop[lower]
+            direction[lower] = (di / length, dj / length)
+    return direction
+
+
+def obstacleBoxes(obstacles):
+    """World space (min, max) corners of the bounding box of each object"""
+    boxes = []
+    for o in obstacles.objects:
+        corners = [o.matrix_world * mathutils.Vector(c) for c in o.bound_box]
+        boxes.append(((min(c.x for c in corners), min(c.y for c in corners)),
+                      (max(c.x for c in corners), max(c.y for c in corners))))
+    return boxes
+
+
+def buildFlowField(goal, ground, obstacles, resolution):
+    """
+    :param goal: (x, y) location of the goal
+    :param ground: bpy group of the objects that can be walked on
+    :param obstacles: bpy group of objects that block the way or None
+    """
+    objects = list(ground.objects)
+    corners = [o.matrix_world * mathutils.Vector(c) for o in objects
+               for c in o.bound_box]
+    x0 = min(c.x for c in corners)
+    y0 = min(c.y for c in corners)
+    top = max(c.z for c in corners) + 1
+    nx = int(math.ceil((max(c.x for c in corners) - x0) / resolution)) + 1
+    ny = int(math.ceil((max(c.y for c in corners) - y0) / resolution)) + 1
+
+    xs, ys = numpy.meshgrid(x0 + numpy.arange(nx) * resolution,
+                            y0 + numpy.arange(ny) * resolution)
+    points = numpy.column_stack((xs.ravel(), ys.ravel(),
+                                 numpy.full(nx * ny, top)))
+    walkable = numpy.zeros(nx * ny, dtype=bool)
+    for o in objects:
+        dist = castRays(groundTrees.get(o), o.matrix_world, points)[0]
+        walkable |= ~numpy.isnan(dist)
+    walkable = walkable.reshape(ny, nx)
+
+    if obstacles is not None:
+        for (minX, minY), (maxX, maxY) in obstacleBoxes(obstacles):
+            i0 = max(int(math.ceil((minX - x0) / resolution)), 0)
+            j0 = max(int(math.ceil((minY - y0) / resolution)), 0)
+            i1 = int(math.floor((maxX - x0) / resolution)) + 1
+            j1 = int(math.floor((maxY - y0) / resolution)) + 1
+            walkable[j0:j1, i0:i1] = False
+
+    gi = min(max(int(round((goal[0] - x0) / resolution)), 0), nx - 1)
+    gj = min(max(int(round((goal[1] - y0) / resolution)), 0), ny - 1)
+    walkable[gj, gi] = True
+
+    distance = gridDistances(walkable, (gj, gi), resolution)
+    return FlowField((x0, y0), resolution, distance,
+                     downhill(distance, walkable), goal)
+
+
+flowFields = {}
+"""{(goal, ground, obstacles, resolution): (fingerprint, FlowField)} kept
+between frames and simulations"""
+
+
+class Flow(Mc):
+    """Steer towards goals around obstacles using precomputed flow fields"""
+    def __init__(self, sim):
+        Mc.__init__(self, sim)
+        self.channels = {}
+        self.checked = set()
+
+    def newframe(self):
+        self.checked = set()
+
+    def field(self, goal, ground, obstacles, resolution):
+        """The flow field for this goal, rebuilt if the goal has moved to a
+        different cell or the ground or obstacles have changed"""
+        key = (goal, ground, obstacles, resolution)
+        if key in self.checked:
+            return flowFields[key][1]
+        goalObj = bpy.context.scene.objects[goal]
+        groundGroup = bpy.data.groups[ground]
+        obstacleGroup = bpy.data.groups[obstacles] if obstacles else None
+        fingerprint = (tuple(round(v / resolution) for v in goalObj.location),
+                       groupFingerprint(groundGroup))
+        if obstacleGroup is not None:
+            fingerprint += (tuple(obstacleBoxes(obstacleGroup)),)
+        if key not in flowFields or flowFields[key][0] != fingerprint:
+            goalLoc = tuple(goalObj.location)[:2]
+            flowFields[key] = (fingerprint,
+                               buildFlowField(goalLoc, groundGroup,
+                                              obstacleGroup, resolution))
+        self.checked.add(key)
+        return flowFields[key][1]
+
+    def retrieve(self, goal, ground, obstacles="", resolution=1.0):
+        """The flow towards goal for the current agent"""
+        key = (goal, ground, obstacles, resolution)
+        if key not in self.channels:
+            self.channels[key] = Channel(self, key)
+        self.channels[key].newuser(self.user)
+        return self.channels[key]
+
+
+class Channel:
+    def __init__(self, flow, key):
+        self.flow = flow
+        self.key = key
+
+        self.store = None
+        self.calcd = False
+
+        self.user = None
+
+    def newuser(self, user):
+        """Called when a new agent is using this channel"""
+        self.user = user
+        self.calcd = False
+
+    def calculate(self):
+        field = self.flow.field(*self.key)
+        ag = self.flow.sim.objects[self.user]
+        self.store = field.lookup(ag.location.x, ag.location.y)
+        if self.store is not None:
+            dist, (dx, dy) = self.store
+
+            z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
+            y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
+            x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
+
+            rotation = x * y * z
+            relative = mathutils.Vector((dx, dy, 0)) * rotation
+
+            self.store = {"rz": math.atan2(relative[0], relative[1])/math.pi,
+                          "dist": dist}
+        self.calcd = True
+
+    @property
+    def rz(self):
+        if not self.calcd:
+            self.calculate()
+        return self.store["rz"] if self.store else None
+
+    @property
+    def dist(self):
+        if not self.calcd:
+            self.calculate()
+        return self.store["dist"] if self.store else None
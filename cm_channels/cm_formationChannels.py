@@ -2,9 +2,16 @@ from .cm_masterChannels import MasterChannel as Mc
 import mathutils
 import math
 
-from ..libs.ins_clustering import clusterMatch
+from .cm_channelCache import FingerprintCache
+from ..libs.ins_assignment import assign
+from ..libs.ins_bpyAdapter import vertexArray
+from ..libs.ins_vector import transformPoints
 
 import bpy
+import numpy
+
+
+formationVertices = FingerprintCache(vertexArray)
 
 
 class Formation(Mc):
@@ -12,15 +19,17 @@ class Formation(Mc):
     def __init__(self, sim):
         Mc.__init__(self, sim)
         self.formations = {}
+        formationVertices.newframe()
 
     def newframe(self):
+        formationVertices.newframe()
         for f in self.formations.values():
             f.newFrame()
 
-    def setuser(self, userid):
+    def setuser(self, user):
         for chan in self.formations.values():
-            chan.newuser(userid)
-        Mc.setuser(self, userid)
+            chan.newuser(user)
+        Mc.setuser(self, user)
 
     def registerOld(self, agent, formID, val):
         """Adds an object that is a formation target"""
@@ -31,14 +40,14 @@ class Formation(Mc):
             if formID not in self.formations:
                 ch = Channel(formID, self.sim)
                 self.formations[formID] = ch
-            self.formations[formID].register(agent.id, val)
+            self.formations[formID].register(agent.handle, val)
 
     def retrieve(self, formID):
         """Dynamic properties"""
         if formID not in self.formations:
             ch = Channel(formID, self.sim)
             ch.register(bpy.data.groups[formID].objects)
-            ch.newuser(self.userid)
+            ch.newuser(self.user)
             self.formations[formID] = ch
         return self.formations[formID]
 
@@ -48,23 +57,28 @@ class Channel:
         self.sim = sim
 
         self.targetObjects = set()
-        self.targets = []
+        self.targets = numpy.zeros((0, 3))
+        self.targetsKey = ()
+        """Changes when any of the target positions change"""
+        self.transformed = {}
+        """{objectName: (matrix, local vertices, world vertices)}"""
         self.formI = formID
 
         self.inpBuffer = []
         self.priority = []
-        self.calcd = {}  # {str: Vector()}
+        self.calcd = {}  # {agent handle: Vector()}
         self.lastCalcd = None  # Store from last frame to reduce jittering
+        self.assigned = {}  # {agent handle: target index} from last calc
 
-        self.userid = ""  # see "newuser" method
+        self.user = None  # see "newuser" method
 
     def register(self, objs):
         """Add a formation target object"""
         self.targetObjects = objs
 
-    def newuser(self, userid):
+    def newuser(self, user):
         """Called when a new agent is using this channel"""
-        self.userid = userid
+        self.user = user
 
     def newFrame(self):
         """Called at the beginning of each new frame.
@@ -81,35 +95,48 @@ class Channel:
         self.priority = new
         self.inpBuffer = []
 
-        self.targets = []
+        parts = []
+        key = []
         for ob in self.targetObjects:
-            wrld = ob.matrix_world
-            self.targets += [wrld*v.co for v in ob.data.vertices]
+            local = formationVertices.get(ob)
+            matrix = tuple(tuple(row) for row in ob.matrix_world)
+            cached = self.transformed.get(ob.name)
+            if cached is None or cached[0] != matrix or cached[1] is not local:
+                world = transformPoints(matrix, local)
+                cached = (matrix, local, world)
+                self.transformed[ob.name] = cached
+            parts.append(cached[2])
+            key.append((ob.name, formationVertices.fingerprintOf(ob), matrix))
+        if parts:
+            self.targets = numpy.concatenate(parts)
+        else:
+            self.targets = numpy.zeros((0, 3))
+        self.targetsKey = tuple(key)
 
     def calculate(self):
-        """Collect data and use clusterMatch to work out pairings"""
-        objs = bpy.data.objects
+        """Collect data and use assign to work out pairings. The pairings
+        from the last calculation are used as a starting point so agents
+        only change target when it helps."""
+        objs = self.sim.objects
 
-        agAccess = lambda x: (objs[x].location.x, objs[x].location.y,
-                              objs[x].location.z)
-        tgAccess = lambda x: (x.x, x.y, x.z)
-        setOfTargets = set([tgAccess(x) for x in self.targets])
+        agents = self.priority[:len(self.targets)]
         if self.lastCalcd:
             # TODO if the same agents are inputed the same result as last time
             #  will be returned. This prevents jittering but may result in
             #  problems in the future.
-            if self.lastCalcd[0] == set(self.priority[:len(self.targets)]) and\
-                    self.lastCalcd[1] == setOfTargets:
+            if self.lastCalcd[0] == frozenset(agents) and\
+                    self.lastCalcd[1] == self.targetsKey:
                 self.calcd = self.lastCalcd[2]
                 return
-        success, pairs = clusterMatch(self.priority[:len(self.targets)],
-                                      self.targets, agAccess, tgAccess)
-        if success:
-            for p in pairs:
-                self.calcd[self.priority[p[0][0]]] = p[1][1]
+        sources = [tuple(objs[a].location) for a in agents]
+        warmStart = [self.assigned.get(a, -1) for a in agents]
+        key = (self.formI, bpy.context.scene.frame_current)
+        result = assign(sources, self.targets, warmStart, key=key).tolist()
+        self.assigned = dict(zip(agents, result))
+        for a, t in self.assigned.items():
+            self.calcd[a] = mathutils.Vector(self.targets[t])
 
-        self.lastCalcd = (set(self.priority[:len(self.targets)]),
-                          setOfTargets, self.calcd)
+        self.lastCalcd = (frozenset(agents), self.targetsKey, self.calcd)
 
     def checkCalcd(self):
         """When a user accesses data decide if anything needs calculating. When
@@ -120,13 +147,13 @@ class Channel:
         is left out. The values from inpBuffer are used to match. If there
         aren't enough target positions enough sources are used from the
         beginning of self.priority."""
-        if self.userid not in self.inpBuffer:
-            self.inpBuffer.append(self.userid)
-        if self.userid in self.calcd:
-            return self.calcd[self.userid]
-        elif self.userid in self.priority[:len(self.targets)]:
+        if self.user not in self.inpBuffer:
+            self.inpBuffer.append(self.user)
+        if self.user in self.calcd:
+            return self.calcd[self.user]
+        elif self.user in self.priority[:len(self.targets)]:
             self.calculate()
-            return self.calcd[self.userid]
+            return self.calcd[self.user]
         else:
             return False
 
@@ -135,11 +162,11 @@ class Channel:
         :type fixedPoint: int
         :param fixedPoint: overrides the cluster matching behaviour so that an
                             agent can always target the same point"""
-        objs = bpy.data.objects
+        objs = self.sim.objects
 
         if fixedPoint < len(self.targets):
-            to = self.targets[fixedPoint]
-            loc = objs[self.userid].location
+            to = mathutils.Vector(self.targets[fixedPoint])
+            loc = objs[self.user].location
             return math.sqrt((loc[0] - to[0])**2 + (loc[1] - to[1])**2 + (loc[2] - to[2])**2)
         else:
             return None
@@ -147,11 +174,11 @@ class Channel:
     @property
     def dist(self):
         """Distance from this agent to the position in formation"""
-        objs = bpy.data.objects
+        objs = self.sim.objects
         to = self.checkCalcd()
 
         if to:
-            loc = objs[self.userid].location
+            loc = objs[self.user].location
             return math.sqrt((loc[0] - to[0])**2 + (loc[1] - to[1])**2 + (loc[2] - to[2])**2)
         else:
             return None
@@ -161,12 +188,12 @@ class Channel:
         :type fixedPoint: int
         :param fixedPoint: overrides the cluster matching behaviour so that an
                             agent can always target the same point"""
-        objs = bpy.data.objects
+        objs = self.sim.objects
 
         if fixedPoint < len(self.targets):
-            to = self.targets[fixedPoint]
+            to = mathutils.Vector(self.targets[fixedPoint])
 
-            ag = objs[self.userid]
+            ag = objs[self.user]
 
             target = to - ag.location
 
@@ -182,11 +209,11 @@ class Channel:
     @property
     def rz(self):
         """Horizontal rotation to be pointing at position in formation"""
-        objs = bpy.data.objects
+        objs = self.sim.objects
         to = self.checkCalcd()
 
         if to:
-            ag = objs[self.userid]
+            ag = objs[self.user]
 
             target = to - ag.location
 
@@ -206,12 +233,12 @@ class Channel:
         :type fixedPoint: int
         :param fixedPoint: overrides the cluster matching behaviour so that an
                             agent can always target the same point"""
-        objs = bpy.data.objects
+        objs = self.sim.objects
 
         if fixedPoint < len(self.targets):
-            to = self.targets[fixedPoint]
+            to = mathutils.Vector(self.targets[fixedPoint])
 
-            ag = objs[self.userid]
+            ag = objs[self.user]
 
             target = to - ag.location
 
@@ -227,11 +254,11 @@ class Channel:
     @property
     def rx(self):
         """Vertical rotation to be pointing at position in formation"""
-        objs = bpy.data.objects
+        objs = self.sim.objects
         to = self.checkCalcd()
 
         if to:
-            ag = objs[self.userid]
+            ag = objs[self.user]
 
             target = to - ag.location
 
@@ -3,7 +3,184 @@ import bpy
 from mathutils import *
 BVHTree = bvhtree.BVHTree
 
+import math
+import os
+import numpy
+
 from .cm_masterChannels import MasterChannel as Mc
+from .cm_channelCache import FingerprintCache, cacheFile, isLiveDeformed
+from .cm_channelCache import objectFingerprint
+
+
+def buildGroundTree(gnd):
+    """BVH tree of gnd in its local space"""
+    return BVHTree.FromObject(gnd, bpy.context.scene)
+
+
+groundTrees = FingerprintCache(buildGroundTree)
+"""BVH trees of ground objects, kept between frames and simulations"""
+
+
+def groupFingerprint(group):
+    """Changes when any object in the ground group is edited or moved. Made
+    from the meshes directly so a cached heightfield can be used without
+    building the BVH trees of the ground."""
+    return tuple((o.name, objectFingerprint(o))
+                 for o in sorted(group.objects, key=lambda o: o.name))
+
+
+class Heightfield:
+    """The height and normal of a ground group sampled on a regular grid"""
+    def __init__(self, origin, resolution, grid):
+        self.x0, self.y0 = origin
+        self.resolution = resolution
+        self.grid = grid
+        """array of shape (ny, nx, 4) of height, normal. NaN for cells that
+        have no ground or more than one layer of ground"""
+
+    def sample(self, x, y):
+        """Bilinear interpolation of the grid at each of (x, y)
+
+        :param x: array of x coordinates
+        :param y: array of y coordinates
+        :returns: (heights, normals) arrays, NaN outside the grid or near
+                  overhangs
+        """
+        gx = (numpy.asarray(x) - self.x0) / self.resolution
+        gy = (numpy.asarray(y) - self.y0) / self.resolution
+        i = numpy.floor(gx).astype(int)
+        j = numpy.floor(gy).astype(int)
+        ny, nx = self.grid.shape[:2]
+        inside = (i >= 0) & (j >= 0) & (i < nx - 1) & (j < ny - 1)
+        i[~inside] = 0
+        j[~inside] = 0
+        fx = (gx - i)[:, None]
+        fy = (gy - j)[:, None]
+        grid = self.grid
+        value = (grid[j, i] * (1 - fx) * (1 - fy) + grid[j, i+1] * fx * (1 - fy) +
+                 grid[j+1, i] * (1 - fx) * fy + grid[j+1, i+1] * fx * fy)
+        value[~inside] = numpy.nan
+        normals = value[:, 1:]
+        with numpy.errstate(invalid="ignore"):
+            normals /= numpy.sqrt((normals**2).sum(axis=1))[:, None]
+        return value[:, 0], normals
+
+
+def castColumn(grounds, top):
+    """The height and normal of the ground below top or None if there is no
+    ground or there is more than one layer of ground.
+
+    :param grounds: [(tree, matrix_world, matrix_world inverted)]
+    """
+    hits = []
+    for tree, matrix, inverse in grounds:
+        rotation = inverse.to_3x3()
+        direction = (rotation * Vector((0, 0, -1))).normalized()
+        start = inverse * top
+        while True:
+            loc, norm, ind, dist = tree.ray_cast(start, direction)
+            if loc is None:
+                break
+            height = (matrix * loc).z
+            if not any(abs(height - h) < 0.0001 for h, n in hits):
+                if hits:
+                    return None
+                normal = (rotation.transposed() * norm).normalized()
+                hits.append((height, normal))
+            start = loc + direction * 0.0001
+    return hits[0] if hits else None
+
+
+def castRays(tree, matrix, points):
+    """Find the ground directly above or below each of points. mathutils has
+    no batch ray cast so this is a loop, but everything around it is done
+    once for all the points.
+
+    :param tree: BVHTree in the local space of matrix
+    :param matrix: matrix_world of the ground object
+    :param points: array of shape (n, 3) in world space
+    :returns: (distance, location, normal, index) arrays. distance is the
+              height above the ground (negative when the ground is above) and
+              NaN where there is no ground
+    """
+    inverse = matrix.inverted()
+    rotation = inverse.to_3x3()
+    down = (rotation * Vector((0, 0, -1))).normalized()
+    up = -down
+
+    inv = numpy.array([tuple(row) for row in inverse])
+    local = points.dot(inv[:3, :3].T) + inv[:3, 3]
+
+    n = len(points)
+    localHits = numpy.full((n, 3), numpy.nan)
+    localNormals = numpy.full((n, 3), numpy.nan)
+    index = numpy.full(n, -1, dtype=int)
+    rayCast = tree.ray_cast
+    for i, p in enumerate(local.tolist()):
+        below = rayCast(p, down)
+        above = rayCast(p, up)
+        if below[0] is None:
+            hit = above
+        elif above[0] is None or below[3] <= above[3]:
+            hit = below
+        else:
+            hit = above
+        if hit[0] is not None:
+            localHits[i] = tuple(hit[0])
+            localNormals[i] = tuple(hit[1])
+            index[i] = hit[2]
+
+    mat = numpy.array([tuple(row) for row in matrix])
+    location = localHits.dot(mat[:3, :3].T) + mat[:3, 3]
+    normal = localNormals.dot(inv[:3, :3])
+    with numpy.errstate(invalid="ignore"):
+        normal /= numpy.sqrt((normal**2).sum(axis=1))[:, None]
+    distance = points[:, 2] - location[:, 2]
+    return distance, location, normal, index
+
+
+def buildHeightfield(group, resolution):
+    """Rasterise group, reusing the cached file if there is one"""
+    objects = list(group.objects)
+    corners = [o.matrix_world * Vector(c) for o in objects for c in o.bound_box]
+    x0 = min(c.x for c in corners)
+    y0 = min(c.y for c in corners)
+    top = max(c.z for c in corners) + 1
+    nx = int(math.ceil((max(c.x for c in corners) - x0) / resolution)) + 1
+    ny = int(math.ceil((max(c.y for c in corners) - y0) / resolution)) + 1
+
+    # Deformed by armatures or drivers so the file could be out of date
+    live = any(isLiveDeformed(o) for o in objects)
+    path = cacheFile("heightfield", (groupFingerprint(group), resolution))
+    if not live and os.path.exists(path):
+        try:
+            grid = numpy.load(path, mmap_mode="r")
+            if grid.shape == (ny, nx, 4):
+                return Heightfield((x0, y0), resolution, grid)
+        except (IOError, ValueError):
+            pass
+
+    grounds = [(groundTrees.get(o), o.matrix_world, o.matrix_world.inverted())
+               for o in objects]
+    grid = numpy.full((ny, nx, 4), numpy.nan, dtype=numpy.float32)
+    for j in range(ny):
+        for i in range(nx):
+            point = Vector((x0 + i * resolution, y0 + j * resolution, top))
+            hit = castColumn(grounds, point)
+            if hit is not None:
+                grid[j, i, 0] = hit[0]
+                grid[j, i, 1:] = hit[1]
+
+    if live:
+        return Heightfield((x0, y0), resolution, grid)
+    with open(path + ".tmp", "wb") as f:
+        numpy.save(f, grid)
+    os.replace(path + ".tmp", path)
+    return Heightfield((x0, y0), resolution, numpy.load(path, mmap_mode="r"))
+
+
+heightfields = FingerprintCache(buildHeightfield, fingerprint=groupFingerprint)
+"""Heightfields of ground groups, memory-mapped from the cache directory"""
 
 
 class Ground(Mc):
@@ -12,75 +189,150 @@ class Ground(Mc):
         Mc.__init__(self, sim)
         self.channels = {}
         self.calced = False
+        groundTrees.newframe()
+        heightfields.newframe()
 
     def newframe(self):
+        groundTrees.newframe()
+        heightfields.newframe()
         for ch in self.channels.values():
             ch.newFrame()
 
-    def setuser(self, userid):
+    def setuser(self, user):
         self.calced = False
-        Mc.setuser(self, userid)
+        Mc.setuser(self, user)
+
+    def retrieve(self, groundGroup, resolution=None):
+        """Return the vertical distance to the nearest ground object
 
-    def retrieve(self, groundGroup):
-        """Return the vertical distance to the nearest ground object"""
-        if groundGroup not in self.channels:
-            self.channels[groundGroup] = Channel(groundGroup, self)
-        self.channels[groundGroup].newuser(self.userid)
-        return self.channels[groundGroup]
+        :param resolution: grid size of the heightfield to use or None to
+                           always ray cast
+        """
+        key = (groundGroup, resolution)
+        if key not in self.channels:
+            self.channels[key] = Channel(groundGroup, self, resolution)
+        self.channels[key].newuser(self.user)
+        return self.channels[key]
 
 
 class Channel:
-    def __init__(self, formID, Ground):
+    def __init__(self, formID, Ground, resolution=None):
         self.Ground = Ground
-        self.groupObjects = bpy.data.groups[formID].objects
+        self.group = bpy.data.groups[formID]
+        self.groupObjects = self.group.objects
+        self.resolution = resolution
 
         self.calcd = False
-        self.groundTrees = {}
-        self.store = {}
 
-        self.userid = ""
+        # The results for each agent are stored in the row of its handle
+        self.distance = numpy.empty(0)
+        self.location = numpy.empty((0, 3))
+        self.normal = numpy.empty((0, 3))
+        self.index = numpy.empty(0, dtype=int)
+        self.done = numpy.empty(0, dtype=bool)
 
-    def newuser(self, userid):
+        self.users = set()
+        """The agents that have used this channel this frame"""
+        self.lastUsers = set()
+        self.batched = False
+
+        self.user = None
+
+    def newuser(self, user):
         """Called when a new agent is using this channel"""
-        self.userid = userid
+        self.user = user
         self.calcd = False
 
     def newFrame(self):
         """Called at the beginning of each new frame"""
-        self.store = {}
         self.calcd = False
-        self.groundTrees = {}
+        self.done[:] = False
+        self.lastUsers = self.users
+        self.users = set()
+        self.batched = False
 
-    def calcground(self):
-        """Called the first time each agent uses the Ground channel"""
-        results = []
-        s = bpy.context.scene.objects[self.userid]
-        for gnd in self.groupObjects:
-            if gnd.name not in self.groundTrees:
-                r = gnd.rotation_euler
-                if r[0] or r[1] or r[2]:
-                    print(gnd.name, "rotation must be applied")
-                    # TODO make ray_cast work with rotation
-                sce = bpy.context.scene
-                self.groundTrees[gnd.name] = BVHTree.FromObject(gnd, sce)
-            point = s.location - gnd.location
-            calcd = self.groundTrees[gnd.name].ray_cast(point, (0, 0, -1))
-            if calcd[0]:
-                results.append(calcd + (1,))
-            calcd = self.groundTrees[gnd.name].ray_cast(point, (0, 0, 1))
-            if calcd[0]:
-                results.append(calcd + (-1,))
-
-        if len(results) > 0:
-            loc, norm, ind, dist, direc = min(results, key=lambda x: x[3])
-            self.store["location"] = loc
-            self.store["normal"] = norm
-            self.store["index"] = ind
-            self.store["distance"] = dist * direc  # direc is +/-1
+    def rows(self, users):
+        """The row of each of users in the result arrays, growing the arrays
+        if there are new agents"""
+        rows = numpy.array(users, dtype=int)
+        size = int(rows.max()) + 1 if len(rows) else 0
+        if size > len(self.distance):
+            extra = max(size, 2 * len(self.distance)) - len(self.distance)
+            self.distance = numpy.concatenate((self.distance,
+                                               numpy.full(extra, numpy.nan)))
+            self.location = numpy.concatenate((self.location,
+                                               numpy.zeros((extra, 3))))
+            self.normal = numpy.concatenate((self.normal,
+                                             numpy.zeros((extra, 3))))
+            self.index = numpy.concatenate((self.index,
+                                            numpy.full(extra, -1, dtype=int)))
+            self.done = numpy.concatenate((self.done,
+                                           numpy.zeros(extra, dtype=bool)))
+        return rows
+
+    def calculate(self, users):
+        """Find the ground for all of users at once"""
+        rows = self.rows(users)
+        O = self.Ground.sim.objects
+        points = numpy.array([tuple(O[u].location) for u in users],
+                             dtype=float).reshape(-1, 3)
+
+        distance = numpy.full(len(users), numpy.nan)
+        location = numpy.zeros((len(users), 3))
+        normal = numpy.zeros((len(users), 3))
+        index = numpy.full(len(users), -1, dtype=int)
 
+        if self.resolution:
+            hf = heightfields.get(self.group, self.resolution)
+            heights, normals = hf.sample(points[:, 0], points[:, 1])
+            found = ~numpy.isnan(heights)
+            distance[found] = points[found, 2] - heights[found]
+            location[found] = points[found]
+            location[found, 2] = heights[found]
+            normal[found] = normals[found]
+        todo = numpy.nonzero(numpy.isnan(distance))[0]
+
+        if len(todo):
+            for gnd in self.groupObjects:
+                tree = groundTrees.get(gnd)
+                d, loc, norm, ind = castRays(tree, gnd.matrix_world,
+                                             points[todo])
+                current = distance[todo]
+                with numpy.errstate(invalid="ignore"):
+                    closer = ~numpy.isnan(d) & (numpy.isnan(current) |
+                                                (abs(d) < abs(current)))
+                better = todo[closer]
+                distance[better] = d[closer]
+                location[better] = loc[closer]
+                normal[better] = norm[closer]
+                index[better] = ind[closer]
+
+        self.distance[rows] = distance
+        self.location[rows] = location
+        self.normal[rows] = normal
+        self.index[rows] = index
+        self.done[rows] = True
+
+    def calcground(self):
+        """Called the first time each agent uses the Ground channel. The
+        first call each frame also finds the ground for every agent that used
+        the channel last frame."""
+        if not self.batched:
+            self.batched = True
+            users = list(self.lastUsers)
+            if self.user not in self.lastUsers:
+                users.append(self.user)
+            self.calculate(users)
+        if self.user >= len(self.done) or not self.done[self.user]:
+            self.calculate([self.user])
+        self.users.add(self.user)
         self.calcd = True
 
     def dh(self):
+        """Height above the ground or None if there is no ground"""
         if not self.calcd:
             self.calcground()
-        return self.store["distance"]
+        dist = self.distance[self.user]
+        if numpy.isnan(dist):
+            return None
+        return float(dist)
@@ -2,7 +2,12 @@ class MasterChannel:
     """The parent class for all the channels"""
     def __init__(self, sim):
         self.sim = sim
+        self.user = None
+        """The handle of the agent using the channel"""
         self.userid = ""
+        """The name of the agent using the channel"""
+        self.agent = None
+        self.agentObject = None
 
     def newframe(self):
         """Override this in child classes if they store data"""
@@ -17,6 +22,13 @@ class MasterChannel:
         """Override this in child classes to define channels"""
         pass
 
-    def setuser(self, userid):
-        """Set up the channel to be used with a new agent"""
-        self.userid = userid
+    def setuser(self, user):
+        """Set up the channel to be used with a new agent
+
+        :param user: the handle of the agent
+        :type user: int"""
+        agent = self.sim.agentList[user]
+        self.user = user
+        self.userid = agent.id
+        self.agent = agent
+        self.agentObject = agent.obj
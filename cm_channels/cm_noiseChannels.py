@@ -1,23 +1,26 @@
 from .cm_masterChannels import MasterChannel as Mc
-import random
+from ..libs import ins_random
 
 
 class Noise(Mc):
-    """Used to generate randomness in a scene"""
+    """Used to generate randomness in a scene. The numbers only depend on the
+    agent, the frame and the key so simulations can be repeated exactly."""
     def __init__(self, sim):
         Mc.__init__(self, sim)
+        self.draws = {}
+        """{key: number of times random has been called} for this agent"""
 
-    def random(self):
+    def setuser(self, user):
+        self.draws = {}
+        Mc.setuser(self, user)
+
+    def random(self, key=""):
         """Returns a random number in range 0-1"""
-        return random.random()
+        draw = self.draws.get(key, 0)
+        self.draws[key] = draw + 1
+        return ins_random.random(self.userid, self.sim.framelast, key, draw)
 
     def agentRandom(self, offset=0):
         """Return a random number that is consistent between frame but can
-        be offset by an integer"""
-        state = random.getstate()
-        random.seed(hash(self.userid) - 1 + offset)
-        # -1 so that this number is different to the first random number
-        # generated on frame 0 (if used) of the simulation
-        result = random.random()
-        random.setstate(state)
-        return result
+        be offset"""
+        return ins_random.random(self.userid, "agentRandom", offset)
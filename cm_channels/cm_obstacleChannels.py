@@ -0,0 +1,293 @@
+import bpy
+import mathutils
+import math
+import os
+
+import numpy
+
+BVHTree = mathutils.bvhtree.BVHTree
+
+from .cm_masterChannels import MasterChannel as Mc
+from .cm_channelCache import objectFingerprint, cacheFile, isLiveDeformed
+from ..libs.ins_vector import relativeVectors, transformPoints
+from ..libs.ins_bpyAdapter import meshVertexArray
+
+
+BRICK = 8
+"""Number of voxels along each side of a brick"""
+
+
+class DistanceField:
+    """The signed distance to the nearest obstacle and its gradient sampled
+    on a voxel grid. Distances are negative inside closed obstacles. Meshes
+    that aren't closed, like walls made of planes, have no inside so the
+    distance to them is always positive. Only the bricks of the grid that
+    are near a surface are stored."""
+    def __init__(self, origin, resolution, index, bricks):
+        self.origin = origin
+        self.resolution = resolution
+        self.index = index
+        """array of shape (nbz, nby, nbx) of the position of each brick in
+        self.bricks, -1 for bricks that are far from every surface"""
+        self.bricks = bricks
+        """array of shape (n, BRICK+1, BRICK+1, BRICK+1, 4) of distance,
+        gradient. Neighbouring bricks share the samples on their faces"""
+
+    def sample(self, point):
+        """Trilinear interpolation of the grid at point
+
+        :returns: (distance, (gx, gy, gz)) or None if point is off the grid
+                  or far from every surface
+        """
+        g = [(p - o) / self.resolution for p, o in zip(point, self.origin)]
+        i, j, k = [int(math.floor(v)) for v in g]
+        if i < 0 or j < 0 or k < 0:
+            return None
+        bi, bj, bk = i // BRICK, j // BRICK, k // BRICK
+        nbz, nby, nbx = self.index.shape
+        if bi >= nbx or bj >= nby or bk >= nbz:
+            return None
+        slot = self.index[bk, bj, bi]
+        if slot < 0:
+            return None
+        li, lj, lk = i - bi * BRICK, j - bj * BRICK, k - bk * BRICK
+        fx, fy, fz = g[0] - i, g[1] - j, g[2] - k
+        weights = (numpy.array([1 - fz, fz])[:, None, None] *
+                   numpy.array([1 - fy, fy])[None, :, None] *
+                   numpy.array([1 - fx, fx])[None, None, :])
+        cube = self.bricks[slot, lk:lk+2, lj:lj+2, li:li+2]
+        value = (cube * weights[..., None]).sum(axis=(0, 1, 2)).tolist()
+        return value[0], tuple(value[1:])
+
+
+def isClosed(polygons):
+    """Whether every edge of polygons is shared by exactly two of them"""
+    edges = numpy.array([(p[i - 1], v) for p in polygons
+                         for i, v in enumerate(p)], dtype=int).reshape(-1, 2)
+    if not len(edges):
+        return False
+    edges.sort(axis=1)
+    keys = edges[:, 0] * (edges.max() + 1) + edges[:, 1]
+    counts = numpy.unique(keys, return_counts=True)[1]
+    return bool((counts == 2).all())
+
+
+def groupGeometry(group):
+    """The world space vertices and polygons of all the meshes in group, with
+    their modifiers applied, and for each polygon whether the mesh it is
+    part of is closed"""
+    scene = bpy.context.scene
+    vertices = []
+    polygons = []
+    closed = []
+    for o in group.objects:
+        if o.type != 'MESH':
+            continue
+        mesh = o.to_mesh(scene, True, 'PREVIEW')
+        try:
+            co = transformPoints(o.matrix_world, meshVertexArray(mesh))
+            faces = [list(p.vertices) for p in mesh.polygons]
+        finally:
+            bpy.data.meshes.remove(mesh)
+        offset = len(vertices)
+        vertices += co.tolist()
+        polygons += [[offset + v for v in p] for p in faces]
+        closed += [isClosed(faces)] * len(faces)
+    return vertices, polygons, numpy.array(closed, dtype=bool)
+
+
+def geometryKey(group, resolution, margin):
+    """Changes when any mesh in group is edited or moved"""
+    return (tuple((o.name,) + objectFingerprint(o) for o in
+                  sorted(group.objects, key=lambda o: o.name)
+                  if o.type == 'MESH'), resolution, margin)
+
+
+def nearBricks(co, polygons, low, resolution, cap, shape):
+    """Which bricks have a cell that is within cap of the bounding box of
+    any of the polygons
+
+    :param co: array of shape (n, 3) of the vertices
+    :param shape: (nbz, nby, nbx) number of bricks along each axis
+    :returns: bool array of shape
+    """
+    flat = numpy.array([v for p in polygons for v in p], dtype=int)
+    starts = numpy.cumsum([0] + [len(p) for p in polygons[:-1]])
+    polyLow = numpy.minimum.reduceat(co[flat], starts, axis=0)
+    polyHigh = numpy.maximum.reduceat(co[flat], starts, axis=0)
+
+    # The cells that have a corner in the box, then the bricks they are in.
+    # Axes are swapped to (z, y, x) to match the grid
+    last = numpy.array(shape) * BRICK - 1
+    cellLow = numpy.floor((polyLow - cap - low) / resolution)[:, ::-1] - 1
+    cellHigh = numpy.ceil((polyHigh + cap - low) / resolution)[:, ::-1]
+    brickLow = (numpy.clip(cellLow, 0, last) // BRICK).astype(int)
+    brickHigh = (numpy.clip(cellHigh, 0, last) // BRICK).astype(int)
+
+    near = numpy.zeros(shape, dtype=bool)
+    # Most polygons are small and only touch up to two bricks along each
+    # axis so those are marked all at once
+    small = numpy.all(brickHigh - brickLow <= 1, axis=1)
+    for offset in numpy.indices((2, 2, 2)).reshape(3, -1).T:
+        b = numpy.minimum(brickLow[small] + offset, brickHigh[small])
+        near[b[:, 0], b[:, 1], b[:, 2]] = True
+    for (z0, y0, x0), (z1, y1, x1) in zip(brickLow[~small].tolist(),
+                                          brickHigh[~small].tolist()):
+        near[z0:z1+1, y0:y1+1, x0:x1+1] = True
+    return near
+
+
+def bakeBricks(tree, closed, near, low, resolution, cap):
+    """Sample the signed distance at every voxel of the near bricks. Points
+    nearest to a polygon of a mesh that isn't closed are always outside.
+
+    :param closed: bool array of whether each polygon of tree is part of a
+                   closed mesh
+    :returns: (index, bricks) as stored in DistanceField
+    """
+    side = BRICK + 1
+    occupied = numpy.argwhere(near)
+    local = numpy.indices((side, side, side)).reshape(3, -1).T
+    voxels = (occupied[:, None, :] * BRICK + local[None]).reshape(-1, 3)
+    # Each sample on a face between bricks is only looked up once
+    dims = numpy.array(near.shape) * BRICK + 1
+    linear = numpy.ravel_multi_index(voxels.T, dims)
+    unique, inverse = numpy.unique(linear, return_inverse=True)
+    zyx = numpy.array(numpy.unravel_index(unique, dims)).T
+    points = low + zyx[:, ::-1] * resolution
+
+    distance = numpy.full(len(points), cap)
+    hits = []
+    nearest = []
+    normals = []
+    faces = []
+    for n, point in enumerate(points.tolist()):
+        loc, normal, index, dist = tree.find_nearest(point, cap)
+        if loc is not None:
+            hits.append(n)
+            nearest.append(tuple(loc) + (dist,))
+            normals.append(tuple(normal))
+            faces.append(index)
+    if hits:
+        hits = numpy.array(hits)
+        nearest = numpy.array(nearest)
+        # The side of the nearest face only tells inside from outside when
+        # the mesh is closed. Behind a plane is still outside.
+        outside = numpy.einsum("ij,ij->i", points[hits] - nearest[:, :3],
+                               numpy.array(normals)) >= 0
+        outside |= ~closed[faces]
+        distance[hits] = numpy.where(outside, nearest[:, 3], -nearest[:, 3])
+
+    distance = distance[inverse].reshape(-1, side, side, side)
+    gz, gy, gx = numpy.gradient(distance, resolution, axis=(1, 2, 3))
+    bricks = numpy.stack((distance, gx, gy, gz),
+                         axis=-1).astype(numpy.float32)
+
+    index = numpy.full(near.shape, -1, dtype=numpy.int32)
+    index[near] = numpy.arange(len(occupied))
+    return index, bricks
+
+
+def bakeDistanceField(group, resolution, margin, key):
+    """Sample the signed distance to the meshes in group in the bricks that
+    are within margin of a surface, reusing the cached file for key if there
+    is one"""
+    live = any(isLiveDeformed(o) for o in group.objects if o.type == 'MESH')
+    path = cacheFile("sdfbricks", key)
+    if not live and os.path.exists(path):
+        try:
+            with numpy.load(path + ".header.npz") as header:
+                origin = tuple(header["origin"].tolist())
+                index = header["index"]
+            bricks = numpy.load(path, mmap_mode="r")
+            return DistanceField(origin, resolution, index, bricks)
+        except (IOError, ValueError, KeyError):
+            pass
+
+    vertices, polygons, closed = groupGeometry(group)
+    if not polygons:
+        return None
+    co = numpy.array(vertices)
+    low = co.min(axis=0) - margin
+    high = co.max(axis=0) + margin
+    cells = numpy.maximum(numpy.ceil((high - low) / resolution), 1)
+    shape = tuple(numpy.ceil(cells / BRICK).astype(int)[::-1].tolist())
+
+    # Sampled a little further than margin so the gradient is right at the
+    # edge of the range
+    cap = margin + resolution * 2
+    near = nearBricks(co, polygons, low, resolution, cap, shape)
+    tree = BVHTree.FromPolygons(vertices, polygons)
+    index, bricks = bakeBricks(tree, closed, near, low, resolution, cap)
+
+    if live:
+        return DistanceField(tuple(low.tolist()), resolution, index, bricks)
+    with open(path + ".header.npz", "wb") as f:
+        numpy.savez(f, origin=low, index=index)
+    with open(path + ".tmp", "wb") as f:
+        numpy.save(f, bricks)
+    os.replace(path + ".tmp", path)
+    return DistanceField(tuple(low.tolist()), resolution, index,
+                         numpy.load(path, mmap_mode="r"))
+
+
+distanceFields = {}
+"""{(group, resolution, margin): (key, DistanceField)} kept between
+simulations"""
+
+
+class Obstacle(Mc):
+    """Distance to and direction away from static obstacles"""
+    def __init__(self, sim):
+        Mc.__init__(self, sim)
+        self.fields = {}
+        """The fields that have been checked for changes this simulation"""
+        self.store = {}
+
+    def setuser(self, user):
+        self.store = {}
+        Mc.setuser(self, user)
+
+    def field(self, group, resolution, margin):
+        """Obstacles are static so the geometry is only checked for changes
+        the first time each field is used in a simulation"""
+        name = (group, resolution, margin)
+        if name not in self.fields:
+            groupObj = bpy.data.groups[group]
+            key = geometryKey(groupObj, resolution, margin)
+            if name not in distanceFields or distanceFields[name][0] != key:
+                field = bakeDistanceField(groupObj, resolution, margin, key)
+                distanceFields[name] = (key, field)
+            self.fields[name] = distanceFields[name][1]
+        return self.fields[name]
+
+    def calculate(self, group, resolution, margin):
+        key = (group, resolution, margin)
+        if key not in self.store:
+            field = self.field(group, resolution, margin)
+            ag = self.agentObject
+            result = None
+            if field is not None:
+                result = field.sample(tuple(ag.location))
+            # The field is sampled a little beyond margin for the gradient
+            if result is not None and result[0] > margin:
+                result = None
+            self.store[key] = result
+        return self.store[key]
+
+    def distance(self, group, resolution, margin):
+        """Signed distance to the nearest obstacle or None if it is further
+        than margin away. Only negative inside closed meshes."""
+        result = self.calculate(group, resolution, margin)
+        return None if result is None else result[0]
+
+    def direction(self, group, resolution, margin):
+        """The direction away from the nearest obstacle, relative to the
+        agent, as (rz, rx)"""
+        result = self.calculate(group, resolution, margin)
+        if result is None or not any(result[1]):
+            return None
+        ag = self.agentObject
+        relative = relativeVectors([result[1]], [tuple(ag.rotation_euler)])[0]
+        return (math.atan2(relative[0], relative[1])/math.pi,
+                math.atan2(relative[2], relative[1])/math.pi)
@@ -3,7 +3,8 @@ import mathutils
 Rotation = mathutils.Matrix.Rotation
 Euler = mathutils.Euler
 import math
-import bmesh
+import numpy
+from bisect import bisect_right
 
 from bpy.props import IntProperty, EnumProperty, CollectionProperty
 from bpy.props import PointerProperty, BoolProperty, StringProperty
@@ -11,6 +12,184 @@ from bpy.props import FloatProperty
 from bpy.types import PropertyGroup, UIList, Panel, Operator
 
 from .cm_masterChannels import MasterChannel as Mc
+from .cm_channelCache import FingerprintCache, objectFingerprint
+from ..libs.ins_vector import rotationArrays
+
+
+class PathGraph:
+    """A path mesh compiled into arrays that are quick to walk along.
+    Everything except the transform matrices is in the local space of the
+    path object."""
+    def __init__(self, obj):
+        mesh = obj.data
+        n = len(mesh.vertices)
+        co = numpy.empty(n * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get("co", co)
+        self.co = co.reshape(n, 3).astype(float)
+
+        edges = numpy.empty(len(mesh.edges) * 2, dtype=numpy.int32)
+        mesh.edges.foreach_get("vertices", edges)
+        edges = edges.reshape(-1, 2)
+
+        # CSR adjacency: the neighbours of vertex i are
+        # indices[indptr[i]:indptr[i+1]]
+        src = numpy.concatenate((edges[:, 0], edges[:, 1]))
+        dst = numpy.concatenate((edges[:, 1], edges[:, 0]))
+        order = numpy.argsort(src, kind="mergesort")
+        src = src[order]
+        self.indices = dst[order]
+        self.indptr = numpy.zeros(n + 1, dtype=int)
+        numpy.cumsum(numpy.bincount(src, minlength=n), out=self.indptr[1:])
+        # The entry for the same edge travelled the other way
+        position = numpy.empty_like(order)
+        position[order] = numpy.arange(len(order))
+        self.reverse = position[(order + len(edges)) % max(len(order), 1)]
+
+        vectors = self.co[self.indices] - self.co[src]
+        self.lengths = numpy.sqrt((vectors**2).sum(axis=1))
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            self.directions = vectors / self.lengths[:, None]
+        self.directions[self.lengths == 0] = 0
+
+        self.buildRoutes()
+
+        self.kd = mathutils.kdtree.KDTree(n)
+        for i, v in enumerate(self.co.tolist()):
+            self.kd.insert(v, i)
+        self.kd.balance()
+
+        self.matrixInverse = obj.matrix_world.inverted()
+
+        z = mathutils.Matrix.Rotation(obj.rotation_euler[2], 4, 'Z')
+        y = mathutils.Matrix.Rotation(obj.rotation_euler[1], 4, 'Y')
+        x = mathutils.Matrix.Rotation(obj.rotation_euler[0], 4, 'X')
+        self.rotation = x * y * z
+
+    def vertex(self, index):
+        return mathutils.Vector(self.co[index].tolist())
+
+    def buildRoutes(self):
+        """Split the path into branches that run between junctions and ends.
+        Each branch is stored as two routes, one for each direction of travel,
+        with a table of the distance along the route to each vertex. Route r
+        is the reverse of route r ^ 1."""
+        degree = numpy.diff(self.indptr).tolist()
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        reverse = self.reverse.tolist()
+        lengths = self.lengths.tolist()
+        visited = [False] * len(indices)
+        firstEntry = []
+
+        self.routes = []
+        """[(vertex indices, distance along the route to each vertex)]"""
+        self.edgeRoute = numpy.empty(len(indices), dtype=int)
+        """The route that each CSR entry is part of"""
+        self.edgePosition = numpy.empty(len(indices), dtype=int)
+        """The position in its route of the vertex each CSR entry leaves"""
+
+        def walk(start, entry):
+            verts = [start]
+            entries = []
+            while True:
+                entries.append(entry)
+                visited[entry] = visited[reverse[entry]] = True
+                current = indices[entry]
+                verts.append(current)
+                if degree[current] != 2 or current == start:
+                    break
+                first = indptr[current]
+                entry = first if first != reverse[entry] else first + 1
+            for vs, es in ((verts, entries),
+                           (verts[::-1], [reverse[e] for e in entries[::-1]])):
+                route = len(self.routes)
+                cumulative = [0.0]
+                for pos, e in enumerate(es):
+                    self.edgeRoute[e] = route
+                    self.edgePosition[e] = pos
+                    cumulative.append(cumulative[-1] + lengths[e])
+                self.routes.append((vs, cumulative))
+                firstEntry.append(es[0])
+
+        for v in range(len(degree)):
+            if degree[v] != 2:
+                for entry in range(indptr[v], indptr[v + 1]):
+                    if not visited[entry]:
+                        walk(v, entry)
+        # Closed loops with no junctions
+        for entry in range(len(indices)):
+            if not visited[entry]:
+                walk(int(self.indptr.searchsorted(entry, "right")) - 1, entry)
+
+        # For the end of each route, the routes that continue from there
+        departures = {}
+        for route, (verts, cumulative) in enumerate(self.routes):
+            departures.setdefault(verts[0], []).append(route)
+        self.exits = []
+        """[(route ids, direction of the first edge of each)]"""
+        for route, (verts, cumulative) in enumerate(self.routes):
+            options = [r for r in departures.get(verts[-1], ()) if r != route ^ 1]
+            firstEdges = [firstEntry[r] for r in options]
+            self.exits.append((options, self.directions[firstEdges]
+                               .reshape(-1, 3)))
+
+    def bestEdge(self, index, direction):
+        """The CSR entry of the edge from index most in line with direction
+
+        :param direction: normalised numpy array
+        :returns: int or None if index has no edges
+        """
+        start, end = self.indptr[index], self.indptr[index + 1]
+        if start == end:
+            return None
+        return int(start + self.directions[start:end].dot(direction).argmax())
+
+    def bestEdges(self, indices, directions):
+        """bestEdge for many vertices and directions at once
+
+        :param indices: array of vertex indices
+        :param directions: array of shape (n, 3) of normalised directions
+        :returns: array of CSR entries, -1 where the vertex has no edges
+        """
+        starts = self.indptr[indices]
+        counts = self.indptr[indices + 1] - starts
+        owner = numpy.repeat(numpy.arange(len(indices)), counts)
+        offsets = numpy.cumsum(counts) - counts
+        entries = starts[owner] + numpy.arange(counts.sum()) - offsets[owner]
+        scores = (self.directions[entries] * directions[owner]).sum(axis=1)
+        order = numpy.lexsort((-scores, owner))
+        result = numpy.full(len(indices), -1, dtype=int)
+        hasEdges = counts > 0
+        result[hasEdges] = entries[order[offsets[hasEdges]]]
+        return result
+
+    def lookahead(self, entry, distance, direction):
+        """The point distance along the path from the start of the edge entry.
+        At junctions the branch most in line with direction is taken.
+
+        :returns: mathutils.Vector
+        """
+        route = int(self.edgeRoute[entry])
+        pos = int(self.edgePosition[entry])
+        verts, cumulative = self.routes[route]
+        travelled = cumulative[pos] + distance
+        while travelled >= cumulative[-1]:
+            options, directions = self.exits[route]
+            if not options or cumulative[-1] == 0:
+                return self.vertex(verts[-1])
+            travelled -= cumulative[-1]
+            route = options[int(directions.dot(direction).argmax())]
+            pos = 0
+            verts, cumulative = self.routes[route]
+        i = min(max(bisect_right(cumulative, travelled, pos) - 1, pos),
+                len(verts) - 2)
+        length = cumulative[i + 1] - cumulative[i]
+        fac = (travelled - cumulative[i]) / length if length else 0
+        return self.vertex(verts[i]) * (1 - fac) + self.vertex(verts[i + 1]) * fac
+
+
+pathGraphs = FingerprintCache(PathGraph, fingerprint=objectFingerprint)
+"""Compiled path objects, kept until the path is edited or moved"""
 
 
 class Path(Mc):
@@ -18,164 +197,114 @@ class Path(Mc):
     def __init__(self, sim):
         Mc.__init__(self, sim)
 
-        self.pathObjectCache = {}
         self.resultsCache = {}
+        self.batches = {}
+        """{pathName: {agent handle: target}} for the current frame"""
+        self.users = {}
+        """{pathName: set(agent handle)} agents that have used each path"""
+        self.lastUsers = {}
+        pathGraphs.newframe()
 
     def newframe(self):
-        self.pathObjectCache = {}
+        pathGraphs.newframe()
+        self.batches = {}
+        self.lastUsers = self.users
+        self.users = {}
 
-    def setuser(self, userid):
-        Mc.setuser(self, userid)
+    def setuser(self, user):
+        Mc.setuser(self, user)
         self.resultsCache = {}
 
     def calcPathData(self, pathObject):
-        if pathObject in self.pathObjectCache:
-            return self.pathObjectCache[pathObject]
-        obj = bpy.context.scene.objects[pathObject]
-        mesh = obj.data
-        size = len(mesh.vertices)
-        kd = mathutils.kdtree.KDTree(size)
-
-        for i, v in enumerate(mesh.vertices):
-            kd.insert(v.co, i)
-
-        kd.balance()
-
-        bm = bmesh.new()
-        bm.from_mesh(mesh)
-
-        bm.verts.ensure_lookup_table()
-
-        pathMatrixInverse = obj.matrix_world.inverted()
-
-        x, y, z = obj.rotation_euler
-        z = mathutils.Matrix.Rotation(obj.rotation_euler[2], 4, 'Z')
-        y = mathutils.Matrix.Rotation(obj.rotation_euler[1], 4, 'Y')
-        x = mathutils.Matrix.Rotation(obj.rotation_euler[0], 4, 'X')
-
-        rotation = x * y * z
-
-        self.pathObjectCache[pathObject] = (kd, bm, pathMatrixInverse, rotation)
-
-        return kd, bm, pathMatrixInverse, rotation
-
-    def followPath(self, bm, co, index, vel, co_find, radius):
-        nVel = vel.normalized()
-        lVel = vel.length
-        next = index
-
-        edges = bm.verts[next].link_edges
-
-        bestScore = -2  # scores in range -1 -> 1 (worst to best)
-        nextVert = None
-
-        for e in edges:
-            otherVert = e.verts[0] if e.verts[0].index != next else e.verts[1]
-            score = (otherVert.co - bm.verts[next].co).normalized().dot(nVel)
-            if score > bestScore:
-                bestScore = score
-                nextVert = otherVert
-
-        if nextVert is None:
+        return pathGraphs.get(bpy.context.scene.objects[pathObject])
+
+    def calcRelativeTargets(self, pathObject, radius, lookahead, users):
+        """Follow the path for all of users at once
+
+        :param users: the handles of the agents
+        :returns: {handle: (x, y, z)} target relative to each agent
+        """
+        O = self.sim.objects
+        graph = self.calcPathData(pathObject)
+        objs = [O[u] for u in users]
+
+        inverse = numpy.array([tuple(row) for row in graph.matrixInverse])
+        rotation = numpy.array([tuple(row) for row in graph.rotation])[:3, :3]
+
+        locations = numpy.array([tuple(o.location) for o in objs])
+        co_find = locations.dot(inverse[:3, :3].T) + inverse[:3, 3]
+        vel = numpy.array([tuple(self.sim.agentList[u].globalVelocity)
+                           for u in users]) * lookahead
+        vel = vel.dot(rotation)
+        lVel = numpy.sqrt((vel**2).sum(axis=1))
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            nVel = numpy.where(lVel[:, None] > 0, vel / lVel[:, None], 0)
+
+        index = numpy.array([graph.kd.find(c)[1] for c in co_find.tolist()],
+                            dtype=int)
+        co = graph.co[index]
+        entries = graph.bestEdges(index, nVel)
+        if (entries == -1).any():
             raise Exception("Invalid mesh")
 
-        ab = nextVert.co - co
+        ab = graph.co[graph.indices[entries]] - co
         ap = co_find - co
-
-        fac = ap.dot(ab) / ab.dot(ab)
-        adjust = fac * ab
-        lVel += ab.length * fac
-        start = co + adjust
-
-        nextIndex = nextVert.index
-
-        while True:
-            currentVert = bm.verts[index].co
-            nextVert = bm.verts[nextIndex].co
-
-            length = (nextVert - currentVert).length
-            if lVel < length:
-                fac = lVel/length
-                target = currentVert * (1 - fac) + nextVert * fac
-                rCorrect = start - co_find
-                offTargetDist = rCorrect.length - radius
-                if offTargetDist > 0:
-                    rCorrect *= (offTargetDist / rCorrect.length)
-                    return target - start + rCorrect
-                    # TODO For variable radius add here AND BELOW!!!!!!!!!!
-                return target - start
-            lVel -= length
-
-            edges = bm.verts[next].link_edges
-            bestScore = -2  # scores in range -1 -> 1 (worst to best)
-            nextCo = nextVert
-            nextVert = None
-
-            endOfPath = True
-            for e in edges:
-                if e.verts[0].index != index and e.verts[1].index != index:
-                    endOfPath = False
-                    otherVert = e.verts[0] if e.verts[0].index != nextIndex else e.verts[1]
-                    score = (otherVert.co - bm.verts[nextIndex].co).normalized().dot(nVel)
-                    if score > bestScore:
-                        bestScore = score
-                        nextVert = otherVert
-            if endOfPath:
-                rCorrect = start - co_find
-                offTargetDist = rCorrect.length - radius
-                target = nextCo
-                if offTargetDist > 0:
-                    rCorrect *= (offTargetDist / rCorrect.length)
-                    return target - start + rCorrect
-                    # Also add here for variable length path
-                return target - start
-
-            index = nextIndex
-            nextIndex = nextVert.index
-
-    def calcRelativeTarget(self, pathObject, radius, lookahead):
-        context = bpy.context
-
-        if pathObject in self.pathObjectCache:
-            kd, bm, pathMatrixInverse, rotation = self.pathObjectCache[pathObject]
-        else:
-            kd, bm, pathMatrixInverse, rotation = self.calcPathData(pathObject)
-
-        vel = self.sim.agents[self.userid].globalVelocity * lookahead
-        vel = vel * rotation
-        co_find = pathMatrixInverse * context.scene.objects[self.userid].location
-        co, index, dist = kd.find(co_find)
-        offset = self.followPath(bm, co, index, vel, co_find, radius)
-
-        offset = offset * pathMatrixInverse
-
-        eul = Euler([-x for x in context.scene.objects[self.userid].rotation_euler], 'ZYX')
-        offset.rotate(eul)
-
-        return offset
+        fac = (ap * ab).sum(axis=1) / (ab * ab).sum(axis=1)
+        start = co + fac[:, None] * ab
+        lVel += numpy.sqrt((ab**2).sum(axis=1)) * fac
+
+        target = numpy.array([tuple(graph.lookahead(e, d, v)) for e, d, v in
+                              zip(entries.tolist(), lVel.tolist(), nVel)])
+        offset = target - start
+
+        rCorrect = start - co_find
+        rLength = numpy.sqrt((rCorrect**2).sum(axis=1))
+        offTargetDist = rLength - radius
+        off = offTargetDist > 0
+        offset[off] += rCorrect[off] * (offTargetDist[off] /
+                                        rLength[off])[:, None]
+        # TODO For variable radius add here
+
+        offset = offset.dot(inverse[:3, :3])
+
+        # Into the local space of each agent
+        eulers = -numpy.array([tuple(o.rotation_euler) for o in objs])
+        offset = numpy.einsum("nij,nj->ni", rotationArrays(eulers), offset)
+
+        return dict(zip(users, map(tuple, offset.tolist())))
+
+    def target(self, pathName):
+        """The target for the current agent relative to its own position and
+        rotation. All the agents that followed this path last frame are
+        worked out together the first time any agent asks this frame."""
+        if pathName in self.resultsCache:
+            return self.resultsCache[pathName]
+        lookahead = 25  # Hard coded for simplicity
+        pathEntry = bpy.context.scene.cm_paths.coll.get(pathName)
+        pathObject = pathEntry.objectName
+        radius = pathEntry.radius
+
+        if pathName not in self.batches:
+            users = [u for u in self.lastUsers.get(pathName, ())
+                     if u != self.user]
+            users.append(self.user)
+            self.batches[pathName] = self.calcRelativeTargets(pathObject,
+                                                              radius,
+                                                              lookahead, users)
+        batch = self.batches[pathName]
+        if self.user not in batch:
+            batch.update(self.calcRelativeTargets(pathObject, radius,
+                                                  lookahead, [self.user]))
+        self.users.setdefault(pathName, set()).add(self.user)
+        self.resultsCache[pathName] = batch[self.user]
+        return self.resultsCache[pathName]
 
     def rz(self, pathName):
-        if pathName in self.resultsCache:
-            target = self.resultsCache[pathName]
-        else:
-            lookahead = 25  # Hard coded for simplicity
-            pathEntry = bpy.context.scene.cm_paths.coll.get(pathName)
-            pathObject = pathEntry.objectName
-            radius = pathEntry.radius
-            target = self.calcRelativeTarget(pathObject, radius, lookahead)
-            self.resultsCache[pathObject] = target
+        target = self.target(pathName)
         return math.atan2(target[0], target[1])/math.pi
 
     def rx(self, pathName):
-        if pathName in self.resultsCache:
-            target = self.resultsCache[pathName]
-        else:
-            lookahead = 25  # Hard coded for simplicity
-            pathEntry = bpy.context.scene.cm_paths.coll.get(pathName)
-            pathObject = pathEntry.objectName
-            radius = pathEntry.radius
-            target = self.calcRelativeTarget(pathObject, radius, lookahead)
-            self.resultsCache[pathObject] = target
+        target = self.target(pathName)
         return math.atan2(target[2], target[1])/math.pi
 
 
@@ -2,11 +2,10 @@ from .cm_masterChannels import MasterChannel as Mc
 import math
 import mathutils
 Vector = mathutils.Vector
+import numpy
 
 from ..libs import ins_octree as ot
 
-import bpy
-
 
 class Sound(Mc):
     """The object containing all of the sound channels"""
@@ -20,7 +19,7 @@ class Sound(Mc):
         if frequency not in self.channels:
             ch = Channel(frequency, self.sim)
             self.channels[frequency] = ch
-        self.channels[frequency].register(agent.id, val)
+        self.channels[frequency].register(agent.handle, val)
 
     def retrieve(self, freq):
         """Get sound channel"""
@@ -32,10 +31,10 @@ class Sound(Mc):
     def newframe(self):
         self.channels = {}
 
-    def setuser(self, userid):
+    def setuser(self, user):
         for chan in self.channels.values():
-            chan.newuser(userid)
-        Mc.setuser(self, userid)
+            chan.newuser(user)
+        Mc.setuser(self, user)
 
 
 class Channel:
@@ -50,172 +49,234 @@ class Channel:
         self.emitters = []
         self.frequency = frequency
         # Temporary storage which is reset after each agents has used it
-        self.store = {}
-        self.storePrediction = {}
-        self.storeSteering = {}
+        self.results = {}  # {mode: SoundResult} - modes calculated for user
+        self.views = {}  # {(mode, property): dict} - given to the brain
+
+        # Geometry shared by both agents of a pair. {(user, emitterid): {}}
+        # These are only reset at the end of the frame
+        self.predictionPairs = {}
+        self.steeringPairs = {}
+        # Every agent's position and velocity at the start of the frame. The
+        # pairs are worked out from these so the results don't depend on the
+        # order the agents are evaluated in. Only made for prediction and
+        # steering (see def snapshot).
+        self.startPositions = None
+        self.startVelocities = None
 
         self.predictNext = False
         self.steeringNext = False
+        # Used in basic mode to summarise far away groups of emitters
+        self.aggregateNext = False
+        self.accuracy = 0.5
+        self.aggregateTree = None  # type: ot.AggregateOctree
 
         self.kdtree = None
         self.maxVal = 0
+        # Set up at the same time as the kdtree
+        self.emitterLocs = None  # numpy array of shape (len(emitters), 3)
+        self.emitterVals = None  # numpy array of shape (len(emitters),)
+        self.emitterIndex = {}  # {emitterid: index into self.emitters}
 
     def register(self, objectid, val):
-        """Add an object that emits sound"""
+        """Add an agent that emits sound
+
+        :param objectid: the handle of the agent"""
         self.emitters.append((objectid, val))
 
-    def newuser(self, userid):
-        self.userid = userid
-        self.store = {}
-        self.storePrediction = {}
-        self.storeSteering = {}
+    def newuser(self, user):
+        self.user = user
+        self.results = {}
+        self.views = {}
 
-    def calculate(self):
-        """Called the first time an agent uses this frequency"""
-        O = bpy.context.scene.objects
+    def buildKDTree(self):
+        """Index the emitters for this frame"""
+        O = self.sim.objects
 
-        if self.kdtree is None:
-            self.kdtree = mathutils.kdtree.KDTree(len(self.emitters))
-            for i, item in enumerate(self.emitters):
-                emitterid, val = item
-                self.maxVal = max(self.maxVal, val)
-                self.kdtree.insert(O[emitterid].location, i)
+        self.kdtree = mathutils.kdtree.KDTree(len(self.emitters))
+        locs = []
+        for i, item in enumerate(self.emitters):
+            emitterid, val = item
+            self.maxVal = max(self.maxVal, val)
+            loc = O[emitterid].location
+            self.kdtree.insert(loc, i)
+            locs.append(tuple(loc))
+            self.emitterIndex[emitterid] = i
 
-            self.kdtree.balance()
+        self.kdtree.balance()
 
-        ag = O[self.userid]
+        self.emitterLocs = numpy.array(locs, dtype=float).reshape(-1, 3)
+        self.emitterVals = numpy.array([v for e, v in self.emitters],
+                                       dtype=float)
 
-        collisions = self.kdtree.find_range(ag.location, self.maxVal)
+    def calculate(self):
+        """Called the first time an agent uses this frequency"""
+        if self.kdtree is None:
+            self.buildKDTree()
 
-        for (co, index, dist) in collisions:
-            emitterid, val = self.emitters[index]
-            if emitterid == self.userid:
-                continue
-            if dist <= val:
-                to = O[emitterid]
-
-                target = to.location - ag.location
-
-                z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
-                y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
-                x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
-
-                rotation = x * y * z
-                relative = target * rotation
-
-                changez = math.atan2(relative[0], relative[1])/math.pi
-                changex = math.atan2(relative[2], relative[1])/math.pi
-                self.store[emitterid] = {"rz": changez,
-                                         "rx": changex,
-                                         "distProp": dist/val}
-
-    # Octree implementation
-    """O = bpy.context.scene.objects
-    userDim = self.sim.agents[self.userid].dimensions
-    if self.octree is None:
-        bss = []  # List of bounding spheres
-        for emitterid, val in self.emitterDict.items():
-            emitDim = self.sim.agents[emitterid].dimensions
-            dim = (val + emitDim[a] + userDim[a] for a in range(3))
-            bss.append(ot.boundingSphereFromBPY(O[emitterid], dim))
-        self.octree = ot.createOctree(bss)
-    ag = O[self.userid]
-    collisions = self.octree.checkPoint(ag.location.to_tuple())
-    for emitterid in collisions:
-        if emitterid == self.userid:
-            continue
-        to = O[emitterid]
-        val = self.emitterDict[emitterid]
-        eDim = max(self.sim.agents[emitterid].dimensions)
-        uDim = max(userDim)
-        difx = to.location.x - ag.location.x
-        dify = to.location.y - ag.location.y
-        difz = to.location.z - ag.location.z
-        dist = math.sqrt(difx**2 + dify**2 + difz**2)
-        target = to.location - ag.location
-        z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
-        y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
-        x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
-        rotation = x * y * z
-        relative = target * rotation
-        changez = math.atan2(relative[0], relative[1])/math.pi
-        changex = math.atan2(relative[2], relative[1])/math.pi
-        self.store[emitterid] = {"rz": changez,
-                                 "rx": changex,
-                                 "distProp": dist/(val+eDim+uDim)}"""
-        # (z rot, x rot, dist proportion, time until prediction)"""
-
-    # The old implementation not using octree
-    """ag = O[self.userid]
-    for emitterid, val in self.emitters.items():
-        if emitterid != self.userid:
-            to = O[emitterid]
-            difx = to.location.x - ag.location.x
-            dify = to.location.y - ag.location.y
-            difz = to.location.z - ag.location.z
-            dist = math.sqrt(difx**2 + dify**2 + difz**2)
-            if dist <= val:
-                target = to.location - ag.location
-                z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
-                y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
-                x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
-                rotation = x * y * z
-                relative = target * rotation
-                changez = math.atan2(relative[0], relative[1])/math.pi
-                changex = math.atan2(relative[2], relative[1])/math.pi
-                self.store[emitterid] = (changez, changex, 1-(dist/val), 1)
-                # (z rot, x rot, dist proportion, time until prediction)"""
+        ag = self.sim.objects[self.user]
 
-    def calculatePrediction(self):
-        """Called the first time an agent uses this frequency"""
-        ag = O[self.userid]
-        agSim = self.sim.agents[self.userid]
-        for emitterid, val in self.emitters:
-            if emitterid != self.userid:
-                toSim = self.sim.agents[emitterid]
+        collisions = self.kdtree.find_range(ag.location, self.maxVal)
 
-                p1 = mathutils.Vector((agSim.apx, agSim.apy, agSim.apz))
-                p2 = mathutils.Vector((toSim.apx, toSim.apy, toSim.apz))
+        count = len(collisions)
+        index = numpy.fromiter((c[1] for c in collisions), int, count)
+        dist = numpy.fromiter((c[2] for c in collisions), float, count)
+        vals = self.emitterVals[index]
 
-                d1 = mathutils.Vector(agSim.globalVelocity)
-                d2 = mathutils.Vector(toSim.globalVelocity)
+        inRange = dist <= vals
+        inRange &= index != self.emitterIndex.get(self.user, -1)
+        index = index[inRange]
+        dist = dist[inRange]
+        vals = vals[inRange]
 
-                a = d1.dot(d1)
-                b = d1.dot(d2)
-                e = d2.dot(d2)
+        # All the neighbours are moved into the frame of the agent at once
+        target = self.emitterLocs[index] - numpy.array(ag.location)
+        rotation = numpy.array(self._userRotation(ag).to_3x3())
+        relative = target.dot(rotation)
 
-                d = a*e - b*b
+        changez = numpy.arctan2(relative[:, 0], relative[:, 1])/math.pi
+        changex = numpy.arctan2(relative[:, 2], relative[:, 1])/math.pi
 
-                if d != 0:  # If the two lines are not parallel.
-                    r = p1 - p2
-                    c = d1.dot(r)
-                    f = d2.dot(r)
+        ids = [self.emitters[i][0] for i in index.tolist()]
+        return SoundResult(ids, {"rz": changez,
+                                 "rx": changex,
+                                 "distProp": dist/vals})
 
-                    s = (b*f - c*e) / d
-                    t = (a*f - b*c) / d
-                    # t*d2 == closest point
-                    # s*d2 == point 2 is at when 1 is at closest approach
-                    pd1 = p1 + (s*d1)
-                    pd2 = p2 + (s*d2)
-                    dist = (pd1 - pd2).length
-                else:
-                    dist = float("inf")
+    def calculateAggregate(self):
+        """Called the first time an agent uses this frequency with
+        aggregation turned on. Groups of emitters that are far away compared
+        to their size are heard as a single emitter at their weighted centre
+        which is as loud as all of them together."""
+        if self.kdtree is None:
+            self.buildKDTree()
+        if self.aggregateTree is None:
+            self.aggregateTree = ot.createAggregateOctree(
+                self.emitterLocs.tolist(), self.emitterVals.tolist())
+
+        ag = self.sim.objects[self.user]
+        agLoc = numpy.array(ag.location)
+
+        singles, groups = self.aggregateTree.query(tuple(ag.location),
+                                                   theta=self.accuracy)
+
+        index = numpy.array(singles, dtype=int)
+        index = index[index != self.emitterIndex.get(self.user, -1)]
+        dist = numpy.linalg.norm(self.emitterLocs[index] - agLoc, axis=1)
+        inRange = dist <= self.emitterVals[index]
+        index = index[inRange]
+
+        # Each group is heard as an emitter with the range of the loudest
+        #  member and is labelled as the member closest to its centre.
+        groupLocs = numpy.array([g.centreOfMass for g in groups],
+                                dtype=float).reshape(-1, 3)
+        groupVals = numpy.array([g.maxWeight for g in groups], dtype=float)
+        groupCounts = numpy.array([g.count for g in groups], dtype=float)
+        groupIndex = numpy.array([g.representative for g in groups],
+                                 dtype=int)
+        groupDist = numpy.linalg.norm(groupLocs - agLoc, axis=1)
+        inRange = groupDist <= groupVals
+
+        locs = numpy.concatenate((self.emitterLocs[index],
+                                  groupLocs[inRange]))
+        vals = numpy.concatenate((self.emitterVals[index],
+                                  groupVals[inRange]))
+        counts = numpy.concatenate((numpy.ones(len(index)),
+                                    groupCounts[inRange]))
+        index = numpy.concatenate((index, groupIndex[inRange]))
+
+        target = locs - agLoc
+        dist = numpy.linalg.norm(target, axis=1)
+        rotation = numpy.array(self._userRotation(ag).to_3x3())
+        relative = target.dot(rotation)
+
+        changez = numpy.arctan2(relative[:, 0], relative[:, 1])/math.pi
+        changex = numpy.arctan2(relative[:, 2], relative[:, 1])/math.pi
+
+        ids = [self.emitters[i][0] for i in index.tolist()]
+        return SoundResult(ids, {"rz": changez,
+                                 "rx": changex,
+                                 "distProp": dist/vals,
+                                 "count": counts})
 
-                # pd1 and pd2 are the positions the agents will be when they
-                #  make their closest approach
-                if dist <= val:
-                    target = pd2 - pd1
+    def _userRotation(self, ag):
+        """The rotation used to move world vectors into the frame of ag"""
+        z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
+        y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
+        x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
+        return x * y * z
+
+    def snapshot(self):
+        """Fill in self.startPositions and self.startVelocities the first
+        time they are needed this frame. Objects aren't moved and
+        startVelocity isn't changed until every agent has stepped, so they
+        are the same whenever this is called."""
+        if self.startPositions is None:
+            self.startPositions = [Vector(o.location)
+                                   for o in self.sim.objects]
+            self.startVelocities = [a.startVelocity
+                                    for a in self.sim.agentList]
+
+    def _predictionPair(self, user, emitterid):
+        """Work out the closest approach of two agents. The results for both
+        orderings of the pair are stored in self.predictionPairs so that the
+        second agent of the pair doesn't have to repeat the calculation."""
+        self.snapshot()
+        p1 = self.startPositions[user]
+        p2 = self.startPositions[emitterid]
+
+        d1 = self.startVelocities[user]
+        d2 = self.startVelocities[emitterid]
+
+        a = d1.dot(d1)
+        b = d1.dot(d2)
+        e = d2.dot(d2)
+
+        d = a*e - b*b
+
+        if d != 0:  # If the two lines are not parallel.
+            r = p1 - p2
+            c = d1.dot(r)
+            f = d2.dot(r)
+
+            s = (b*f - c*e) / d
+            t = (a*f - b*c) / d
+            # t*d2 == closest point
+            # s*d2 == point 2 is at when 1 is at closest approach
+            # Swapping the agents over swaps s and t
+            pd1 = p1 + (s*d1)
+            pd2 = p2 + (s*d2)
+            self.predictionPairs[(user, emitterid)] = {
+                "dist": (pd1 - pd2).length, "target": pd2 - pd1,
+                "s": s, "t": t}
+            pd1 = p1 + (t*d1)
+            pd2 = p2 + (t*d2)
+            self.predictionPairs[(emitterid, user)] = {
+                "dist": (pd1 - pd2).length, "target": pd1 - pd2,
+                "s": t, "t": s}
+        else:
+            self.predictionPairs[(user, emitterid)] = None
+            self.predictionPairs[(emitterid, user)] = None
 
-                    z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
-                    y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
-                    x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
+    def calculatePrediction(self):
+        """Called the first time an agent uses this frequency"""
+        ag = self.sim.objects[self.user]
+        rotation = self._userRotation(ag)
+        result = SoundResult.collect(("rz", "rx", "distProp", "cert"))
+        for emitterid, val in self.emitters:
+            if emitterid != self.user:
+                key = (self.user, emitterid)
+                if key not in self.predictionPairs:
+                    self._predictionPair(self.user, emitterid)
+                pair = self.predictionPairs[key]
 
-                    rotation = x * y * z
-                    relative = target * rotation
+                # pair["target"] is the vector between the positions the
+                #  agents will be at when they make their closest approach
+                if pair is not None and pair["dist"] <= val:
+                    relative = pair["target"] * rotation
 
                     changez = math.atan2(relative[0], relative[1])/math.pi
                     changex = math.atan2(relative[2], relative[1])/math.pi
-                    if (s < 1) or (t < 1):
+                    s = pair["s"]
+                    if (s < 1) or (pair["t"] < 1):
                         cert = 0
                     else:
                         if s > 32:
@@ -224,230 +285,276 @@ class Channel:
                             c = s / 32
                         cert = (1 - ((-(c**3)/3 + (c**2)/2) * 6))**2
                         # https://www.desmos.com/calculator/godi4zejgd
-                    self.storePrediction[emitterid] = {"rz": changez,
-                                                       "changex": changex,
-                                                       "distProp": dist/val,
-                                                       "cert": cert}
+                    result.append(emitterid, changez, changex,
+                                  pair["dist"]/val, cert)
                     # (z rot, x rot, dist proportion, time until prediction)
+        return result.build()
 
-    def calculateSteering(self):
-        """Called the first time an agent uses this frequency"""
+    def _steeringPair(self, user, emitterid):
+        """Work out if and when two agents are going to collide. Everything
+        apart from the direction of the target is the same for both agents so
+        the results for both orderings are stored in self.steeringPairs."""
         MAXLOOKAHEAD = 64
-        O = bpy.data.objects
+        self.snapshot()
 
-        ag = O[self.userid]
-        agSim = self.sim.agents[self.userid]
+        agSim = self.sim.agentList[user]
+        toSim = self.sim.agentList[emitterid]
 
-        for emitterid, val in self.emitters.items():
-            if emitterid == self.userid:
-                continue
-            to = O[emitterid]
-            toSim = self.sim.agents[emitterid]
+        rx = agSim.radius
+        vx = self.startVelocities[user]
+        px = self.startPositions[user]
 
-            x = ag
-            rx = agSim.radius
-            vx = mathutils.Vector(agSim.globalVelocity)
-            px = x.location
+        ry = toSim.radius
+        vy = self.startVelocities[emitterid]
+        py = self.startPositions[emitterid]
 
-            y = to
-            ry = toSim.radius
-            vy = mathutils.Vector(toSim.globalVelocity)
-            py = y.location
+        a = (vx - vy).length**2
 
-            a = (vx - vy).length**2
+        b = 2*(px[0] - py[0])*(vx[0] - vy[0]) +\
+            2*(px[1] - py[1])*(vx[1] - vy[1]) +\
+            2*(px[2] - py[2])*(vx[2] - vy[2])
 
-            b = 2*(px[0] - py[0])*(vx[0] - vy[0]) +\
-                2*(px[1] - py[1])*(vx[1] - vy[1]) +\
-                2*(px[2] - py[2])*(vx[2] - vy[2])
+        c = (px - py).length**2 - (rx + ry)**2
 
-            c = (px - py).length**2 - (rx + ry)**2
+        """Calculate the time at which the agents will be at their closest
+        and the distance between at that time"""
+        if a == 0:
+            tc = 0
+        else:
+            tc = -b/(2*a)  # Time that they are closest
 
-            """Calculate the time at which the agents will be at their closest
-            and the distance between at that time"""
-            if a == 0:
-                tc = 0
-            else:
-                tc = -b/(2*a)  # Time that they are closest
+        xc = px + tc * vx
+        yc = py + tc * vy
 
-            xc = px + tc * vx
-            yc = py + tc * vy
+        distTmp = (xc - yc).length
+        dist = distTmp - (rx + ry)
+        dist = max(dist, 0)  # The distance can't be negative
 
-            distTmp = (xc - yc).length
-            dist = distTmp - (agSim.radius + toSim.radius)
-            dist = max(dist, 0)  # The distance can't be negative
+        pair = {"collides": False, "target": None, "dist": dist, "tc": tc}
 
-            """Check if they actually collide"""
-            det = b**2 - 4*a*c
-            if det > 0:
-                t0 = (-b - det**0.5)/(2*a)
-                t1 = (-b + det**0.5)/(2*a)
-                if t0 >= 0 or t1 >= 0:
-                    x0 = px + t0 * vx
-                    x1 = px + t1 * vx
+        """Check if they actually collide"""
+        det = b**2 - 4*a*c
+        if det > 0:
+            t0 = (-b - det**0.5)/(2*a)
+            t1 = (-b + det**0.5)/(2*a)
+            if t0 >= 0 or t1 >= 0:
+                x0 = px + t0 * vx
+                x1 = px + t1 * vx
 
-                    y0 = py + t0 * vy
-                    y1 = py + t1 * vy
+                y0 = py + t0 * vy
+                y1 = py + t1 * vy
 
-                    target = y0 - x0 + y1 - x1
-                    target.normalize()
-                    target *= (rx + ry)
+                target = y0 - x0 + y1 - x1
+                target.normalize()
+                target *= (rx + ry)
 
-                    z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
-                    y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
-                    x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
+                if t1 < 0:
+                    # collision in the past
+                    cert = 0
+                elif t0 < 0:
+                    # currently colliding
+                    cert = 1
+                else:
+                    # collision in the future
+                    if t0 > MAXLOOKAHEAD:
+                        c = 1
+                    else:
+                        c = t0 / MAXLOOKAHEAD
+                    cert = (1 - ((-(c**3)/3 + (c**2)/2) * 6))**2
+                    # https://www.desmos.com/calculator/godi4zejgd
 
-                    rotation = x * y * z
-                    relative = target * rotation
+                pair["collides"] = True
+                pair["target"] = target
+                pair["overlap"] = 1 - (distTmp / (rx + ry))
+                pair["cert"] = cert
+            else:
+                # Collision is entirely in the past
+                pair = None
+        elif tc >= 0:
+            target = yc - xc
+            target.normalize()
+            target *= (rx + ry)
+            pair["target"] = target
+        else:
+            pair = None
 
-                    changez = relative[0] / (abs(relative[0]) + 1)
-                    changex = relative[2] / (abs(relative[2]) + 1)
+        self.steeringPairs[(user, emitterid)] = pair
+        if pair is None:
+            self.steeringPairs[(emitterid, user)] = None
+        else:
+            reverse = dict(pair)
+            reverse["target"] = -pair["target"]
+            self.steeringPairs[(emitterid, user)] = reverse
 
-                    acc = relative[1] / (abs(relative[1]) + 1)
+    def calculateSteering(self):
+        """Called the first time an agent uses this frequency"""
+        ag = self.sim.objects[self.user]
+        rotation = self._userRotation(ag)
+        result = SoundResult.collect(("rz", "rx", "distProp", "acc",
+                                      "overlap", "cert"))
 
-                    overlap = 1 - (distTmp / (rx + ry))
+        for emitterid, val in self.emitters:
+            if emitterid == self.user:
+                continue
+            key = (self.user, emitterid)
+            if key not in self.steeringPairs:
+                self._steeringPair(self.user, emitterid)
+            pair = self.steeringPairs[key]
+            if pair is None:
+                continue
 
-                    if t1 < 0:
-                        # collision in the past
-                        cert = 0
-                    elif t0 < 0:
-                        # currently colliding
-                        cert = 1
-                    else:
-                        # collision in the future
-                        if t0 > MAXLOOKAHEAD:
-                            c = 1
-                        else:
-                            c = t0 / MAXLOOKAHEAD
-                        cert = (1 - ((-(c**3)/3 + (c**2)/2) * 6))**2
-                        # https://www.desmos.com/calculator/godi4zejgd
+            if pair["collides"]:
+                relative = pair["target"] * rotation
 
-                    self.storeSteering[emitterid] = {"rz": changez,
-                                                     "rx": changex,
-                                                     "distProp": 0,
-                                                     "acc": acc,
-                                                     "overlap": overlap,
-                                                     "cert": cert}
+                changez = relative[0] / (abs(relative[0]) + 1)
+                changex = relative[2] / (abs(relative[2]) + 1)
 
-                    # (z rot, x rot, dist proportion, recommended acceleration)
-            elif dist < val and tc >= 0:
-                target = yc - xc
-                target.normalize()
-                target *= (rx + ry)
+                acc = relative[1] / (abs(relative[1]) + 1)
 
-                z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
-                y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
-                x = mathutils.Matrix.Rotation(ag.rotation_euler[0], 4, 'X')
+                result.append(emitterid, changez, changex, 0, acc,
+                              pair["overlap"], pair["cert"])
 
-                rotation = x * y * z
-                relative = target * rotation
+                # (z rot, x rot, dist proportion, recommended acceleration)
+            elif pair["dist"] < val:
+                relative = pair["target"] * rotation
 
                 changez = relative[0] / (abs(relative[0]) + 1)
                 changex = relative[2] / (abs(relative[2]) + 1)
 
-                dstp = dist/val  # distance proportion 1-0
-
-                if tc < 0:
-                    # collision in the past
-                    cert = 0  # this is never used!
-                else:
-                    # collision in the future
-                    if tc > MAXLOOKAHEAD:
-                        c = 1
-                    else:
-                        c = tc / MAXLOOKAHEAD
-                    cert = (1 - ((-(c**3)/3 + (c**2)/2) * 6))**2  # this is never used
-                    # https://www.desmos.com/calculator/godi4zejgd
+                dstp = pair["dist"]/val  # distance proportion 1-0
 
-                self.storeSteering[emitterid] = {"rz": changez,
-                                                 "rx": changex,
-                                                 "distProp": dstp,
-                                                 "acc": 0,
-                                                 "overlap": 0,
-                                                 "cert": 0}
+                result.append(emitterid, changez, changex, dstp, 0, 0, 0)
                 # (z rot, x rot, dist proportion, recommended acceleration)
+        return result.build()
+
+    def currentMode(self):
+        """The mode that was set by the last node to use this channel"""
+        if self.predictNext:
+            return "PREDICTION"
+        elif self.steeringNext:
+            return "STEERING"
+        elif self.aggregateNext:
+            return ("AGGREGATE", self.accuracy)
+        return "BASIC"
 
     def calcAndGetItems(self):
-        # TODO this gets called for both the sender and the receiver but I
-        #   think it always calculates the same results...
-        """If this channel hasn't been used then calculate and then return the
-        correct values to use"""
-        pre = self.predictNext
-        ste = self.steeringNext
-        if pre:
-            # TODO if the dictionary is empty then this evaluates to false
-            if not self.storePrediction:
-                self.calculatePrediction()
-            items = self.storePrediction.items()
-        elif ste:
-            # TODO if the dictionary is empty then this evaluates to false
-            if not self.storeSteering:
-                self.calculateSteering()
-            items = self.storeSteering.items()
-        else:
-            # TODO if the dictionary is empty then this evaluates to false
-            if not self.store:
-                self.calculate()
-            items = self.store.items()
-        return items
-
-    @staticmethod
-    def _buildDictFromProperty(dictionary, prop, default=0):
-        return {k: v[prop] if prop in v else default for k, v in dictionary}
+        """If this channel hasn't been used in the current mode by this agent
+        then calculate and then return the correct values to use"""
+        mode = self.currentMode()
+        if mode not in self.results:
+            if mode == "PREDICTION":
+                self.results[mode] = self.calculatePrediction()
+            elif mode == "STEERING":
+                self.results[mode] = self.calculateSteering()
+            elif mode == "BASIC":
+                self.results[mode] = self.calculate()
+            else:
+                self.results[mode] = self.calculateAggregate()
+        return self.results[mode]
+
+    def getView(self, prop, values):
+        """Return the {emitterid: value} dict for prop in the current mode.
+        It is only made once per agent however many nodes read it.
+
+        :param values: function that given a SoundResult returns the array
+                        of values for prop"""
+        key = (self.currentMode(), prop)
+        if key not in self.views:
+            items = self.calcAndGetItems()
+            if items:
+                self.views[key] = items.view(values(items))
+            else:
+                self.views[key] = None
+        return self.views[key]
 
     @property
     def rz(self):
         """Return the horizontal angle of sound emitting agents"""
-        items = self.calcAndGetItems()
-        if items:
-            return self._buildDictFromProperty(items, "rz")
+        return self.getView("rz", lambda r: r.column("rz"))
 
     @property
     def rx(self):
         """Return the vertical angle of sound emitting agents"""
-        items = self.calcAndGetItems()
-        if items:
-            return self._buildDictFromProperty(items, "rx")
+        return self.getView("rx", lambda r: r.column("rx"))
 
     @property
     def dist(self):
         """Return the distance to the sound emitting agents 0-1"""
-        items = self.calcAndGetItems()
-        if items:
-            return self._buildDictFromProperty(items, "distProp")
+        return self.getView("dist", lambda r: r.column("distProp"))
 
     @property
     def close(self):
         """Return how close the sound emitting is 0-1"""
-        items = self.calcAndGetItems()
-        if items:
-            result = self._buildDictFromProperty(items, "distProp")
-            return {k: 1-v for k, v in result.items()}
+        return self.getView("close", lambda r: 1 - r.column("distProp"))
 
     @property
     def db(self):
         """Return the volume (dist^2) of sound emitting agents"""
-        items = self.calcAndGetItems()
-        if items:
-            tmp = self._buildDictFromProperty(items, "distProp")
-            return {k: (1-v)**2 for k, v in tmp.items()}
+        # count is the number of emitters in an aggregated group
+        return self.getView("db", lambda r: numpy.minimum(
+            r.column("count", default=1) * (1 - r.column("distProp"))**2, 1))
 
     @property
     def cert(self):
         """Return the certainty of a prediction 0-1"""
-        items = self.calcAndGetItems()
-        if items:
-            return self._buildDictFromProperty(items, "cert", default=1)
+        return self.getView("cert", lambda r: r.column("cert", default=1))
 
     @property
     def acc(self):
         """Return the recommended acceleration to avoid a collision"""
-        items = self.calcAndGetItems()
-        if items:
-            return self._buildDictFromProperty(items, "acc")
+        return self.getView("acc", lambda r: r.column("acc"))
 
     @property
     def over(self):
         """Return the predicted worst case overlap"""
-        items = self.calcAndGetItems()
-        if items:
-            return self._buildDictFromProperty(items, "overlap")
+        return self.getView("over", lambda r: r.column("overlap"))
+
+
+class SoundResult:
+    """The values calculated for each of the emitters heard by one agent.
+    Stored as an array per property so that they can be calculated for all
+    the emitters at once. The dictionaries used by the brain are only made
+    when a property is actually read."""
+    def __init__(self, ids, columns):
+        """
+        :param ids: The handles of the emitters that were heard
+        :type ids: [int]
+        :param columns: An array of len(ids) values for each property
+        :type columns: {str: numpy.ndarray}"""
+        self.ids = ids
+        self.columns = columns
+
+    @staticmethod
+    def collect(names):
+        return _SoundResultBuilder(names)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, prop, default=0):
+        """The array of values for prop (or default if it isn't stored)"""
+        if prop in self.columns:
+            return self.columns[prop]
+        return numpy.full(len(self.ids), default, dtype=float)
+
+    def view(self, values):
+        """Make the {emitterid: value} dictionary that the brain uses"""
+        return dict(zip(self.ids, values.tolist()))
+
+
+class _SoundResultBuilder:
+    """Used to build a SoundResult one emitter at a time"""
+    def __init__(self, names):
+        self.names = names
+        self.ids = []
+        self.values = []
+
+    def append(self, emitterid, *values):
+        self.ids.append(emitterid)
+        self.values.append(values)
+
+    def build(self):
+        values = numpy.array(self.values, dtype=float)
+        values = values.reshape(len(self.ids), len(self.names))
+        columns = {n: values[:, i] for i, n in enumerate(self.names)}
+        return SoundResult(self.ids, columns)
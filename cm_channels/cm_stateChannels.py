@@ -1,4 +1,3 @@
-import bpy
 from .cm_masterChannels import MasterChannel as Mc
 
 
@@ -9,25 +8,25 @@ class State(Mc):
 
     @property
     def radius(self):
-        return bpy.context.scene.objects[self.userid].dimensions.length/2
+        return self.agentObject.dimensions.length/2
 
     @property
     def userObject(self):
         """Shoudn't really ever be used but here for when a feature is missing"""
-        return bpy.context.scene.objects[self.userid]
+        return self.agentObject
 
     @property
     def vars(self):
         """Get last frames agent variables. (Has to be last frames because this
         frames variables can be changed during the evaluation of the brain)"""
-        return self.sim.agents[self.userid].access
+        return self.agent.access
 
     @property
     def speed(self):
         """Get the distance travelled in the last frame"""
-        return self.sim.agents[self.userid].globalVelocity.length
+        return self.agent.globalVelocity.length
 
     @property
     def velocity(self):
         """The vector of the change in position for the last frame"""
-        return self.sim.agents[self.userid].globalVelocity
+        return self.agent.globalVelocity
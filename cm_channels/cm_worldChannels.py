@@ -3,6 +3,9 @@ from .cm_masterChannels import MasterChannel as Mc
 
 import math
 import mathutils
+import numpy
+
+from ..libs.ins_vector import relativeVectors
 
 
 class World(Mc):
@@ -10,51 +13,111 @@ class World(Mc):
     def __init__(self, sim):
         Mc.__init__(self, sim)
         self.store = {}
+        self.targets = {}
+        """{target: Target} shared by all agents for the current frame"""
+        self.users = {}
+        """{target: [agent handle]} agents that used each target this frame"""
+        self.lastUsers = {}
 
     def target(self, target):
         """Dynamic properties"""
         if target not in self.store:
-            self.store[target] = Channel(target, self.userid, self.sim)
+            if target not in self.targets:
+                self.targets[target] = Target(target, self.sim,
+                                              self.lastUsers.get(target, ()))
+                self.users[target] = []
+            self.users[target].append(self.user)
+            self.store[target] = Channel(self.targets[target], self.user,
+                                         self.sim)
         return self.store[target]
 
     def newframe(self):
         self.store = {}
+        self.targets = {}
+        self.lastUsers = self.users
+        self.users = {}
 
-    def setuser(self, userid):
+    def setuser(self, user):
         self.store = {}
-        Mc.setuser(self, userid)
+        Mc.setuser(self, user)
 
     @property
     def time(self):
         return bpy.context.scene.frame_current
 
 
+class Target:
+    """The transform and dimensions of a target object for one frame. The
+    results for the agents that used this target last frame are worked out
+    together the first time any of them is needed."""
+    def __init__(self, target, sim, users):
+        self.sim = sim
+        self.target = target
+        self.users = users
+
+        to = bpy.context.scene.objects[target]
+        self.location = to.location.copy()
+        if target in sim.agents:
+            self.dim = max(sim.agents[target].dimensions)
+        else:
+            self.dim = max(to.dimensions)
+
+        self.results = None
+
+    def calculateBatch(self):
+        """Calculate rz, rx and arrived for all the agents in self.users"""
+        self.results = {}
+        users = list(self.users)
+        if not users:
+            return
+        O = self.sim.objects
+        objs = [O[u] for u in users]
+        locs = numpy.array([tuple(o.location) for o in objs])
+        eulers = numpy.array([tuple(o.rotation_euler) for o in objs])
+        uDims = numpy.array([max(self.sim.agentList[u].dimensions)
+                             for u in users])
+
+        target = numpy.array(tuple(self.location)) - locs
+        dist = numpy.sqrt((target**2).sum(axis=1))
+        relative = relativeVectors(target, eulers)
+
+        changez = numpy.arctan2(relative[:, 0], relative[:, 1])/math.pi
+        changex = numpy.arctan2(relative[:, 2], relative[:, 1])/math.pi
+        arrived = dist < (self.dim + uDims)
+
+        for u, rz, rx, arr in zip(users, changez.tolist(), changex.tolist(),
+                                  arrived.tolist()):
+            self.results[u] = {"rz": rz, "rx": rx, "arrived": 1 if arr else 0}
+
+    def get(self, user):
+        """The precalculated results for the agent with handle user or None"""
+        if self.results is None:
+            self.calculateBatch()
+        return self.results.get(user)
+
+
 class Channel:
     def __init__(self, target, user, sim):
         self.sim = sim
 
         self.target = target
-        self.userid = user
+        self.user = user
 
         self.store = {}
         self.calcd = False
 
     def calculate(self):
-        O = bpy.context.scene.objects
-
-        to = O[self.target]
-        ag = O[self.userid]
-        userDim = self.sim.agents[self.userid].dimensions
-
-        tDim = max(self.sim.agents[self.target].dimensions)
-        uDim = max(userDim)
+        batched = self.target.get(self.user)
+        if batched is not None:
+            self.store = batched
+            self.calcd = True
+            return
 
-        difx = to.location.x - ag.location.x
-        dify = to.location.y - ag.location.y
-        difz = to.location.z - ag.location.z
-        dist = math.sqrt(difx**2 + dify**2 + difz**2)
+        ag = self.sim.objects[self.user]
+        uDim = max(self.sim.agentList[self.user].dimensions)
 
-        target = to.location - ag.location
+        target = self.target.location - ag.location
+        dist = target.length
 
         z = mathutils.Matrix.Rotation(ag.rotation_euler[2], 4, 'Z')
         y = mathutils.Matrix.Rotation(ag.rotation_euler[1], 4, 'Y')
@@ -67,7 +130,7 @@ class Channel:
         changex = math.atan2(relative[2], relative[1])/math.pi
         self.store = {"rz": changez,
                       "rx": changex,
-                      "arrived": 1 if dist < (tDim + uDim) else 0}
+                      "arrived": 1 if dist < (self.target.dim + uDim) else 0}
 
         self.calcd = True
 
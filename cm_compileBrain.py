@@ -36,9 +36,9 @@ def getOutputs(out):
     return result
 
 
-def compileBrain(nodeGroup, sim, userid):
+def compileBrain(nodeGroup, sim, userid, handle):
     """Compile the brain that defines how and agent moves and is animated"""
-    result = Brain(sim, userid)
+    result = Brain(sim, userid, handle)
     """create the connections from the node"""
     for node in nodeGroup.nodes:
         if node.bl_idname in logictypes:
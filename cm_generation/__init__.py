@@ -41,7 +41,9 @@ class SCENE_OT_agent_nodes_generate(Operator):
                         if not suc:
                             return False, None
                         inps[nm] = temp
-            tmpt = templates[idName](inps, current.getSettings(), current.name)
+            ntree = current.id_data
+            tmpt = templates[idName](inps, current.getSettings(), current.name,
+                                     ntree.name, ntree.seed)
             if not tmpt.check():
                 current.use_custom_color = True
                 current.color = (255, 0, 0)
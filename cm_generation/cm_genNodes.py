@@ -14,6 +14,9 @@ class CrowdMasterAGenTree(NodeTree):
     bl_label = 'CrowdMaster Agent Generation'
     bl_icon = 'MOD_ARRAY'
 
+    seed = IntProperty(name="Seed", default=0, min=0,
+                       description="Change to generate different agents")
+
 
 class GeoSocket(NodeSocket):
     """Geo node socket type"""
@@ -56,6 +59,7 @@ class GenerateNode(CrowdMasterAGenTreeNode):
         self.inputs[0].link_limit = 4095
 
     def draw_buttons(self, context, layout):
+        layout.prop(self.id_data, "seed")
         layout.scale_y = 1.5
         oper = layout.operator("scene.cm_agent_nodes_generate",
                                icon_value=cicon('add_agents'))
@@ -5,12 +5,12 @@ KDTree = mathutils.kdtree.KDTree
 
 from collections import OrderedDict
 
-import random
 import math
 from math import radians
 
 from ..libs.ins_vector import Vector
-from ..libs.ins_octree import createOctreeFromBPYObjs
+from ..libs import ins_random
+from ..libs.ins_bpyAdapter import createOctreeFromBPYObjs
 
 # ==================== Some base classes ====================
 
@@ -18,15 +18,33 @@ from ..libs.ins_octree import createOctreeFromBPYObjs
 class Template():
     """Abstract super class.
     Templates are a description of how to create some arrangement of agents"""
-    def __init__(self, inputs, settings, bpyName):
+    def __init__(self, inputs, settings, bpyName, treeName="", seed=0):
         """":param input: A list of Templates or GeoTemplates generated by the
-        nodes that are connected to inputs of this node"""
+        nodes that are connected to inputs of this node
+        :param treeName: The node tree this template's node is in
+        :param seed: The seed of that node tree"""
         self.inputs = inputs
         self.bpyName = bpyName
+        self.treeName = treeName
+        self.seed = seed
         self.settings = settings
 
         self.buildCount = 0
         self.checkCache = None
+        self.draws = 0
+
+    def random(self):
+        """The next number in range 0-1 from this node's sequence. Templates
+        are created each time agents are generated so the same nodes always
+        generate the same agents. Nodes with the same name in other trees
+        and the same tree with another seed get different numbers"""
+        self.draws += 1
+        return ins_random.random(self.treeName, self.seed, self.bpyName,
+                                 self.draws)
+
+    def uniform(self, a, b):
+        """The next number between a and b from this node's sequence"""
+        return a + (b - a) * self.random()
 
     def build(self, pos, rot, scale, tags, cm_group):
         """Called when this template is being used to modify the scene"""
@@ -131,7 +149,7 @@ class GeoTemplateGROUP(GeoTemplate):
 class GeoTemplateSWITCH(GeoTemplate):
     """Randomly (biased by "switchAmout") pick which of the inputs to use"""
     def build(self, pos, rot, scale, group, deferGeo):
-        if random.random() < self.settings["switchAmout"]:
+        if self.random() < self.settings["switchAmout"]:
             return self.inputs["Object 1"].build(pos, rot, scale, group, deferGeo)
         else:
             return self.inputs["Object 2"].build(pos, rot, scale, group, deferGeo)
@@ -235,7 +253,7 @@ class TemplateAGENT(Template):
 class TemplateSWITCH(Template):
     """Randomly (biased by "switchAmout") pick which of the inputs to use"""
     def build(self, pos, rot, scale, tags, cm_group):
-        if random.random() < self.settings["switchAmout"]:
+        if self.random() < self.settings["switchAmout"]:
             self.inputs["Template 1"].build(pos, rot, scale, tags, cm_group)
         else:
             self.inputs["Template 2"].build(pos, rot, scale, tags, cm_group)
@@ -289,13 +307,13 @@ class TemplateOFFSET(Template):
 class TemplateRANDOM(Template):
     """Randomly modify rotation and scale of the request made"""
     def build(self, pos, rot, scale, tags, cm_group):
-        rotDiff = random.uniform(self.settings["minRandRot"],
-                                 self.settings["maxRandRot"])
+        rotDiff = self.uniform(self.settings["minRandRot"],
+                               self.settings["maxRandRot"])
         eul = mathutils.Euler(rot, 'XYZ')
         eul.rotate_axis('Z', math.radians(rotDiff))
 
-        scaleDiff = random.uniform(self.settings["minRandSz"],
-                                   self.settings["maxRandSz"])
+        scaleDiff = self.uniform(self.settings["minRandSz"],
+                                 self.settings["maxRandSz"])
         newScale = scale * scaleDiff
         self.inputs["Template"].build(pos, Vector(eul), newScale, tags, cm_group)
 
@@ -311,8 +329,8 @@ class TemplateRANDOM(Template):
 
 class TemplatePOINTTOWARDS(Template):
     """Rotate to point towards object or closest point on mesh"""
-    def __init__(self, inputs, settings, bpyName):
-        Template.__init__(self, inputs, settings, bpyName)
+    def __init__(self, inputs, settings, bpyName, treeName="", seed=0):
+        Template.__init__(self, inputs, settings, bpyName, treeName, seed)
         self.kdtree = None
 
     def build(self, pos, rot, scale, tags, cm_group):
@@ -359,10 +377,10 @@ class TemplateRANDOMPOSITIONING(Template):
         positions = []
         for a in range(self.settings["noToPlace"]):
             if self.settings["locationType"] == "radius":
-                angle = random.uniform(-math.pi, math.pi)
+                angle = self.uniform(-math.pi, math.pi)
                 x = math.sin(angle)
                 y = math.cos(angle)
-                length = random.random() + random.random()
+                length = self.random() + self.random()
                 if length > 1:
                     length = 2 - length
                 length *= self.settings["radius"]
@@ -483,8 +501,8 @@ class TemplateTARGET(Template):
 
 class TemplateOBSTACLE(Template):
     """Refuse any requests that are withing the bounding box of an obstacle"""
-    def __init__(self, inputs, settings, bpyName):
-        Template.__init__(self, inputs, settings, bpyName)
+    def __init__(self, inputs, settings, bpyName, treeName="", seed=0):
+        Template.__init__(self, inputs, settings, bpyName, treeName, seed)
         self.octree = None
 
     def build(self, pos, rot, scale, tags, cm_group):
@@ -513,8 +531,8 @@ class TemplateOBSTACLE(Template):
 
 class TemplateGROUND(Template):
     """Adjust the position of requests onto a ground mesh"""
-    def __init__(self, inputs, settings, bpyName):
-        Template.__init__(self, inputs, settings, bpyName)
+    def __init__(self, inputs, settings, bpyName, treeName="", seed=0):
+        Template.__init__(self, inputs, settings, bpyName, treeName, seed)
         self.bvhtree = None
 
     def build(self, pos, rot, scale, tags, cm_group):
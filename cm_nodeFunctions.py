@@ -1,11 +1,10 @@
 from collections import OrderedDict
 import math
-from .cm_brainClasses import Neuron, State
+from .cm_brainClasses import Neuron, State, ImpulseContainer
 from .cm_pythonEmbededInterpreter import Interpreter
 import copy
 import bpy
 import os
-import random
 
 
 """
@@ -104,15 +103,23 @@ class LogicNEWINPUT(Neuron):
                 return {"None": dist}
 
         elif settings["InputSource"] == "GROUND":
-            gChan = channels["Ground"].retrieve(settings["GroundGroup"])
-            return {"None": gChan.dh()}
+            if settings["GroundHeightfield"]:
+                resolution = settings["GroundResolution"]
+            else:
+                resolution = None
+            gChan = channels["Ground"].retrieve(settings["GroundGroup"],
+                                                resolution)
+            dh = gChan.dh()
+            if dh is None:
+                return None
+            return {"None": dh}
 
         elif settings["InputSource"] == "NOISE":
             noise = channels["Noise"]
             if settings["NoiseOptions"] == "RANDOM":
-                return {"None": noise.random()}
+                return {"None": noise.random(self.bpyNode.name)}
             elif settings["NoiseOptions"] == "AGENTRANDOM":
-                return {"None": noise.agentRandom(offset=hash(self))}
+                return {"None": noise.agentRandom(offset=self.bpyNode.name)}
 
         elif settings["InputSource"] == "PATH":
             if settings["PathOptions"] == "RZ":
@@ -128,6 +135,8 @@ class LogicNEWINPUT(Neuron):
             if settings["SoundMode"] == "BASIC":
                 ch.predictNext = False
                 ch.steeringNext = False
+                ch.aggregateNext = settings["SoundAggregate"]
+                ch.accuracy = settings["SoundAccuracy"]
             elif settings["SoundMode"] == "PREDICTION":
                 ch.predictNext = True
                 ch.steeringNext = False
@@ -179,6 +188,56 @@ class LogicNEWINPUT(Neuron):
             elif settings["WorldOptions"] == "TIME":
                 return {"None": channels["World"].time}
 
+        elif settings["InputSource"] == "FLOW":
+            fChan = channels["Flow"].retrieve(settings["FlowGoal"],
+                                              settings["FlowGround"],
+                                              settings["FlowObstacles"],
+                                              settings["FlowResolution"])
+            if settings["FlowOptions"] == "RZ":
+                rz = fChan.rz
+                if rz is None:
+                    return None
+                return {"None": rz}
+            elif settings["FlowOptions"] == "DIST":
+                dist = fChan.dist
+                if dist is None:
+                    return None
+                return {"None": dist}
+
+        elif settings["InputSource"] == "DENSITY":
+            density = channels["Density"]
+            resolution = settings["DensityResolution"]
+            if settings["DensityOptions"] == "DENSITY":
+                value = density.density(resolution)
+            elif settings["DensityOptions"] == "GRADIENT":
+                value = density.gradient(resolution)
+            elif settings["DensityOptions"] == "GRADIENTRZ":
+                value = density.gradientRz(resolution)
+            elif settings["DensityOptions"] == "FLOWSPEED":
+                value = density.flowSpeed(resolution)
+            elif settings["DensityOptions"] == "FLOWRZ":
+                value = density.flowRz(resolution)
+            if value is None:
+                return None
+            return {"None": value}
+
+        elif settings["InputSource"] == "OBSTACLE":
+            obstacle = channels["Obstacle"]
+            args = (settings["ObstacleGroup"], settings["ObstacleResolution"],
+                    settings["ObstacleRange"])
+            if settings["ObstacleOptions"] == "DIST":
+                dist = obstacle.distance(*args)
+                if dist is None:
+                    return None
+                return {"None": dist}
+            direction = obstacle.direction(*args)
+            if direction is None:
+                return None
+            if settings["ObstacleOptions"] == "RZ":
+                return {"None": direction[0]}
+            elif settings["ObstacleOptions"] == "RX":
+                return {"None": direction[1]}
+
 
 class LogicGRAPH(Neuron):
     """Return value 0 to 1 mapping from graph"""
@@ -537,26 +596,8 @@ class LogicEVENT(Neuron):
     """Check if an event is happening that frame"""
 
     def core(self, inps, settings):
-        events = bpy.context.scene.cm_events.coll
-        en = settings["EventName"]
-        for e in events:
-            if e.eventname == en:
-                result = 1
-                if e.category == "Time" or e.category == "Time+Volume":
-                    if e.time != bpy.context.scene.frame_current:
-                        result = 0
-                if e.category == "Volume" or e.category == "Time+Volume":
-                    if result:
-                        pt = bpy.data.objects[self.brain.userid].location
-                        l = bpy.data.objects[e.volume].location
-                        d = bpy.data.objects[e.volume].dimensions
-
-                        if not (l.x-(d.x/2) <= pt.x <= l.x+(d.x/2) and
-                                l.y-(d.y/2) <= pt.y <= l.y+(d.y/2) and
-                                l.z-(d.z/2) <= pt.z <= l.z+(d.z/2)):
-                            result = 0
-                if result:
-                    return result
+        if self.brain.lvars["Event"].isHappening(settings["EventName"]):
+            return 1
         return 0
 
 
@@ -565,12 +606,28 @@ class LogicPYTHON(Neuron):
 
     def core(self, inps, settings):
         global Inter
+        # Agents are referred to by handle in the brain but expressions are
+        # written with agent names, so convert the keys both ways
+        sim = self.brain.sim
+        handles = {}
+        named = []
+        for into in inps:
+            cont = {}
+            for i in into:
+                key = i.key
+                if isinstance(key, int):
+                    key = sim.nameOf(key)
+                    handles[key] = i.key
+                cont[key] = i.val
+            named.append(ImpulseContainer(cont))
         setup = copy.copy(self.brain.lvars)
-        setup["inps"] = inps
+        setup["inps"] = named
         setup["settings"] = settings
         Inter.setup(setup)
         Inter.enter(settings["Expression"]["value"])
         result = Inter.getoutput()
+        if isinstance(result, dict):
+            result = {handles.get(k, k): v for k, v in result.items()}
         return result
 
 
@@ -585,12 +642,16 @@ class LogicPRINT(Neuron):
         if self.brain.userid in selected:
             for into in inps:
                 for i in into:
+                    key = i.key
+                    if isinstance(key, int):
+                        # Agents are referred to by handle in the brain
+                        key = self.brain.sim.nameOf(key)
                     if settings["save_to_file"] == True:
                         with open(os.path.join(settings["output_filepath"], "CrowdMasterOutput.txt"), "a") as output:
-                            message = settings["Label"] + " >> " + str(i.key) + " " + str(i.val) + "\n"
+                            message = settings["Label"] + " >> " + str(key) + " " + str(i.val) + "\n"
                             output.write(message)
                     else:
-                        print(settings["Label"], ">>", i.key, i.val)
+                        print(settings["Label"], ">>", key, i.val)
         return 0
 
 
@@ -631,7 +692,7 @@ class StateAction(State):
         act = self.actionName
         if act in self.brain.sim.actions:
             actionobj = self.brain.sim.actions[act]  # from .cm_motion.py
-            obj = bpy.context.scene.objects[self.brain.userid]  # bpy object
+            obj = self.brain.sim.objects[self.brain.handle]  # bpy object
 
             tr = obj.animation_data.nla_tracks.new()  # NLA track
             action = actionobj.action  # bpy action
@@ -717,12 +778,12 @@ class StateActionGroup(State):
 
         actGp = self.brain.sim.actionGroups[self.settings["GroupName"]]
 
-        self.actionName = random.choice(actGp)
+        self.actionName = self.brain.choice(actGp, self.name)
 
         act = self.actionName
         if act in self.brain.sim.actions:
             actionobj = self.brain.sim.actions[act]  # from .cm_motion.py
-            obj = bpy.context.scene.objects[self.brain.userid]  # bpy object
+            obj = self.brain.sim.objects[self.brain.handle]  # bpy object
 
             tr = obj.animation_data.nla_tracks.new()  # NLA track
             action = actionobj.action  # bpy action
@@ -13,6 +13,11 @@ class Simulation:
     def __init__(self):
         preferences = bpy.context.user_preferences.addons[__package__].preferences
         self.agents = {}
+        """{name: Agent} for looking agents up from the interface"""
+        self.agentList = []
+        """[Agent] indexed by the agents' handles"""
+        self.objects = []
+        """[bpy object] of each agent indexed by the agents' handles"""
         self.framelast = 1
         self.compbrains = {}
         Noise = chan.Noise(self)
@@ -23,6 +28,10 @@ class Simulation:
         Ground = chan.Ground(self)
         Formation = chan.Formation(self)
         Path = chan.Path(self)
+        Flow = chan.Flow(self)
+        Density = chan.Density(self)
+        Obstacle = chan.Obstacle(self)
+        Event = chan.Event(self)
         self.lvars = {"Noise": Noise,
                       "Sound": Sound,
                       "State": State,
@@ -30,7 +39,11 @@ class Simulation:
                       "Crowd": Crowd,
                       "Ground": Ground,
                       "Formation": Formation,
-                      "Path": Path}
+                      "Path": Path,
+                      "Flow": Flow,
+                      "Density": Density,
+                      "Obstacle": Obstacle,
+                      "Event": Event}
         if preferences.show_debug_options:
             self.totalTime = 0
             self.totalFrames = 0
@@ -43,14 +56,25 @@ class Simulation:
         self.actions, self.actionGroups = getmotions()
 
     def newagent(self, name, brain):
-        """Set up an agent"""
+        """Set up an agent. Each agent is given a handle, its index in
+        self.agentList, which the channels and brains use to refer to it"""
         nGps = bpy.data.node_groups
         if brain in nGps and nGps[brain].bl_idname == "CrowdMasterTreeType":
-            ag = Agent(name, nGps[brain], self)
+            ag = Agent(name, nGps[brain], self, len(self.agentList))
             self.agents[name] = ag
+            self.agentList.append(ag)
+            self.objects.append(ag.obj)
         else:
             print("No such brain type:" + brain)
 
+    def handleOf(self, name):
+        """The handle of the agent called name"""
+        return self.agents[name].handle
+
+    def nameOf(self, handle):
+        """The name of the agent with this handle"""
+        return self.agentList[handle].id
+
     def createAgents(self, group):
         """Set up all the agents at the beginning of the simulation"""
         for ty in group.agentTypes:
@@ -63,7 +87,7 @@ class Simulation:
         if preferences.show_debug_options:
             t = time.time()
             print("NEWFRAME", bpy.context.scene.frame_current)
-        for agent in self.agents.values():
+        for agent in self.agentList:
             for tag in agent.access["tags"]:
                 for channel in self.lvars:
                     if tag[:len(channel)] == channel:
@@ -71,9 +95,9 @@ class Simulation:
                                                      agent.access["tags"][tag])
         # TODO registering channels would be much more efficient if done
         # straight after the agent is evaluated.
-        for a in self.agents.values():
+        for a in self.agentList:
             a.step()
-        for a in self.agents.values():
+        for a in self.agentList:
             a.apply()
         for chan in self.lvars.values():
             chan.newframe()
@@ -94,8 +118,8 @@ class Simulation:
         """Not unregistered when simulation stopped"""
         if self.framelast >= bpy.context.scene.frame_current:
             active = bpy.context.active_object
-            if active and active in self.agents:
-                self.agents[bpy.context.active_object.name].highLight()
+            if active and active.name in self.agents:
+                self.agents[active.name].highLight()
 
     def startFrameHandler(self):
         """Add self.frameChangeHandler to the Blender event handlers"""
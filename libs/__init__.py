@@ -8,7 +8,27 @@ try:
 except Exception:
     print("ERROR importing ins_clustering")
 
+try:
+    from . import ins_assignment
+except Exception:
+    print("ERROR importing ins_assignment")
+
+try:
+    from . import ins_random
+except Exception:
+    print("ERROR importing ins_random")
+
+try:
+    from . import ins_broadphase
+except Exception:
+    print("ERROR importing ins_broadphase")
+
 try:
     from . import ins_octree
 except Exception:
     print("ERROR importing ins_octree")
+
+try:
+    from . import ins_bpyAdapter
+except Exception:
+    print("ERROR importing ins_bpyAdapter")
@@ -0,0 +1,387 @@
+"""Match sources to targets so that the total squared distance between each
+source and its target is as small as possible. Using squared distances means
+paths from sources to their targets don't cross.
+
+Small problems are solved exactly with the Hungarian algorithm. Large ones
+are split into small groups of sources and targets by the clustering of
+ins_clustering, each group is solved exactly and then the result is improved
+by swapping pairs of targets between neighbouring sources (2-opt). The
+groups are the ones matchGroups ends up with so the result is never worse
+than matchGroups with the same key, and it takes less time. A previous
+assignment can be given as a warm start so that only the sources that
+aren't matched any more need to be fixed up.
+"""
+
+import heapq
+import math
+
+import numpy
+
+try:
+    from .ins_clustering import splitGroups
+except (ImportError, SystemError):
+    from ins_clustering import splitGroups
+
+HUNGARIAN_LIMIT = 150
+"""Largest number of unmatched sources that are solved exactly"""
+
+GROUP_SIZE = 8
+"""Most sources in each of the groups large problems are split into"""
+
+
+def costMatrix(sources, targets):
+    """Squared distance from every source to every target"""
+    diff = sources[:, None, :] - targets[None, :, :]
+    return (diff**2).sum(axis=2)
+
+
+def costOf(sources, targets, assignment):
+    """Total squared distance of an assignment"""
+    return ((sources - targets[assignment])**2).sum()
+
+
+def hungarian(cost):
+    """Minimum cost assignment of each row to a different column.
+
+    :param cost: array of shape (n, m) with n <= m
+    :returns: array with the column for each row
+    """
+    n, m = cost.shape
+    u = numpy.zeros(n + 1)
+    v = numpy.zeros(m + 1)
+    owner = numpy.zeros(m + 1, dtype=int)  # row + 1 assigned to column j
+    way = numpy.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = numpy.full(m + 1, numpy.inf)
+        used = numpy.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = numpy.where(free, minv, numpy.inf)
+            j1 = int(candidates.argmin())
+            delta = candidates[j1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    result = numpy.empty(n, dtype=int)
+    assigned = numpy.nonzero(owner[1:])[0]
+    result[owner[1:][assigned] - 1] = assigned
+    return result
+
+
+def nearestCandidates(sources, targets, k):
+    """Up to k of the nearest targets to each source, found by bucketing the
+    targets into a 2D grid with roughly k targets per cell and looking in
+    the neighbouring cells. Sources with no targets near them look in rings
+    of cells further out until something is found.
+
+    :returns: list of arrays of target indices
+    """
+    low = targets[:, :2].min(axis=0)
+    extent = targets[:, :2].max(axis=0) - low
+    area = max(extent[0], 1e-9) * max(extent[1], 1e-9)
+    size = max(math.sqrt(area * k / len(targets)), 1e-9)
+
+    buckets = {}
+    for t, cell in enumerate(numpy.floor((targets[:, :2] - low) / size)
+                             .astype(int).tolist()):
+        buckets.setdefault(tuple(cell), []).append(t)
+    last = numpy.floor(extent / size).astype(int)
+
+    result = []
+    # Sources outside the grid start from the nearest cell on its edge so
+    # the empty cells outside it aren't searched one by one
+    cells = numpy.floor((sources[:, :2] - low) / size).astype(int)
+    cells = numpy.minimum(numpy.maximum(cells, 0), last).tolist()
+    for s, (ci, cj) in enumerate(cells):
+        found = []
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                found += buckets.get((ci + di, cj + dj), ())
+        ring = 1
+        while not found:
+            ring += 1
+            for di in range(-ring, ring + 1):
+                for dj in (-ring, ring):
+                    found += buckets.get((ci + di, cj + dj), ())
+            for dj in range(-ring + 1, ring):
+                for di in (-ring, ring):
+                    found += buckets.get((ci + di, cj + dj), ())
+        found = numpy.array(found, dtype=int)
+        if len(found) > k:
+            dist = ((targets[found] - sources[s])**2).sum(axis=1)
+            found = found[numpy.argpartition(dist, k)[:k]]
+        result.append(found)
+    return result
+
+
+def alignedSources(sources, targets):
+    """sources moved and scaled along each axis to have the same mean and
+    spread as targets. Moving all the sources by the same amount hardly
+    changes which assignment is best, so the nearest targets of the aligned
+    sources are much better candidates when a formation is away from the
+    crowd that is moving into it."""
+    scale = targets.std(axis=0) / numpy.maximum(sources.std(axis=0), 1e-9)
+    scale[sources.std(axis=0) < 1e-9] = 1
+    return (sources - sources.mean(axis=0)) * scale + targets.mean(axis=0)
+
+
+def sparseHungarian(sources, targets, columns):
+    """The Hungarian algorithm (shortest augmenting paths with potentials)
+    restricted to a few candidate targets for each source, which makes it
+    fast enough for thousands of sources. The result is the optimum over
+    the candidates. A source that can't reach a free target through the
+    candidates is given all the free targets as candidates.
+
+    :param columns: list of lists of candidate targets for each source
+    :returns: array with the target for each source
+    """
+    n = len(sources)
+    m = len(targets)
+    src = sources.tolist()
+    tgt = targets.tolist()
+
+    def costs(s, cols):
+        a = src[s]
+        return [(a[0] - b[0])**2 + (a[1] - b[1])**2 + (a[2] - b[2])**2
+                for b in (tgt[t] for t in cols)]
+
+    columns = list(columns)
+    weights = [costs(s, c) for s, c in enumerate(columns)]
+
+    u = [0.0] * n
+    v = [0.0] * m
+    col4row = [-1] * n
+    row4col = [-1] * m
+    for current in range(n):
+        while True:
+            shortest = {}
+            path = {}
+            scanned = {}  # column: cost of the shortest path to it
+            rows = []
+            heap = []
+            i = current
+            lowest = 0.0
+            sink = -1
+            while sink < 0:
+                rows.append(i)
+                base = lowest - u[i]
+                for j, c in zip(columns[i], weights[i]):
+                    if j in scanned:
+                        continue
+                    r = base + c - v[j]
+                    if r < shortest.get(j, math.inf):
+                        shortest[j] = r
+                        path[j] = i
+                        heapq.heappush(heap, (r, j))
+                while heap and (heap[0][1] in scanned or
+                                heap[0][0] > shortest[heap[0][1]]):
+                    heapq.heappop(heap)
+                if not heap:
+                    break
+                lowest, j = heapq.heappop(heap)
+                scanned[j] = lowest
+                if row4col[j] < 0:
+                    sink = j
+                else:
+                    i = row4col[j]
+            if sink >= 0:
+                break
+            # No free target can be reached from current
+            known = set(columns[current])
+            extra = [t for t in range(m) if row4col[t] < 0 and
+                     t not in known]
+            columns[current] = columns[current] + extra
+            weights[current] = weights[current] + costs(current, extra)
+
+        u[current] += lowest
+        for i in rows[1:]:
+            u[i] += lowest - scanned[col4row[i]]
+        for j, r in scanned.items():
+            v[j] -= lowest - r
+        j = sink
+        while True:
+            i = path[j]
+            row4col[j] = i
+            col4row[i], j = j, col4row[i]
+            if i == current:
+                break
+    return numpy.array(col4row, dtype=int)
+
+
+def twoOpt(sources, targets, assignment, k=8, passes=2):
+    """Improve assignment by moving sources to free targets and swapping the
+    targets of pairs of sources when that lowers the total cost. Only the k
+    nearest targets of each source are considered.
+
+    :returns: the number of changes made
+    """
+    src = sources.tolist()
+    tgt = targets.tolist()
+
+    def cost(s, t):
+        a = src[s]
+        b = tgt[t]
+        return (a[0] - b[0])**2 + (a[1] - b[1])**2 + (a[2] - b[2])**2
+
+    owner = numpy.full(len(targets), -1, dtype=int)
+    owner[assignment] = numpy.arange(len(sources))
+    owner = owner.tolist()
+    current = assignment.tolist()
+    candidates = [c.tolist() for c in
+                  nearestCandidates(alignedSources(sources, targets), targets, k)]
+
+    changes = 0
+    for p in range(passes):
+        improved = False
+        for i in range(len(src)):
+            for t in candidates[i]:
+                ti = current[i]
+                if t == ti:
+                    continue
+                j = owner[t]
+                if j < 0:
+                    gain = cost(i, ti) - cost(i, t)
+                else:
+                    gain = (cost(i, ti) + cost(j, t) -
+                            cost(i, t) - cost(j, ti))
+                if gain > 1e-12:
+                    current[i] = t
+                    owner[t] = i
+                    owner[ti] = j
+                    if j >= 0:
+                        current[j] = ti
+                    improved = True
+                    changes += 1
+        if not improved:
+            break
+    assignment[:] = current
+    return changes
+
+
+def solve(sources, targets, key=()):
+    """Exact for small problems, exact within the groups of the clustering
+    for large ones
+
+    :param key: the ins_random key the clustering is seeded with
+    :returns: array with the target for each source
+    """
+    n = len(sources)
+    if n <= HUNGARIAN_LIMIT and n * len(targets) <= HUNGARIAN_LIMIT**2 * 4:
+        return hungarian(costMatrix(sources, targets))
+    assignment = numpy.empty(n, dtype=int)
+    for src, tgt in splitGroups(sources, targets, GROUP_SIZE, key):
+        columns = [list(range(len(tgt)))] * len(src)
+        assignment[src] = tgt[sparseHungarian(sources[src], targets[tgt],
+                                              columns)]
+    return assignment
+
+
+def assign(sources, targets, warmStart=None, k=8, key=()):
+    """Find a target for each source with a low total squared distance.
+
+    :param sources: array of shape (n, 3)
+    :param targets: array of shape (m, 3) with m >= n
+    :param warmStart: the target index for each source from a previous
+                      assignment, -1 for sources that weren't matched.
+                      Matches that are still valid are kept.
+    :param key: the ins_random key the clustering of large problems is
+                seeded with, so the same key gives the same assignment
+    :returns: array with the target index for each source
+    """
+    sources = numpy.asarray(sources, dtype=float).reshape(-1, 3)
+    targets = numpy.asarray(targets, dtype=float).reshape(-1, 3)
+    n = len(sources)
+    m = len(targets)
+    if n > m:
+        raise ValueError("There must be at least as many targets as sources")
+
+    assignment = numpy.full(n, -1, dtype=int)
+    if warmStart is not None:
+        taken = numpy.zeros(m, dtype=bool)
+        for s, t in enumerate(warmStart):
+            if 0 <= t < m and not taken[t]:
+                assignment[s] = t
+                taken[t] = True
+
+    todo = numpy.nonzero(assignment < 0)[0]
+    if len(todo):
+        free = numpy.setdiff1d(numpy.arange(m), assignment[assignment >= 0])
+        assignment[todo] = free[solve(sources[todo], targets[free], key)]
+
+    if len(todo) < n or n > HUNGARIAN_LIMIT:
+        twoOpt(sources, targets, assignment, k)
+    return assignment
+
+
+if __name__ == "__main__":
+    import itertools
+    import random
+    import time
+
+    for trial in range(50):
+        n = random.randint(1, 6)
+        m = random.randint(n, 7)
+        cost = numpy.random.rand(n, m)
+        best = min(sum(cost[i, p[i]] for i in range(n))
+                   for p in itertools.permutations(range(m), n))
+        result = hungarian(cost)
+        assert len(set(result.tolist())) == n
+        assert abs(cost[numpy.arange(n), result].sum() - best) < 1e-9
+
+    from ins_clustering import matchGroups
+
+    # Either side of HUNGARIAN_LIMIT the large problem method must stay close
+    # to the optimum and never be worse than the clustering with the same key
+    for n in (140, 150, 151, 160, 175, 200):
+        for trial in range(5):
+            sources = numpy.random.rand(n, 3) * (100, 100, 0)
+            targets = (numpy.random.rand(n + n // 10, 3) * (60, 60, 0) +
+                       (80, 20, 0))
+            best = costOf(sources, targets,
+                          hungarian(costMatrix(sources, targets)))
+            key = ("Formation", trial)
+            result = assign(sources, targets, key=key)
+            assert len(set(result.tolist())) == n
+            assert (result == assign(sources, targets, key=key)).all()
+            cost = costOf(sources, targets, result)
+            clustered = 0
+            for s, t in matchGroups(sources, targets, key)[1]:
+                clustered += ((sources[s] - targets[t])**2).sum()
+            assert cost <= clustered * (1 + 1e-9), (n, cost, clustered)
+            assert cost <= best * 1.1, (n, cost, best)
+        print(n, "sources, cost", cost / best, "of the optimum, clustering",
+              clustered / best)
+
+    for n in (100, 1000, 5000):
+        sources = numpy.random.rand(n, 3) * (100, 100, 0)
+        targets = numpy.random.rand(n + n // 10, 3) * (100, 100, 0) + (50, 0, 0)
+        t = time.time()
+        result = assign(sources, targets)
+        print(n, "sources", time.time() - t, "seconds, total cost",
+              ((sources - targets[result])**2).sum())
+        assert len(set(result.tolist())) == n
+        t = time.time()
+        pairs = matchGroups(sources, targets)[1]
+        print(n, "sources clustering", time.time() - t,
+              "seconds, total cost",
+              sum(((sources[s] - targets[t])**2).sum() for s, t in pairs))
+        sources += numpy.random.rand(n, 3) * 0.1
+        t = time.time()
+        assign(sources, targets, warmStart=result)
+        print(n, "sources warm start", time.time() - t, "seconds")
@@ -0,0 +1,69 @@
+"""Turns Blender objects into the plain tuples and numpy arrays that the rest
+of the libs work with. This is the only module in libs that deals with
+Blender objects, and it only reads their attributes so any object with
+matrix_world, bound_box and data.vertices can be passed in.
+"""
+
+import numpy
+
+try:
+    from .ins_octree import BoundingBox, createLinearOctree
+    from .ins_vector import transformPoints
+except (ImportError, SystemError):
+    from ins_octree import BoundingBox, createLinearOctree
+    from ins_vector import transformPoints
+
+
+def meshVertexArray(mesh):
+    """The vertex positions of a mesh as an array of shape (n, 3)"""
+    co = numpy.empty(len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3)
+
+
+def vertexArray(ob):
+    """The local space vertex positions of a mesh object as an array of
+    shape (n, 3)"""
+    return meshVertexArray(ob.data)
+
+
+def worldVertices(ob):
+    """The world space vertex positions of a mesh object as an array of
+    shape (n, 3)"""
+    return transformPoints(ob.matrix_world, vertexArray(ob))
+
+
+def boundingBoxFromBPY(ob, overwriteRadii=None):
+    corners = transformPoints(ob.matrix_world,
+                              [tuple(c) for c in ob.bound_box])
+    low = corners.min(axis=0)
+    high = corners.max(axis=0)
+
+    x, y, z = ((low + high) / 2).tolist()
+    radii = tuple(((high - low) / 2).tolist())
+    if overwriteRadii:
+        radii = tuple(overwriteRadii)
+
+    return BoundingBox((x, y, z), radii, ob.name)
+
+
+def boundingSphereFromBPY(ob, overwriteRadii=None):
+    bb = boundingBoxFromBPY(ob, overwriteRadii=overwriteRadii)
+    bb.isSphere = True
+    return bb
+
+
+def createOctreeFromBPYObjs(objs, allSpheres=True, radii=None):
+    """The function you want to import from this module in most cases.
+    If radii is left as default then the radius will be calculated from the
+    object."""
+    bbs = []
+
+    for n, ob in enumerate(objs):
+        overwrite = radii[n] if radii else None
+        if allSpheres:
+            bbs.append(boundingSphereFromBPY(ob, overwriteRadii=overwrite))
+        else:
+            bbs.append(boundingBoxFromBPY(ob, overwriteRadii=overwrite))
+
+    return createLinearOctree(bbs)
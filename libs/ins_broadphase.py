@@ -0,0 +1,116 @@
+"""Find every pair of overlapping boxes or spheres at once (the broad phase
+of collision detection).
+
+The boxes are sorted by their lower edge along the axis where they are most
+spread out. Each box can then only overlap the boxes after it in the sorted
+order up to the first one that starts past its upper edge (sweep and prune).
+"""
+
+import numpy
+
+
+def expandRanges(starts, counts):
+    """The concatenation of range(s, s + c) for each start and count"""
+    total = counts.sum()
+    offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) -
+                                                 counts, counts)
+    return numpy.repeat(starts, counts) + offsets
+
+
+def sweepAndPrune(low, high, chunk=1000000):
+    """Every pair of axis aligned boxes that overlap
+
+    :param low: array of shape (n, 3), lower corner of each box
+    :param high: array of shape (n, 3), upper corner of each box
+    :param chunk: roughly how many candidate pairs are tested at a time
+    :returns: int array of shape (k, 2) of (i, j) with i < j, sorted
+    """
+    low = numpy.asarray(low, dtype=float).reshape(-1, 3)
+    high = numpy.asarray(high, dtype=float).reshape(-1, 3)
+    n = len(low)
+    if n < 2:
+        return numpy.zeros((0, 2), dtype=int)
+
+    centres = (low + high) / 2
+    axis = int(centres.var(axis=0).argmax())
+    order = numpy.argsort(low[:, axis], kind="mergesort")
+    sortedLow = low[order, axis]
+    # Boxes after i in the sorted order that start before i ends
+    ends = numpy.searchsorted(sortedLow, high[order, axis], side="right")
+    counts = numpy.maximum(ends - numpy.arange(1, n + 1), 0)
+
+    pairs = []
+    start = 0
+    while start < n:
+        total = numpy.cumsum(counts[start:])
+        stop = start + max(int(numpy.searchsorted(total, chunk)), 1)
+        first = numpy.repeat(numpy.arange(start, stop), counts[start:stop])
+        second = expandRanges(numpy.arange(start + 1, stop + 1),
+                              counts[start:stop])
+        a = order[first]
+        b = order[second]
+        overlap = numpy.all((low[a] <= high[b]) & (low[b] <= high[a]),
+                            axis=1)
+        pairs.append(numpy.column_stack((a[overlap], b[overlap])))
+        start = stop
+
+    pairs = numpy.concatenate(pairs)
+    pairs.sort(axis=1)
+    if len(pairs):
+        pairs = pairs[numpy.lexsort((pairs[:, 1], pairs[:, 0]))]
+    return pairs
+
+
+def collisionPairs(positions, radii, isSphere=None):
+    """Every pair of spheres or boxes that overlap. Two spheres overlap when
+    their centres are closer than the sum of their radii. Any other pair is
+    tested as boxes.
+
+    :param positions: array of shape (n, 3) of centres
+    :param radii: array of shape (n, 3), half the size along each axis.
+                  Spheres use the largest.
+    :param isSphere: bool array of shape (n,), all boxes if None
+    :returns: int array of shape (k, 2) of (i, j) with i < j, sorted
+    """
+    positions = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+    radii = numpy.asarray(radii, dtype=float).reshape(-1, 3)
+    if isSphere is None:
+        isSphere = numpy.zeros(len(positions), dtype=bool)
+    isSphere = numpy.asarray(isSphere, dtype=bool)
+    sphereRadius = radii.max(axis=1)
+
+    extent = numpy.where(isSphere[:, None], sphereRadius[:, None], radii)
+    pairs = sweepAndPrune(positions - extent, positions + extent)
+
+    a, b = pairs[:, 0], pairs[:, 1]
+    spheres = isSphere[a] & isSphere[b]
+    diff = positions[a] - positions[b]
+    close = (diff**2).sum(axis=1) <= (sphereRadius[a] + sphereRadius[b])**2
+    boxes = numpy.all(numpy.abs(diff) <= radii[a] + radii[b], axis=1)
+    return pairs[numpy.where(spheres, close, boxes)]
+
+
+if __name__ == "__main__":
+    import time
+
+    for n in (1000, 10000, 100000):
+        positions = numpy.random.rand(n, 3) * (n**0.5 * 2, n**0.5 * 2, 1)
+        radii = numpy.full((n, 3), 0.5)
+        isSphere = numpy.random.rand(n) < 0.5
+
+        t = time.time()
+        pairs = collisionPairs(positions, radii, isSphere)
+        print(n, "items", time.time() - t, "seconds", len(pairs), "pairs")
+
+        if n <= 10000:
+            t = time.time()
+            brute = []
+            for i in range(n):
+                diff = positions[i + 1:] - positions[i]
+                sphere = isSphere[i] & isSphere[i + 1:]
+                close = (diff**2).sum(axis=1) <= 1
+                box = numpy.all(numpy.abs(diff) <= 1, axis=1)
+                for j in numpy.flatnonzero(numpy.where(sphere, close, box)):
+                    brute.append((i, i + 1 + j))
+            print(n, "items brute force", time.time() - t, "seconds")
+            assert [tuple(p) for p in pairs.tolist()] == brute
@@ -1,9 +1,13 @@
-from random import randrange, choice
+from random import randrange
+
+import numpy
 
 try:
-    from ins_vector import Vector, sortAlongLine
+    from ins_vector import Vector
+    import ins_random
 except:
-    from .ins_vector import Vector, sortAlongLine
+    from .ins_vector import Vector
+    from . import ins_random
 
 
 def clusterMatch(sources, targets, srcAccessFunc, trgAccessFunc):
@@ -14,131 +18,144 @@ def clusterMatch(sources, targets, srcAccessFunc, trgAccessFunc):
                             give back (x, y, z).
     :param trgAccessFunc: a function that given an element from targets will
                             give back (x, y, z).
+    :returns: (True, [((sourceIndex, Vector), (targetIndex, Vector))]) or
+              (False, [(sourceIndex, Vector)]) if there are more sources
+              than targets
     """
-    t = [(x[0], Vector(trgAccessFunc(x[1]))) for x in enumerate(targets)]
-    s = [(x[0], Vector(srcAccessFunc(x[1]))) for x in enumerate(sources)]
-    result = matchGroups(s, t)
-    check = [(x[0][0], x[1][0]) for x in result[1]]
-    fst = [x[0] for x in check]
-    scd = [x[1] for x in check]
-    if len(set(fst)) != len(fst) or len(set(scd)) != len(scd):
-        print("Match produced duplicates")
-    return result
-
-
-def KMean2(points, groups=None):
+    t = [Vector(trgAccessFunc(x)) for x in targets]
+    s = [Vector(srcAccessFunc(x)) for x in sources]
+    success, pairs = matchGroups(numpy.array(s, dtype=float).reshape(-1, 3),
+                                 numpy.array(t, dtype=float).reshape(-1, 3))
+    if not success:
+        return False, list(enumerate(s))
+    return True, [((i, s[i]), (j, t[j])) for i, j in pairs]
+
+
+def KMean2(points, groups=None, key=()):
     """
-    :param points: [(enumerate, Vector)]
-    :param groups: None or [(enumerate, Vector), (enumerate, Vector)]
-                            group 1              group 2
+    :param points: array of shape (n, 3)
+    :param groups: None or a bool array that is True for the points in the
+                   first group
+    :param key: the ins_random key the starting points are picked with
+    :returns: (groups, group1pos, group2pos)
     """
-    assert isinstance(points[0][0], int) and isinstance(points[0][1], Vector),\
-        "points is in the wrong format"
-    if groups:
-        group1pos = Vector()
-        for p in groups[0]:
-            group1pos += p[1]
-        group1pos /= len(groups[0])
-
-        group2pos = Vector()
-        for p in groups[1]:
-            group2pos += p[1]
-        group2pos /= len(groups[1])
+    if groups is not None:
+        count = numpy.count_nonzero(groups)
+        group1pos = points[groups].sum(axis=0) / count
+        group2pos = points[~groups].sum(axis=0) / (len(points) - count)
     else:
-        group1pos = choice(points)[1]
-        group2pos = choice(points)[1]
-        while group1pos == group2pos:
-            group2pos = choice(points)[1]
-
-    assert isinstance(group1pos, Vector), "Should be converted to Vector"
-    assert isinstance(group2pos, Vector), "Should be converted to Vector"
-
-    groups = [[], []]
-
-    for p in points:
-        d1 = (p[1].x - group1pos.x)**2 + (p[1].y - group1pos.y)**2 \
-            + (p[1].z - group1pos.z)**2
-        d2 = (p[1].x - group2pos.x)**2 + (p[1].y - group2pos.y)**2 \
-            + (p[1].z - group2pos.z)**2
-        if d1 < d2:
-            groups[0].append(p)
-        else:
-            groups[1].append(p)
+        group1pos = ins_random.choice(points, *key, 0)
+        group2pos = ins_random.choice(points, *key, 1)
+        draw = 2
+        while (group1pos == group2pos).all():
+            group2pos = ins_random.choice(points, *key, draw)
+            draw += 1
 
-    assert len(groups[0]) != 0 and len(groups[1]) != 0, "ERROR" + str(groups)
+    d1 = ((points - group1pos)**2).sum(axis=1)
+    d2 = ((points - group2pos)**2).sum(axis=1)
+    groups = d1 < d2
+
+    count = numpy.count_nonzero(groups)
+    assert 0 < count < len(points), "ERROR" + str(groups)
 
     return groups, group1pos, group2pos
 
 
-def iterateKMean2(points, iterations=5):
+def iterateKMean2(points, iterations=5, key=()):
     """
-    :type points: [(int, Vector)]
+    :type points: array of shape (n, 3)
     """
     groups = None
     for i in range(iterations):
-        groups, group1pos, group2pos = KMean2(points, groups=groups)
+        groups, group1pos, group2pos = KMean2(points, groups=groups, key=key)
     return groups, group1pos, group2pos
 
 
 def splitGroupOnLine(points, group1pos, group2pos, groupSizes):
-    """
-    :type points: [(int, Vector)]
-    :type group1pos: Vector
-    :type group2pos: Vector
+    """Split points into groups of at most groupSizes along the line from
+    group1pos to group2pos.
+
+    :type points: array of shape (n, 3)
     :type groupSizes: (int, int)
+    :returns: (indices of group 1, indices of group 2)
     """
-    if len(points) > sum(groupSizes):
+    n = len(points)
+    if n > sum(groupSizes):
         return False
-    order = sortAlongLine(points, group1pos, group2pos, access=lambda x: x[1],
-                          incTValue=True)
-    # typ order: [(float, (int, Vector))]
-    #          t value, objIndex, position
-    groups = [[], []]
-    for o in order:
-        if o[0] < 0.5:
-            groups[0].append(o[1])
-        else:
-            groups[1].append(o[1])
-    while len(groups[0]) > groupSizes[0]:
-        groups[1].append(groups[0].pop())
-    while len(groups[1]) > groupSizes[1]:
-        groups[0].append(groups[1].pop(0))
+    line = group2pos - group1pos
+    t = ((points - group1pos) * line).sum(axis=1) / numpy.sqrt(
+        (line**2).sum())
+    order = numpy.argsort(t, kind="mergesort")
+    below = int((t < 0.5).sum())
+    if below > groupSizes[0]:
+        # The furthest along of the first group are moved to the end of
+        #  the second group one at a time
+        return (order[:groupSizes[0]],
+                numpy.concatenate((order[below:],
+                                   order[groupSizes[0]:below][::-1])))
+    below = max(below, n - groupSizes[1])
+    return order[:below], order[below:]
+
+
+def splitGroups(sources, targets, leafSize=1, key=()):
+    """Split the sources and targets in two along the line between the
+    clusters of the targets over and over until there are at most leafSize
+    sources in each group.
+
+    Each split is seeded with key and its place in the tree of splits, so
+    the same key always gives the same splits and stopping at a larger
+    leafSize gives the same groups as stopping at a smaller one and joining
+    the groups that share a parent.
+
+    :type sources: array of shape (n, 3)
+    :type targets: array of shape (m, 3) with m >= n
+    :returns: list of (source indices, target indices), with at least as
+              many targets as sources in each
+    """
+    groups = []
+    # Each entry is the indices of a group of sources and their targets and
+    #  the group's place in the tree of splits. The first group is on the
+    #  top of the stack so the groups come out in the same order as
+    #  splitting them recursively would.
+    stack = [(numpy.arange(len(sources)), numpy.arange(len(targets)), 1)]
+    while stack:
+        src, tgt, node = stack.pop()
+        if len(src) == 0:
+            # This occurs when there are more targets than sources
+            continue
+        if len(src) <= leafSize:
+            groups.append((src, tgt))
+            continue
+        t1, t2, t3 = iterateKMean2(targets[tgt], key=key + (node,))
+        first = tgt[t1]
+        second = tgt[~t1]
+        s1 = splitGroupOnLine(sources[src], t2, t3,
+                              groupSizes=(len(first), len(second)))
+        stack.append((src[s1[1]], second, 2 * node + 1))
+        stack.append((src[s1[0]], first, 2 * node))
     return groups
 
 
-def matchGroups(sources, targets):
+def matchGroups(sources, targets, key=()):
     """
-    returns False if not all the sources match and a list of tuples of the
-    indexes of pairs and the paired objects.
-
-    :type sources: [(int, Vector)]
-    :type targets: [(int, Vector)]
+    returns False if not all the sources match and a list of the indices of
+    the pairs of sources and targets.
 
+    :type sources: array of shape (n, 3)
+    :type targets: array of shape (m, 3)
+    :param key: the ins_random key the splits are seeded with
     """
-    if len(sources) == 0:
-        # This occurs when there are more targets than sources
-        return True, []
-
-    assert isinstance(targets[0][0], int), "Actual val"+str(targets[0])
-    assert isinstance(sources[0][0], int), "Actual val"+str(sources[0])
-
     if len(sources) > len(targets):
-        return False, sources
-    elif len(sources) == 1:
-        if len(targets) == 1:
-            return True, [(sources[0], targets[0])]
-        closest = min(targets, key=lambda x: x[1].x**2 + x[1].y**2 + x[1].z**2)
-        return True, [(sources[0], closest)]
-    else:
-        t1, t2, t3 = iterateKMean2(targets)
-        s1 = splitGroupOnLine(sources, t2, t3,
-                              groupSizes=(len(t1[0]), len(t1[1])))
-
-        group1Success, group1 = matchGroups(s1[0], t1[0])
-        assert group1Success, "Something has gone wrong in matchGroups"
-        group2Success, group2 = matchGroups(s1[1], t1[1])
-        assert group2Success, "Something has gone wrong in matchGroups"
-        return True, group1 + group2
+        return False, None
+
+    pairs = []
+    for src, tgt in splitGroups(sources, targets, key=key):
+        if len(tgt) == 1:
+            pairs.append((int(src[0]), int(tgt[0])))
+        else:
+            closest = (targets[tgt]**2).sum(axis=1).argmin()
+            pairs.append((int(src[0]), int(tgt[closest])))
+    return True, pairs
 
 # ======================================================================
 
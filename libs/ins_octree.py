@@ -1,54 +1,26 @@
-"""For basic use import createOctreeFromBPYObjs from this module, pass it a
-list of BPY objects and use the resulting octree for accellerated bounding box
-collision detection and point intersection tests.
-"""
-
-try:
-    from ins_vector import Vector
-except:
-    from mathutils import Vector
-
-import bpy
-
-#  TODO use Vector for locations and dimensions
+"""For basic use import createOctreeFromBPYObjs from ins_bpyAdapter, pass it
+a list of BPY objects and use the resulting octree for accellerated bounding
+box collision detection and point intersection tests.
 
+createLinearOctree makes an octree stored in flat numpy arrays that answers
+many point or box queries at once.
 
-def boundingBoxFromBPY(ob, overwriteRadii=None):
-    corners = [ob.matrix_world * Vector(corner) for corner in ob.bound_box]
+LooseOctree holds moving spheres and can be updated as they move instead of
+being rebuilt.
 
-    # Visualise the corners. WARNING: Extremely slow
-    """for x in range(8):
-        bpy.ops.object.empty_add(type='PLAIN_AXES')
-        ob = bpy.context.object
-        ob.location = corners[x]"""
-
-    minx = min([c[0] for c in corners])
-    miny = min([c[1] for c in corners])
-    minz = min([c[2] for c in corners])
-
-    radiusx = (max([c[0] for c in corners]) - minx)/2
-    radiusy = (max([c[1] for c in corners]) - miny)/2
-    radiusz = (max([c[2] for c in corners]) - minz)/2
-
-    x = minx + radiusx
-    y = miny + radiusy
-    z = minz + radiusz
-
-    if overwriteRadii:
-        radiusx, radiusy, radiusz = overwriteRadii
+createAggregateOctree makes an octree of weighted points where distant groups
+of points can be summarised as a single point (Barnes-Hut).
+"""
 
-    # Visualise the box. WARNING: Very slow
-    """bpy.ops.mesh.primitive_cube_add()
-    ob = bpy.context.object
-    ob.dimensions = (dimx, dimy, dimz)
-    ob.location = (x + (dimx/2), y + (dimy/2), z + (dimz/2))"""
-    return BoundingBox((x, y, z), (radiusx, radiusy, radiusz), ob.name)
+try:
+    from .ins_broadphase import collisionPairs, expandRanges
+except (ImportError, SystemError):
+    from ins_broadphase import collisionPairs, expandRanges
 
+import math
+import numpy
 
-def boundingSphereFromBPY(ob, overwriteRadii=None):
-    bb = boundingBoxFromBPY(ob, overwriteRadii=overwriteRadii)
-    bb.isSphere = True
-    return bb
+#  TODO use Vector for locations and dimensions
 
 
 class BoundingBox:
@@ -143,19 +115,184 @@ def createOctree(boundingBoxes):
     return ot
 
 
-def createOctreeFromBPYObjs(objs, allSpheres=True, radii=None):
-    """The function you want to import from this module in most cases.
-    If radii is left as default then the radius will be calculated from the
-    object."""
-    bbs = []
+def createLinearOctree(boundingBoxes, leafSize=8):
+    """Make a LinearOctree from bounding boxes"""
+    return LinearOctree([b.pos for b in boundingBoxes],
+                        [b.dim for b in boundingBoxes],
+                        [b.isSphere for b in boundingBoxes],
+                        [b.original for b in boundingBoxes], leafSize)
+
+
+MORTON_BITS = 10
+"""Bits per axis of the Morton codes. The tree is at most this deep"""
 
-    for n, ob in enumerate(objs):
-        if allSpheres:
-            bbs.append(boundingSphereFromBPY(ob, overwriteRadii=radii[n]))
+
+def mortonCodes(points):
+    """Interleave the bits of points quantised to a MORTON_BITS grid over
+    their bounding box so that sorting by the codes keeps nearby points
+    together
+
+    :param points: array of shape (n, 3)
+    :returns: int64 array of shape (n,)
+    """
+    low = points.min(axis=0)
+    extent = numpy.maximum(points.max(axis=0) - low, 1e-9)
+    scale = ((1 << MORTON_BITS) - 1) / extent
+    grid = ((points - low) * scale).astype(numpy.int64)
+    codes = numpy.zeros(len(points), dtype=numpy.int64)
+    for bit in range(MORTON_BITS):
+        for axis in range(3):
+            codes |= ((grid[:, axis] >> bit) & 1) << (3 * bit + 2 - axis)
+    return codes
+
+
+class LinearOctree:
+    """An octree over the centres of spheres and boxes stored in flat numpy
+    arrays. The items are sorted by Morton code so every node is a range of
+    consecutive items, and the bounds of each node cover all of its items so
+    no item is stored twice."""
+    def __init__(self, positions, radii, isSphere, originals, leafSize=8):
+        """
+        :param positions: centres, [(float, float, float)]
+        :param radii: half the size along each axis, [(float, float, float)]
+        :param isSphere: [bool] spheres use the largest of their radii
+        :param originals: returned by checkPoint. Not touched in code
+        """
+        self.originals = list(originals)
+        n = len(self.originals)
+        pos = numpy.array(positions, dtype=float).reshape(n, 3)
+        radii = numpy.array(radii, dtype=float).reshape(n, 3)
+        sphere = numpy.array(isSphere, dtype=bool).reshape(n)
+        radii[sphere] = radii[sphere].max(axis=1)[:, None]
+
+        codes = mortonCodes(pos) if n else numpy.zeros(0, dtype=numpy.int64)
+        self.order = numpy.argsort(codes, kind="mergesort")
+        """The original index of each item in sorted order"""
+        codes = codes[self.order]
+        self.pos = pos[self.order]
+        self.radii = radii[self.order]
+        self.isSphere = sphere[self.order]
+
+        starts = [numpy.zeros(1, dtype=int)]
+        ends = [numpy.full(1, n, dtype=int)]
+        firstChild = []
+        childCount = []
+        count = 1
+        for level in range(MORTON_BITS + 1):
+            s, e = starts[-1], ends[-1]
+            split = (e - s > leafSize) & (level < MORTON_BITS)
+            if not split.any():
+                firstChild.append(numpy.zeros(len(s), dtype=int))
+                childCount.append(numpy.zeros(len(s), dtype=int))
+                break
+            # Runs of items that share the next octant are the children
+            prefix = codes >> (3 * (MORTON_BITS - level - 1))
+            runStarts = numpy.concatenate(
+                ([0], numpy.flatnonzero(numpy.diff(prefix)) + 1))
+            runEnds = numpy.append(runStarts[1:], n)
+            # Runs inside leaves from earlier levels have no parent here
+            parent = numpy.searchsorted(s, runStarts, side="right") - 1
+            parent = numpy.maximum(parent, 0)
+            keep = (runStarts >= s[parent]) & (runStarts < e[parent]) & \
+                split[parent]
+            parent = parent[keep]
+            runStarts, runEnds = runStarts[keep], runEnds[keep]
+            counts = numpy.bincount(parent, minlength=len(s))
+            firstChild.append(count + numpy.cumsum(counts) - counts)
+            childCount.append(counts)
+            count += len(runStarts)
+            starts.append(runStarts)
+            ends.append(runEnds)
+
+        self.start = numpy.concatenate(starts)
+        self.end = numpy.concatenate(ends)
+        self.firstChild = numpy.concatenate(firstChild)
+        self.childCount = numpy.concatenate(childCount)
+
+        # Padded with one item so the end of the last node can be an index
+        low = numpy.vstack((self.pos - self.radii, numpy.zeros((1, 3))))
+        high = numpy.vstack((self.pos + self.radii, numpy.zeros((1, 3))))
+        if n:
+            ranges = numpy.column_stack((self.start, self.end)).ravel()
+            self.low = numpy.minimum.reduceat(low, ranges, axis=0)[::2]
+            self.high = numpy.maximum.reduceat(high, ranges, axis=0)[::2]
         else:
-            bbs.append(boundingBoxFromBPY(ob, overwriteRadii=radii[n]))
+            self.low = numpy.full((1, 3), numpy.inf)
+            self.high = numpy.full((1, 3), -numpy.inf)
 
-    return createOctree(bbs)
+    def query(self, low, high, testItems):
+        """Walk the tree one level at a time for all the queries together.
+
+        :param low: array of shape (q, 3), lower corner of each query
+        :param high: array of shape (q, 3), upper corner of each query
+        :param testItems: function(queries, items) returning a bool array of
+                          which of the pairs (in sorted order) really match
+        :returns: (query indices, original item indices)
+        """
+        queries = numpy.arange(len(low))
+        nodes = numpy.zeros(len(low), dtype=int)
+        foundQueries = []
+        foundItems = []
+        while len(queries):
+            overlap = numpy.all((low[queries] <= self.high[nodes]) &
+                                (high[queries] >= self.low[nodes]), axis=1)
+            queries = queries[overlap]
+            nodes = nodes[overlap]
+
+            leaf = self.childCount[nodes] == 0
+            counts = self.end[nodes[leaf]] - self.start[nodes[leaf]]
+            itemQueries = numpy.repeat(queries[leaf], counts)
+            items = expandRanges(self.start[nodes[leaf]], counts)
+            hit = testItems(itemQueries, items)
+            foundQueries.append(itemQueries[hit])
+            foundItems.append(self.order[items[hit]])
+
+            queries = queries[~leaf]
+            nodes = nodes[~leaf]
+            counts = self.childCount[nodes]
+            queries = numpy.repeat(queries, counts)
+            nodes = expandRanges(self.firstChild[nodes], counts)
+        if not foundQueries:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+        return numpy.concatenate(foundQueries), numpy.concatenate(foundItems)
+
+    def checkPoints(self, points):
+        """Which items each point is inside
+
+        :param points: array of shape (q, 3)
+        :returns: (point indices, item indices) of every point in an item
+        """
+        points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+
+        def testItems(queries, items):
+            diff = points[queries] - self.pos[items]
+            radii = self.radii[items]
+            inBox = numpy.all(numpy.abs(diff) <= radii, axis=1)
+            inSphere = (diff**2).sum(axis=1) < radii[:, 0]**2
+            return numpy.where(self.isSphere[items], inSphere, inBox)
+        return self.query(points, points, testItems)
+
+    def checkBoxes(self, low, high):
+        """Which items overlap each of the axis aligned boxes
+
+        :param low: array of shape (q, 3), lower corner of each box
+        :param high: array of shape (q, 3), upper corner of each box
+        :returns: (box indices, item indices) of every overlapping pair
+        """
+        low = numpy.asarray(low, dtype=float).reshape(-1, 3)
+        high = numpy.asarray(high, dtype=float).reshape(-1, 3)
+
+        def testItems(queries, items):
+            itemLow = self.pos[items] - self.radii[items]
+            itemHigh = self.pos[items] + self.radii[items]
+            return numpy.all((low[queries] <= itemHigh) &
+                             (high[queries] >= itemLow), axis=1)
+        return self.query(low, high, testItems)
+
+    def checkPoint(self, point):
+        """The originals of the items that point is inside"""
+        items = self.checkPoints([point])[1]
+        return set(self.originals[i] for i in items.tolist())
 
 
 class Octree:
@@ -255,10 +392,35 @@ class Octree:
             intersects = intersects.union(self.cells[6].checkPoint(point))
         return intersects
 
-    def checkCollisions(self, failed=set(), collided=set()):
-        """The collided set will be updated and returned"""
+    def allItems(self):
+        """Every bounding box in the tree, once each"""
+        items = {}
         for cell in self.cells:
-            cell.checkCollisions(failed, collided)
+            if isinstance(cell, Octree):
+                for item in cell.allItems():
+                    items[id(item)] = item
+            else:
+                for item in cell.contents:
+                    items[id(item)] = item
+        return list(items.values())
+
+    def checkCollisions(self, failed=None, collided=None):
+        """The collided set will be updated and returned. It contains pairs
+        of overlapping bounding boxes with the lower original first. failed
+        is not used and is only here for compatibility."""
+        if collided is None:
+            collided = set()
+        items = self.allItems()
+        if len(items) < 2:
+            return collided
+        pairs = collisionPairs([b.pos for b in items], [b.dim for b in items],
+                               [b.isSphere for b in items])
+        for i, j in pairs.tolist():
+            a = items[i]
+            b = items[j]
+            if b.original < a.original:
+                a, b = b, a
+            collided.add((a, b))
         return collided
 
     def printTree(self, depth=0):
@@ -305,24 +467,358 @@ class Leaf:
                 result.add(item.original)
         return result
 
-    def checkCollisions(self, failed, collided):
-        """Tested is a dictionary {pair with lower name first: boolean}"""
-        for outer in self.contents:
-            for inner in self.contents:
-                if outer != inner:
-                    f = lambda x: x.original
-                    key = (min(outer, inner, key=f), max(outer, inner, key=f))
-                    if key not in failed and key not in collided:
-                        if outer.checkCollisionWithBB(inner):
-                            collided.add(key)
-                        else:
-                            failed.add(key)
-
     def printTree(self, depth=0):
         print(depth*"--", [c.original for c in self.contents])
 
 
+class LooseOctree:
+    """An octree of moving spheres that can be updated in place. Each level
+    of the tree is a hash of the cells that have something in them. Cells
+    on level l are cellSize * 2**l wide and hold the spheres whose centres
+    are in them and whose diameters are at most the width of the cell, so a
+    sphere only has to move when its centre crosses into another cell."""
+    def __init__(self, cellSize=1.0):
+        self.cellSize = cellSize
+        self.cells = {}
+        """{(level, i, j, k): set of items}"""
+        self.levels = {}
+        """{level: number of items on that level}"""
+        self.index = {}
+        """{item: row in the arrays below}"""
+        self.items = []
+        # The arrays have spare rows at the end so adding is cheap. Only the
+        #  first len(self.items) rows are used.
+        self.pos = numpy.zeros((16, 3))
+        self.radius = numpy.zeros(16)
+        self.level = numpy.zeros(16, dtype=int)
+        self.cell = numpy.zeros((16, 3), dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def levelFor(self, radius):
+        if radius <= self.cellSize / 2:
+            return 0
+        return int(math.ceil(math.log(2 * radius / self.cellSize, 2)))
+
+    def size(self, level):
+        return self.cellSize * 2**level
+
+    def cellOf(self, pos, level):
+        size = self.size(level)
+        return tuple(int(math.floor(p / size)) for p in pos)
+
+    def link(self, item, level, cell):
+        key = (level,) + tuple(cell)
+        if key in self.cells:
+            self.cells[key].add(item)
+        else:
+            self.cells[key] = {item}
+
+    def unlink(self, item, level, cell):
+        key = (level,) + tuple(cell)
+        contents = self.cells[key]
+        contents.discard(item)
+        if not contents:
+            del self.cells[key]
+
+    def reserve(self, count):
+        """Make sure the arrays have room for count rows"""
+        capacity = len(self.radius)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        used = len(self.items)
+        for name in ("pos", "radius", "level", "cell"):
+            old = getattr(self, name)
+            new = numpy.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:used] = old[:used]
+            setattr(self, name, new)
+
+    def insert(self, item, pos, radius):
+        """Add a sphere to the tree"""
+        self.insertBatch([item], [pos], [radius])
+
+    def insertBatch(self, items, positions, radii):
+        """Add many spheres to the tree at once"""
+        items = list(items)
+        for item in items:
+            if item in self.index:
+                self.remove(item)
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+        radii = numpy.asarray(radii, dtype=float).reshape(-1)
+        levels = [self.levelFor(r) for r in radii.tolist()]
+        sizes = self.cellSize * 2.0**numpy.array(levels)
+        cells = numpy.floor(positions / sizes[:, None]).astype(numpy.int64)
+
+        start = len(self.items)
+        end = start + len(items)
+        self.reserve(end)
+        self.pos[start:end] = positions
+        self.radius[start:end] = radii
+        self.level[start:end] = levels
+        self.cell[start:end] = cells
+        for row, (item, level, cell) in enumerate(zip(items, levels,
+                                                      cells.tolist())):
+            self.index[item] = start + row
+            self.items.append(item)
+            self.levels[level] = self.levels.get(level, 0) + 1
+            self.link(item, level, cell)
+
+    def remove(self, item):
+        """Take item out of the tree. The last row is moved into its place"""
+        row = self.index.pop(item)
+        level = int(self.level[row])
+        self.unlink(item, level, self.cell[row].tolist())
+        self.levels[level] -= 1
+        if not self.levels[level]:
+            del self.levels[level]
+        last = len(self.items) - 1
+        if row != last:
+            moved = self.items[last]
+            self.items[row] = moved
+            self.index[moved] = row
+            for array in (self.pos, self.radius, self.level, self.cell):
+                array[row] = array[last]
+        self.items.pop()
+
+    def update(self, item, pos, radius=None):
+        """Move item to pos. It only changes cell if it has left its cell"""
+        row = self.index[item]
+        if radius is not None and radius != self.radius[row]:
+            self.insert(item, pos, radius)
+            return
+        self.pos[row] = pos
+        level = int(self.level[row])
+        cell = self.cellOf(pos, level)
+        old = tuple(self.cell[row].tolist())
+        if cell != old:
+            self.unlink(item, level, old)
+            self.link(item, level, cell)
+            self.cell[row] = cell
+
+    def updateBatch(self, items, positions):
+        """Move many items at once
+
+        :param positions: array of shape (n, 3)
+        """
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+        rows = numpy.array([self.index[i] for i in items], dtype=int)
+        if not len(rows):
+            return
+        self.pos[rows] = positions
+        sizes = self.cellSize * 2.0**self.level[rows]
+        cells = numpy.floor(positions / sizes[:, None]).astype(numpy.int64)
+        moved = numpy.any(cells != self.cell[rows], axis=1)
+        for row, cell in zip(rows[moved].tolist(), cells[moved].tolist()):
+            level = int(self.level[row])
+            item = self.items[row]
+            self.unlink(item, level, self.cell[row].tolist())
+            self.link(item, level, cell)
+        self.cell[rows] = cells
+
+    def candidates(self, low, high):
+        """Items in cells that could overlap the box from low to high"""
+        found = []
+        for level in self.levels:
+            size = self.size(level)
+            # Spheres stick out of their cells by up to half a cell
+            ranges = [range(int(math.ceil(lo / size - 1.5)),
+                            int(math.floor(hi / size + 0.5)) + 1)
+                      for lo, hi in zip(low, high)]
+            for i in ranges[0]:
+                for j in ranges[1]:
+                    for k in ranges[2]:
+                        contents = self.cells.get((level, i, j, k))
+                        if contents:
+                            found += contents
+        return found
+
+    def checkPoint(self, point):
+        """The items whose spheres point is inside"""
+        found = self.candidates(point, point)
+        if not found:
+            return set()
+        rows = numpy.array([self.index[i] for i in found], dtype=int)
+        dist = ((self.pos[rows] - numpy.array(point))**2).sum(axis=1)
+        inside = dist < self.radius[rows]**2
+        return set(found[r] for r in numpy.flatnonzero(inside).tolist())
+
+    def checkBox(self, low, high):
+        """The items whose spheres' bounding boxes overlap the box"""
+        found = self.candidates(low, high)
+        if not found:
+            return set()
+        rows = numpy.array([self.index[i] for i in found], dtype=int)
+        radius = self.radius[rows][:, None]
+        overlap = numpy.all((self.pos[rows] - radius <= high) &
+                            (self.pos[rows] + radius >= low), axis=1)
+        return set(found[r] for r in numpy.flatnonzero(overlap).tolist())
+
+
+def createAggregateOctree(points, weights, leafSize=8):
+    """Make an AggregateOctree from a list of (x, y, z) and a weight for
+    each point"""
+    return AggregateOctree(points, weights, leafSize=leafSize)
+
+
+class AggregateNode:
+    """A cell of an AggregateOctree"""
+    __slots__ = ("centre", "half", "centreOfMass", "weight", "maxWeight",
+                 "count", "representative", "children", "items")
+
+    def __init__(self, centre, half):
+        self.centre = centre  # (float, float, float)  # Middle of the cell
+        self.half = half  # float  # Half the length of the sides of the cell
+        self.centreOfMass = centre  # (float, float, float)
+        self.weight = 0  # Sum of the weights of the points in the cell
+        self.maxWeight = 0  # Largest weight of a point in the cell
+        self.count = 0  # Number of points in the cell
+        self.representative = None  # Index of point closest to centreOfMass
+        self.children = []  # [AggregateNode] empty for leaves
+        self.items = None  # [int] indices of points. None for branches
+
+    def minDistanceSquared(self, point):
+        """Squared distance from point to the nearest part of this cell"""
+        total = 0
+        for a in range(3):
+            d = abs(point[a] - self.centre[a]) - self.half
+            if d > 0:
+                total += d*d
+        return total
+
+    def contains(self, point):
+        for a in range(3):
+            if abs(point[a] - self.centre[a]) > self.half:
+                return False
+        return True
+
+
+class AggregateOctree:
+    """An octree over points where each cell also records the combined
+    weight and the weighted centre of the points inside it. This allows
+    distant groups of points to be treated as a single point (Barnes-Hut)"""
+    def __init__(self, points, weights, leafSize=8):
+        """
+        :param points: [(float, float, float)]
+        :param weights: [float] one for each of points
+        :param leafSize: the max number of points in a leaf
+        """
+        self.points = [tuple(p) for p in points]
+        self.weights = list(weights)
+        self.leafSize = leafSize
+
+        if len(self.points) == 0:
+            self.root = AggregateNode((0, 0, 0), 0)
+            self.root.items = []
+            return
+
+        lower = [min(p[a] for p in self.points) for a in range(3)]
+        upper = [max(p[a] for p in self.points) for a in range(3)]
+        centre = tuple((lower[a] + upper[a])/2 for a in range(3))
+        half = max(upper[a] - lower[a] for a in range(3))/2 + 0.0001
+
+        self.root = self.build(list(range(len(self.points))), centre, half, 0)
+
+    def build(self, indices, centre, half, depth):
+        node = AggregateNode(centre, half)
+        points = self.points
+        weights = self.weights
+
+        total = 0
+        com = [0, 0, 0]
+        for i in indices:
+            w = weights[i]
+            total += w
+            node.maxWeight = max(node.maxWeight, w)
+            for a in range(3):
+                com[a] += points[i][a] * w
+        node.count = len(indices)
+        node.weight = total
+        if total > 0:
+            node.centreOfMass = tuple(c/total for c in com)
+        else:
+            node.centreOfMass = tuple(sum(points[i][a] for i in indices) /
+                                      len(indices) for a in range(3))
+        cm = node.centreOfMass
+        node.representative = min(indices, key=lambda i: (
+            (points[i][0] - cm[0])**2 + (points[i][1] - cm[1])**2 +
+            (points[i][2] - cm[2])**2))
+
+        if len(indices) <= self.leafSize or depth >= 16:
+            node.items = indices
+            return node
+
+        octants = {}
+        for i in indices:
+            p = points[i]
+            key = (p[0] >= centre[0], p[1] >= centre[1], p[2] >= centre[2])
+            if key in octants:
+                octants[key].append(i)
+            else:
+                octants[key] = [i]
+
+        quarter = half/2
+        for key, contents in octants.items():
+            childCentre = tuple(centre[a] + (quarter if key[a] else -quarter)
+                                for a in range(3))
+            node.children.append(self.build(contents, childCentre, quarter,
+                                            depth + 1))
+        return node
+
+    def query(self, point, theta=0.5):
+        """Find the points and groups of points that could be within range of
+        point (where the weight of each point is its range).
+
+        :param point: (float, float, float)
+        :param theta: accuracy threshold. A cell is used as a single point
+                        when its width / distance to its centre is below this.
+                        0 always returns individual points.
+        :returns: the indices of single points and the cells that summarise
+                    groups of distant points
+        :rtype: ([int], [AggregateNode])
+        """
+        singles = []
+        groups = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.count == 0:
+                continue
+            if node.minDistanceSquared(point) > node.maxWeight**2:
+                # Nothing in this cell can reach the point
+                continue
+            if node.items is not None:
+                singles += node.items
+                continue
+            com = node.centreOfMass
+            dist = ((point[0] - com[0])**2 + (point[1] - com[1])**2 +
+                    (point[2] - com[2])**2)**0.5
+            if dist > 0 and (2 * node.half) / dist < theta and\
+                    not node.contains(point):
+                groups.append(node)
+            else:
+                stack += node.children
+        return singles, groups
+
+
+# The functions that take Blender objects are in ins_bpyAdapter so that this
+# module can be used without Blender. They are imported here for older code.
+try:
+    from .ins_bpyAdapter import (boundingBoxFromBPY, boundingSphereFromBPY,
+                                 createOctreeFromBPYObjs)
+except (ImportError, SystemError):
+    from ins_bpyAdapter import (boundingBoxFromBPY, boundingSphereFromBPY,
+                                createOctreeFromBPYObjs)
+
+
 if __name__ == "__main__":
+    import bpy
+
     """
     bbs = []
     for ob in bpy.context.scene.objects:
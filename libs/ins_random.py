@@ -0,0 +1,108 @@
+"""Counter based random numbers. Instead of drawing from a generator that
+carries state the numbers are a hash of a key, for example the agent, the
+frame, the node and how many numbers have been drawn. The same key always
+gives the same number, in any order, in any process and on any machine.
+
+The hash is SplitMix64. Strings are hashed with md5 rather than hash() which
+is salted differently in every Python process.
+"""
+
+import functools
+import hashlib
+import struct
+
+import numpy
+
+MASK = 0xFFFFFFFFFFFFFFFF
+GAMMA = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+
+
+def splitmix64(x):
+    """Scramble a 64 bit integer"""
+    z = (x + GAMMA) & MASK
+    z = ((z ^ (z >> 30)) * MIX1) & MASK
+    z = ((z ^ (z >> 27)) * MIX2) & MASK
+    return z ^ (z >> 31)
+
+
+def splitmix64Array(x):
+    """splitmix64 of every element of a uint64 array"""
+    z = x + numpy.uint64(GAMMA)
+    z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(MIX1)
+    z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(MIX2)
+    return z ^ (z >> numpy.uint64(31))
+
+
+@functools.lru_cache(maxsize=65536)
+def _stringHash(value):
+    digest = hashlib.md5(value.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def stableHash(value):
+    """A 64 bit hash of an int, float, str or tuple of them that is the same
+    in every process"""
+    if isinstance(value, int):
+        return value & MASK
+    if isinstance(value, str):
+        return _stringHash(value)
+    if isinstance(value, float):
+        return struct.unpack("<Q", struct.pack("<d", value))[0]
+    if isinstance(value, tuple):
+        return combine(*value)
+    raise TypeError("Can't hash " + type(value).__name__)
+
+
+def combine(*key):
+    """Hash all the parts of key together"""
+    h = 0
+    for part in key:
+        h = splitmix64(h ^ stableHash(part))
+    return h
+
+
+def random(*key):
+    """A number in the range [0, 1) that only depends on key"""
+    return (combine(*key) >> 11) * (1.0 / 2**53)
+
+
+def uniform(a, b, *key):
+    """A number between a and b that only depends on key"""
+    return a + (b - a) * random(*key)
+
+
+def choice(sequence, *key):
+    """An item of sequence that only depends on key"""
+    return sequence[int(random(*key) * len(sequence))]
+
+
+def randomArray(counters, *key):
+    """random(*key, c) for every integer c in counters, as an array
+
+    :param counters: int array or the number of counters to start from 0
+    """
+    if isinstance(counters, int):
+        counters = numpy.arange(counters)
+    counters = numpy.asarray(counters).astype(numpy.uint64)
+    x = splitmix64Array(numpy.uint64(combine(*key)) ^ counters)
+    return (x >> numpy.uint64(11)) * (1.0 / 2**53)
+
+
+if __name__ == "__main__":
+    import time
+
+    values = randomArray(100000, "agent", 12)
+    for c in range(0, 100000, 997):
+        assert values[c] == random("agent", 12, c)
+    print("mean", values.mean(), "variance", values.var())
+    print("first values", [random("agent", 12, c) for c in range(3)])
+
+    t = time.time()
+    for c in range(100000):
+        random("Agent.001", 250, "Noise", c)
+    print("100000 scalar draws", time.time() - t, "seconds")
+    t = time.time()
+    randomArray(1000000, "Agent.001", 250, "Noise")
+    print("1000000 array draws", time.time() - t, "seconds")
@@ -2,9 +2,11 @@ try:
     from mathutils import Vector
 except:
     class Vector:
+        """Stand in for mathutils.Vector so that the libs can be used outside
+        of Blender. Only the parts used by the libs are implemented."""
         def __init__(self, *args):
             if args:
-                self._vec = args[0]
+                self._vec = tuple(args[0])
             else:
                 self._vec = (0, 0, 0)
 
@@ -21,6 +23,12 @@ except:
         def __sub__(self, sub):
             return Vector([a - b for a, b in zip(self, sub)])
 
+        def __isub__(self, sub):
+            return Vector([a - b for a, b in zip(self, sub)])
+
+        def __neg__(self):
+            return Vector([-x for x in self])
+
         def __iter__(self):
             return iter(self._vec)
 
@@ -49,38 +57,107 @@ except:
             return sum([a*b for a, b in zip(self, other)])
 
         def __mul__(self, mul):
-            if isinstance(mul, int) or isinstance(mul, float):
+            if isinstance(mul, (int, float)):
                 return Vector([x*mul for x in self])
             else:
                 return self.dot(mul)
 
         def __rmul__(self, mul):
-            return self.__mul__(self, mul)
+            return self.__mul__(mul)
+
+        def __imul__(self, mul):
+            return self.__mul__(mul)
 
         def __truediv__(self, div):
-            if isinstance(div, int) or isinstance(div, float):
+            if isinstance(div, (int, float)):
                 return Vector([x/div for x in self])
+            return NotImplemented
 
         def __itruediv__(self, div):
-            if isinstance(div, int) or isinstance(div, float):
-                return Vector([x/div for x in self])
+            return self.__truediv__(div)
 
         @property
         def length(self):
+            return self.length_squared**0.5
+
+        @property
+        def length_squared(self):
             return sum([x**2 for x in self])
 
+        def normalized(self):
+            length = self.length
+            if length == 0:
+                return Vector(self)
+            return self / length
+
+        def to_tuple(self):
+            return self._vec
+
         def __eq__(self, eq):
-            if not isinstance(eq, Vector) or (self.length() != eq.length()):
+            if not isinstance(eq, Vector) or len(self) != len(eq):
                 return False
-            for d1, d2 in zip(self._vec, eq._vec):
-                if d1 != d2:
-                    return False
-            return True
+            return self._vec == eq._vec
+
+        def __ne__(self, ne):
+            return not self.__eq__(ne)
+
+        __hash__ = None
 
         def __repr__(self):
             return "Vector" + self._vec.__str__()
 
 
+def transformPoints(matrix, points):
+    """Apply a 4x4 matrix to each point (the same as matrix * point in
+    mathutils).
+
+    :param matrix: 4x4 matrix as anything numpy can turn into an array
+    :param points: array of shape (n, 3)
+    :returns: array of shape (n, 3)
+    """
+    import numpy
+    matrix = numpy.array(tuple(tuple(row) for row in matrix), dtype=float)
+    points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+    return points.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def rotationArrays(eulers):
+    """The matrices that move world space vectors into the local space of
+    objects with these rotations (the same as X * Y * Z in mathutils).
+
+    :param eulers: array of shape (n, 3) of XYZ euler rotations
+    :returns: array of shape (n, 3, 3)
+    """
+    import numpy
+    eulers = numpy.asarray(eulers, dtype=float).reshape(-1, 3)
+    cx, cy, cz = numpy.cos(eulers).T
+    sx, sy, sz = numpy.sin(eulers).T
+    result = numpy.empty((len(eulers), 3, 3))
+    result[:, 0, 0] = cy*cz
+    result[:, 0, 1] = -cy*sz
+    result[:, 0, 2] = sy
+    result[:, 1, 0] = sx*sy*cz + cx*sz
+    result[:, 1, 1] = -sx*sy*sz + cx*cz
+    result[:, 1, 2] = -sx*cy
+    result[:, 2, 0] = -cx*sy*cz + sx*sz
+    result[:, 2, 1] = cx*sy*sz + sx*cz
+    result[:, 2, 2] = cx*cy
+    return result
+
+
+def relativeVectors(vectors, eulers):
+    """Rotate each of vectors into the local space of the matching rotation.
+    Equivalent to vector * (X * Y * Z) for each vector.
+
+    :param vectors: array of shape (n, 3)
+    :param eulers: array of shape (n, 3) of XYZ euler rotations
+    :returns: array of shape (n, 3)
+    """
+    import numpy
+    vectors = numpy.asarray(vectors, dtype=float).reshape(-1, 3)
+    return numpy.einsum("ni,nij->nj", vectors, rotationArrays(eulers))
+
+
 def getClosestPoint(a, b, point, segmentClamp=False, returnFactor=False):
     """
     :param a: a is a point on the line
@@ -92,16 +169,16 @@ def getClosestPoint(a, b, point, segmentClamp=False, returnFactor=False):
     :returns: the closest point on the line ab or a float if returnFactor
     """
     if not isinstance(a, Vector):
-        a = Vector(*a)
+        a = Vector(a)
     if not isinstance(b, Vector):
-        b = Vector(*b)
+        b = Vector(b)
     if not isinstance(point, Vector):
-        point = Vector(*point)
+        point = Vector(point)
     ap = point - a
     ab = b - a
 
-    ab2 = ab.length
-    ap_ab = ap*ab
+    ab2 = ab.dot(ab)
+    ap_ab = ap.dot(ab)
 
     t = ap_ab / ab2  # type: float
     if segmentClamp: